@@ -15,6 +15,9 @@ class agent_SEIRX(Agent):
         super().__init__(unique_id, model)
         self.verbose = verbosity
         self.ID = unique_id
+        # integer index of the agent's node in the contact network (see
+        # SEIRX.node_index)
+        self.index = model.node_index[unique_id]
         self.unit = unit
 
         ## epidemiological parameters drawn from distributions
@@ -67,6 +70,8 @@ class agent_SEIRX(Agent):
         self.days_since_tested = 0
         self.transmissions = 0
         self.transmission_targets = {}
+        # contacts of the agent, by agent group (see get_contacts())
+        self.contacts = {}
 
 
 
@@ -86,15 +91,22 @@ class agent_SEIRX(Agent):
 
     # generic helper functions that are inherited by other agent classes
     def get_contacts(self, agent_group):
-        contacts = [a for a in self.model.schedule.agents if
-            (a.type == agent_group and self.model.G.has_edge(self.ID, a.ID))]
-        return contacts
+        # the contact network does not change during a simulation, therefore
+        # the contacts of every agent group are only looked up once
+        if agent_group not in self.contacts:
+            self.contacts[agent_group] = self.model.get_neighbours(self.index,
+                agent_type=agent_group)
+        return self.contacts[agent_group]
 
 
     def introduce_external_infection(self):
         if (self.infectious == False) and (self.exposed == False) and\
            (self.recovered == False):
-            index_transmission = self.random.random()
+            if self.model.crn:
+                index_transmission = \
+                    self.model.get_external_infection_draw(self.index)
+            else:
+                index_transmission = self.random.random()
             if index_transmission <= self.index_probability:
                 self.contact_to_infected = True
                 if self.verbose > 0:
@@ -109,15 +121,20 @@ class agent_SEIRX(Agent):
 
                 # modify the transmission risk based on the contact type
                 modifier = base_modifier * \
-                           self.model.G.get_edge_data(self.ID, c.ID)['weight']
+                    self.model.contact_weights[self.index][c.index]
                 # modify the transmission risk based on the reception risk of 
                 # the receiving agent
                 modifier *= self.model.reception_risks[c.type]
 
                 modified_transmission_risk = 1 - transmission_risk * modifier
 
-                # draw random number for transmission
-                transmission = self.random.random()
+                # draw random number for transmission. In common random
+                # numbers mode, the draw is fixed for every day and contact
+                if self.model.crn:
+                    transmission = self.model.get_transmission_draw(
+                        self.index, c.index)
+                else:
+                    transmission = self.random.random()
 
                 #print(modified_transmission_risk)
 
@@ -132,7 +149,8 @@ class agent_SEIRX(Agent):
                         self.sample == 'positive':
                         self.model.pending_test_infections += 1
 
-                    self.transmission_targets.update({c.ID:self.model.Nstep})
+                    self.transmission_targets.update(
+                        {c.index:self.model.Nstep})
 
                     if self.verbose > 0:
                         print('transmission: {} {} -> {} {}'
@@ -237,7 +255,11 @@ class agent_SEIRX(Agent):
         # I.e. agents that will become symptomatic down the road might
         # already be more infectious before they show any symptoms than
         # agents that stay asymptomatic
-        if self.random.random() <= self.symptom_probability:
+        if self.model.crn:
+            symptom_draw = self.symptom_draw
+        else:
+            symptom_draw = self.random.random()
+        if symptom_draw <= self.symptom_probability:
             self.symptomatic_course = True
             if self.verbose > 0:
                 print('{} infectious: {} (symptomatic course)'.format(self.type, self.unique_id))
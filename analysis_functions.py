@@ -2,14 +2,16 @@ import numpy as np
 import pandas as pd
 import networkx as nx
 import os
+import gzip
 import json
 import pickle
+import hashlib
 from os.path import join
 
+from result_cache import to_builtin
+
 def get_agent(model, ID):
-    for a in model.schedule.agents:
-        if a.ID == ID:
-            return a
+    return model.get_agent(ID)
 
 def test_infection(a):
     if a.infectious or a.recovered or a.exposed:
@@ -30,13 +32,11 @@ def count_infection_endpoints(model):
     return len(endpoints)
 
 def count_typed_transmissions(model, source_type, target_type):
-    type_dict = {'t':'teacher', 's':'student', 'f':'family_member', \
-        'r':'resident', 'e':'employee'}
     sources = [a for a in model.schedule.agents if a.type == source_type]
     transmissions = 0
     for source in sources:
         for target, step in source.transmission_targets.items():
-            if type_dict[target[0]] == target_type:
+            if model.agents_by_index[target].type == target_type:
                 transmissions += 1
     return transmissions
 
@@ -67,7 +67,8 @@ def calculate_finite_size_R0(model):
         if a.transmissions > 0:
             for target in a.transmission_targets.keys():
                 df = df.append({'ID':a.ID, 'agent_type':a.type,
-                    't':a.transmission_targets[target], 'target':target},
+                    't':a.transmission_targets[target],
+                    'target':model.get_node_ID(target)},
                             ignore_index=True)
                 
     # find first transmission(s)
@@ -103,7 +104,7 @@ def get_transmission_network(model):
     for a in model.schedule.agents:
         if a.transmissions > 0:
             for target in a.transmission_targets.keys():
-                transmissions.append((a.ID, target))
+                transmissions.append((a.ID, model.get_node_ID(target)))
                 
     G = nx.Graph()
     G.add_edges_from(transmissions)
@@ -124,6 +125,17 @@ def get_statistics(df, col):
 def get_agent_states(model, tm_events):
     if type(tm_events) == type(None):
         return None
+    return add_transmission_hours(get_state_changes(model), tm_events)
+
+
+def get_state_changes(model):
+    '''
+    Returns the log of state changes of all agents of a run: a data frame with
+    the columns day, node_ID, infection_state and quarantine_state that
+    contains a row for every change of the infection or quarantine state of
+    an agent that is not susceptible. The log is part of the compact record of
+    a run (see get_run_record()).
+    '''
     # all agent states in all simulation steps. Agent states include the
     # "infection state" ["susceptible", "exposed", "infectious", "recovered"]
     # as well as the "quarantine state" [True, False]
@@ -147,7 +159,17 @@ def get_agent_states(model, tm_events):
     state_data = state_data.rename(columns={'AgentID':'node_ID',
                                             'Step':'day'})
     state_data = state_data.reset_index(drop=True)
+    return state_data[['day', 'node_ID', 'infection_state',
+                       'quarantine_state']]
 
+
+def add_transmission_hours(state_data, tm_events):
+    '''
+    Adds the hour of every state change to a log of state changes (see
+    get_state_changes()), given the transmission events of the run (see
+    get_transmission_chain()).
+    '''
+    state_data = state_data.copy()
     # for the visualization we need more fine-grained information (hours) on when 
     # exactly a transmission happened. This information is already stored in the
     # transmission events table (tm_events) and we can take it from there and
@@ -179,175 +201,247 @@ def get_agent_states(model, tm_events):
     return state_data
 
 
-def get_transmission_chain(model, schedule):
-    tm_events = pd.DataFrame()
-    location_types = {'student_student_same_class':'class',
-                      'student_student_other_class':'hallway',
-                      'student_teacher':'class',
-                      'teacher_teacher':'faculty_room',
-                      'student_family':'home',
-                      'family_family':'home'}
+def get_transmission_chain(model, schedule, rng=None):
+    # hours are drawn from a generator seeded with the seed of the run, such
+    # that the transmission chain of a run is reproducible
+    if rng == None:
+        rng = np.random.default_rng(model.params['seed'])
+    return get_transmission_chain_from_log(get_transmission_log(model),
+                                           model.G, schedule, rng)
+
 
+def get_transmission_log(model):
+    '''
+    Returns the log of all transmissions of a run: a data frame with the
+    columns day, source_ID and target_ID and one row per transmission. The
+    log is part of the compact record of a run (see get_run_record()).
+    '''
+    days, sources, targets = [], [], []
     for a in model.schedule.agents:
         if a.transmissions > 0:
             for target, day in a.transmission_targets.items():
-                location = ''
-                hour = np.nan
-                target = get_agent(model, target)
-                
-                ## determine transmission locations and times
-                # transmissions from students to other students, teachers or family
-                # members
-                if a.type == 'student':
-                    student_class = model.G.nodes(data=True)[a.ID]['unit']
-                    
-                    if target.type == 'student':
-                        target_class = model.G.nodes(data=True)[target.ID]['unit']
-                        
-                        # transmission between students in the same class
-                        if student_class == target_class:
-                            location = 'class_{}'.format(student_class)
-                            # pick an hour in which the students are in the same
-                            # room at random
-                            hour = np.random.choice([1, 2, 3, 4, 6, 7, 8, 9], 1)[0]
-                            
-                        # transmission between students in different classes:
-                        # transmission occurs in the hallway during lunch
-                        else:
-                            location = 'hallway'
-                            hour = 5
-                        
-                    # transmissions from students to teachers occur in the student's
-                    # classroom at a time when the teacher is in that classroom
-                    # according to the schedule
-                    elif target.type == 'teacher':
-                        location = 'class_{}'.format(student_class)
-                        hour = schedule.loc[target.ID, '{}'.format(student_class)]
-                    
-                    # transmissions to family members occur at home after schoole
-                    elif target.type == 'family_member':
-                        location = 'home'
-                        hour = 10
-                        
-                    else:
-                        print('agent type not supported')
-
-                # transmissions from teachers to other teachers or students
-                elif a.type == 'teacher':
-                    # transmissions from teachers to students occur in the student's
-                    # classroom at a time when the teacher is in that classroom
-                    # according to the schedule
-                    if target.type == 'student':
-                        student_class = model.G.nodes(data=True)[target.ID]['unit']
-                        location = 'class_{}'.format(student_class)
-                        hour = schedule.loc[a.ID, '{}'.format(student_class)]
-                        
-                    # transmissions between teachers occur during the lunch break
-                    # in the faculty room
-                    elif target.type == 'teacher':
-                        location = 'faculty_room'
-                        hour = 5
-                        
-                    elif target.type == 'family_member':
-                        print('this should not happen!')
-                        
-                    else:
-                        print('agent type not supported')
-
-                # transmissions from family members to other family members
-                elif a.type == 'family_member':
-                    if target.type == 'student':
-                        print('this should not happen!')
-                        
-                    elif target.type == 'teacher':
-                        print('this should not happen!')
-                        
-                    # transmissions between family members occur at home after school
-                    elif target.type == 'family_member':
-                        location = 'home'
-                        hour = 10
-                        
-                    else:
-                        print('agent type not supported')
-
-                else:
-                    print('agent type not supported')
-                
-                assert not np.isnan(hour), 'schedule messup!'
-                assert len(location) > 0, 'location messup!'
-                tm_events = tm_events.append({
-                    'day':day,
-                    'hour':hour,
-                    'location':location,
-                    'source_ID':a.ID,
-                    'source_type':a.type,
-                    'target_ID':target.ID,
-                    'target_type':target.type},
-                ignore_index=True)
-
-
-    if len(tm_events) > 0:            
-        tm_events['day'] = tm_events['day'].astype(int)
-        tm_events = tm_events.sort_values(by=['day', 'hour']).reset_index(drop=True)
-        return tm_events
-    else:
+                days.append(day)
+                sources.append(a.ID)
+                targets.append(model.get_node_ID(target))
+    return pd.DataFrame({'day':days, 'source_ID':sources, 'target_ID':targets})
+
+
+def get_schedule_matrix(schedule, teachers, classes):
+    '''
+    Looks up the hours in which the given teachers teach the given classes
+    (one hour per pair of teacher and class) in the schedule of a school, a
+    data frame with teacher IDs as index and class names as columns. Pairs
+    that are not in the schedule get the hour NaN.
+    '''
+    hours = np.full(len(teachers), np.nan)
+    if len(teachers) == 0:
+        return hours
+    # schedule matrix (teacher x class) with an extra row and column of NaN
+    # for teachers and classes that are not in the schedule
+    matrix = np.full((schedule.shape[0] + 1, schedule.shape[1] + 1), np.nan)
+    matrix[:-1, :-1] = schedule.to_numpy(dtype=float)
+    rows = schedule.index.get_indexer(teachers)
+    cols = schedule.columns.get_indexer([str(c) for c in classes])
+    return matrix[rows, cols]
+
+
+def get_transmission_chain_from_log(transmission_log, G, schedule, rng=None):
+    '''
+    Returns the transmission events (day, hour, location, source and target
+    of every transmission) of a run in a school, given the transmission log
+    of the run (see get_transmission_log()), the contact network of the school
+    and the schedule of the teachers. Returns None if there were no
+    transmissions.
+
+    rng: numpy random Generator that is used to draw the hours of
+    transmissions between students of the same class. Default = None (the
+    global numpy random state is used).
+    '''
+    if len(transmission_log) == 0:
         return None
+    if rng == None:
+        rng = np.random
+
+    node_types = pd.Series(dict(G.nodes(data='type')))
+    node_units = pd.Series(dict(G.nodes(data='unit')))
+    source_ID = transmission_log['source_ID'].to_numpy()
+    target_ID = transmission_log['target_ID'].to_numpy()
+    source_type = node_types.loc[source_ID].to_numpy()
+    target_type = node_types.loc[target_ID].to_numpy()
+    source_unit = node_units.loc[source_ID].to_numpy()
+    target_unit = node_units.loc[target_ID].to_numpy()
+
+    location = np.full(len(transmission_log), '', dtype=object)
+    hour = np.full(len(transmission_log), np.nan)
+
+    ## determine transmission locations and times
+    student_student = (source_type == 'student') & (target_type == 'student')
+    same_class = student_student & (source_unit == target_unit)
+    # transmission between students in the same class: pick an hour in which
+    # the students are in the same room at random
+    location[same_class] = ['class_{}'.format(u) for u in \
+                            source_unit[same_class]]
+    hour[same_class] = rng.choice([1, 2, 3, 4, 6, 7, 8, 9], same_class.sum())
+    # transmission between students in different classes: transmission occurs
+    # in the hallway during lunch
+    hallway = student_student & ~same_class
+    location[hallway] = 'hallway'
+    hour[hallway] = 5
+
+    # transmissions between students and teachers occur in the student's
+    # classroom at a time when the teacher is in that classroom according to
+    # the schedule
+    student_teacher = (source_type == 'student') & (target_type == 'teacher')
+    location[student_teacher] = ['class_{}'.format(u) for u in \
+                                 source_unit[student_teacher]]
+    hour[student_teacher] = get_schedule_matrix(schedule,
+        target_ID[student_teacher], source_unit[student_teacher])
+    teacher_student = (source_type == 'teacher') & (target_type == 'student')
+    location[teacher_student] = ['class_{}'.format(u) for u in \
+                                 target_unit[teacher_student]]
+    hour[teacher_student] = get_schedule_matrix(schedule,
+        source_ID[teacher_student], target_unit[teacher_student])
+
+    # transmissions between teachers occur during the lunch break in the
+    # faculty room
+    teacher_teacher = (source_type == 'teacher') & (target_type == 'teacher')
+    location[teacher_teacher] = 'faculty_room'
+    hour[teacher_teacher] = 5
+
+    # transmissions from students to family members and between family
+    # members occur at home after school
+    home = (target_type == 'family_member') & \
+        ((source_type == 'student') | (source_type == 'family_member'))
+    location[home] = 'home'
+    hour[home] = 10
+
+    # all other combinations (for example from family members to students or
+    # teachers) are not supported
+    assert (location != '').all(), 'location messup!'
+    assert not np.isnan(hour).any(), 'schedule messup!'
+
+    tm_events = pd.DataFrame({'day':transmission_log['day'].astype(int),
+                              'hour':hour,
+                              'location':location,
+                              'source_ID':source_ID,
+                              'source_type':source_type,
+                              'target_ID':target_ID,
+                              'target_type':target_type})
+    tm_events = tm_events.sort_values(by=['day', 'hour'], kind='stable')\
+        .reset_index(drop=True)
+    return tm_events
+
+def get_run_observables(model):
+    '''
+    Collects the agent-based observables of a finished run in a single pass
+    over all agents: the number of agents and of infected agents per agent
+    type, the number of transmissions, the number of infected agents without
+    onward transmissions, the typed transmission matrix (see
+    get_transmission_matrix()) and the finite size R0 (see
+    calculate_finite_size_R0()).
+    '''
+    N_agents = {agent_type:0 for agent_type in model.agent_types}
+    infected = {agent_type:0 for agent_type in model.agent_types}
+    transmission_matrix = {(source_type, target_type):0 for source_type in \
+        model.agent_types for target_type in model.agent_types}
+    transmissions = 0
+    infected_without_transmissions = 0
+    # time of the first transmission of every agent with transmissions, the
+    # number of its transmissions at that time and its total number of
+    # transmissions, to determine the finite size R0
+    first_transmissions = []
+
+    for a in model.schedule.agents:
+        N_agents[a.type] += 1
+        if a.exposed or a.infectious or a.recovered:
+            infected[a.type] += 1
+        if a.recovered and a.transmissions == 0:
+            infected_without_transmissions += 1
+        transmissions += a.transmissions
+
+        if len(a.transmission_targets) > 0:
+            for target in a.transmission_targets.keys():
+                transmission_matrix[(a.type, \
+                    model.agents_by_index[target].type)] += 1
+            t = min(a.transmission_targets.values())
+            first_transmissions.append((t,
+                list(a.transmission_targets.values()).count(t),
+                len(a.transmission_targets)))
+
+    # the finite size R0 is the mean number of transmissions of the agent(s)
+    # that caused the first transmission(s) of the outbreak, weighted by their
+    # number of transmissions at that time
+    R0 = 0
+    if len(first_transmissions) > 0:
+        t_min = min([t for t, _, _ in first_transmissions])
+        weights = [(N_first, N) for t, N_first, N in first_transmissions if \
+                   t == t_min]
+        R0 = sum([N_first * N for N_first, N in weights]) / \
+             sum([N_first for N_first, N in weights])
+
+    return {'N_agents':N_agents,
+            'infected':infected,
+            'transmissions':transmissions,
+            'infected_without_transmissions':infected_without_transmissions,
+            'transmission_matrix':transmission_matrix,
+            'R0':R0}
+
+
+def get_transmission_matrix(model):
+    '''
+    Returns the number of transmissions between all pairs of agent types as a
+    dictionary {(source type, target type):transmissions}.
+    '''
+    return get_run_observables(model)['transmission_matrix']
+
 
 def get_ensemble_observables_school(model, run):
-    R0, _ = calculate_finite_size_R0(model)
-    N_school_agents = len([a for a in model.schedule.agents if \
-        a.type == 'teacher' or a.type == 'student'])
-    N_family_members = len([a for a in model.schedule.agents if a.type == 'family_member'])
-    infected_students = count_infected(model, 'student')
-    infected_teachers = count_infected(model, 'teacher')
-    infected_family_members = count_infected(model, 'family_member')
-    infected_agents = infected_students + infected_teachers + infected_family_members
-    data = model.datacollector.get_model_vars_dataframe()
-    N_diagnostic_tests = data['N_diagnostic_tests'].max()
-    N_preventive_screening_tests = data['N_preventive_screening_tests'].max()
-    transmissions = sum([a.transmissions for a in model.schedule.agents])
-    infected_without_transmissions = count_infection_endpoints(model)
-    student_student_transmissions = count_typed_transmissions(model, 'student', 'student')
-    teacher_student_transmissions = count_typed_transmissions(model, 'teacher', 'student')
-    student_teacher_transmissions = count_typed_transmissions(model, 'student', 'teacher')
-    teacher_teacher_transmissions = count_typed_transmissions(model, 'teacher', 'teacher')
-    student_family_member_transmissions = count_typed_transmissions(model, 'student', 'family_member')
-    family_member_family_member_transmissions = count_typed_transmissions(model, 'family_member', 'family_member')
-    quarantine_days_student = model.quarantine_counters['student']
-    quarantine_days_teacher = model.quarantine_counters['teacher']
-    quarantine_days_family_member = model.quarantine_counters['family_member']
-    pending_test_infections = data['pending_test_infections'].max()
-    undetected_infections = data['undetected_infections'].max()
-    predetected_infections = data['predetected_infections'].max()
-    duration = len(data)
+    '''
+    Returns the observables of a single run of the school model. Agent-based
+    observables are collected in a single pass over all agents (see
+    get_run_observables()), counters are read from the model directly
+    instead of from the history of the DataCollector.
+    '''
+    observables = get_run_observables(model)
+    N_agents = observables['N_agents']
+    infected = observables['infected']
+    transmission_matrix = observables['transmission_matrix']
+
+    N_school_agents = N_agents['teacher'] + N_agents['student']
+    N_family_members = N_agents['family_member']
+    infected_agents = infected['student'] + infected['teacher'] + \
+                      infected['family_member']
+    N_diagnostic_tests = model.number_of_diagnostic_tests
+    N_preventive_screening_tests = model.number_of_preventive_screening_tests
+    duration = model.Nstep
     diagnostic_tests_per_day_per_agent = N_diagnostic_tests / duration / N_school_agents
     preventive_tests_per_day_per_agent = N_preventive_screening_tests / duration / N_school_agents
     tests_per_day_per_agent = (N_diagnostic_tests + N_preventive_screening_tests) / duration / N_school_agents
 
     row = {'run':run, 
-          'R0':R0,
+          'R0':observables['R0'],
           'N_school_agents':N_school_agents,
           'N_family_members':N_family_members,
-          'infected_students':infected_students,
-          'infected_teachers':infected_teachers,
-          'infected_family_members':infected_family_members,
+          'infected_students':infected['student'],
+          'infected_teachers':infected['teacher'],
+          'infected_family_members':infected['family_member'],
           'infected_agents':infected_agents,
           'N_diagnostic_tests':N_diagnostic_tests,
           'N_preventive_tests':N_preventive_screening_tests,
-          'transmissions':transmissions,
-          'infected_without_transmissions':infected_without_transmissions,
-          'student_student_transmissions':student_student_transmissions,
-          'teacher_student_transmissions':teacher_student_transmissions,
-          'student_teacher_transmissions':student_teacher_transmissions,
-          'teacher_teacher_transmissions':teacher_teacher_transmissions,
-          'student_family_member_transmissions':student_family_member_transmissions,
-          'family_member_family_member_transmissions':family_member_family_member_transmissions,
-          'quarantine_days_student':quarantine_days_student,
-          'quarantine_days_teacher':quarantine_days_teacher,
-          'quarantine_days_family_member':quarantine_days_family_member,
-          'pending_test_infections':pending_test_infections,
-          'undetected_infections':undetected_infections,
-          'predetected_infections':predetected_infections,
+          'transmissions':observables['transmissions'],
+          'infected_without_transmissions':observables['infected_without_transmissions'],
+          'student_student_transmissions':transmission_matrix[('student', 'student')],
+          'teacher_student_transmissions':transmission_matrix[('teacher', 'student')],
+          'student_teacher_transmissions':transmission_matrix[('student', 'teacher')],
+          'teacher_teacher_transmissions':transmission_matrix[('teacher', 'teacher')],
+          'student_family_member_transmissions':transmission_matrix[('student', 'family_member')],
+          'family_member_family_member_transmissions':transmission_matrix[('family_member', 'family_member')],
+          'quarantine_days_student':model.quarantine_counters['student'],
+          'quarantine_days_teacher':model.quarantine_counters['teacher'],
+          'quarantine_days_family_member':model.quarantine_counters['family_member'],
+          'pending_test_infections':model.pending_test_infections,
+          'undetected_infections':model.undetected_infections,
+          'predetected_infections':model.predetected_infections,
           'duration':duration,
           'diagnostic_tests_per_day_per_agent':diagnostic_tests_per_day_per_agent,
           'preventive_tests_per_day_per_agent':preventive_tests_per_day_per_agent,
@@ -355,6 +449,35 @@ def get_ensemble_observables_school(model, run):
 
     return row
 
+def get_ensemble_observables_nursing_home(model, run):
+    '''
+    Returns the observables of a single run of the nursing home model, with
+    the same observables as the ensemble statistics in
+    data/nursing_home/simulation_results_N10000.csv. The number of screens of
+    an agent group counts screens of all types (reactive, follow-up and
+    preventive).
+    '''
+    observables = get_run_observables(model)
+    infected = observables['infected']
+
+    row = {'run':run,
+          'R0':observables['R0'],
+          'infected_residents':infected['resident'],
+          'infected_employees':infected['employee'],
+          'N_resident_screens':sum([model.screen_counters[screen_type]\
+              ['resident'] for screen_type in model.screen_counters]),
+          'N_employee_screens':sum([model.screen_counters[screen_type]\
+              ['employee'] for screen_type in model.screen_counters]),
+          'N_diagnostic_tests':model.number_of_diagnostic_tests,
+          'N_preventive_tests':model.number_of_preventive_screening_tests,
+          'transmissions':observables['transmissions'],
+          'pending_test_infections':model.pending_test_infections,
+          'undetected_infections':model.undetected_infections,
+          'predetected_infections':model.predetected_infections,
+          'duration':model.Nstep}
+
+    return row
+
 def get_representative_run(N_infected, path):
     filenames = os.listdir(path)
     medians = {int(f.split('_')[1]):int(f.split('_')[3].split('.')[0]) \
@@ -365,16 +488,150 @@ def get_representative_run(N_infected, path):
     for run, median in medians.items():
         if np.abs(N_infected - median) < dist:
             closest_run = run
+            dist = np.abs(N_infected - median)
             
     return pickle.load(open(join(path, \
-                       'run_{}_N_{}.p'.format(run, medians[run])), 'rb'))
+        'run_{}_N_{}.p'.format(closest_run, medians[closest_run])), 'rb'))
+
+
+def get_run_record(model, run):
+    '''
+    Returns a compact record of a finished run that contains everything that
+    is needed to export the run (see get_record_events()), instead of the full
+    model: {'run':run, 'transmissions':transmission log (see
+    get_transmission_log()), 'states':log of state changes (see
+    get_state_changes())}. Records of candidate runs of an ensemble are kept by
+    ensemble_statistics.RunReservoir.
+    '''
+    return {'run':run,
+            'transmissions':get_transmission_log(model),
+            'states':get_state_changes(model)}
+
+
+def get_record_events(record, G, schedule, rng=None):
+    '''
+    Returns the transmission events and agent states of a recorded run (see
+    get_run_record()) in a school, in the same format as
+    get_transmission_chain() and get_agent_states(). Both are None if there
+    were no transmissions. Hours are drawn from rng (default: a generator
+    seeded with the seed of the run).
+    '''
+    if rng == None:
+        rng = np.random.default_rng(record['run'])
+    tm_events = get_transmission_chain_from_log(record['transmissions'], G,
+                                                schedule, rng)
+    if type(tm_events) == type(None):
+        return None, None
+    return tm_events, add_transmission_hours(record['states'], tm_events)
+
+def to_columns(df):
+    '''
+    Converts a data frame into a compact, JSON serializable column format:
+    {'length':number of rows, 'columns':[column names], 'data':{column:
+    values}}. Columns with string values are dictionary encoded as
+    {'categories':[unique values], 'codes':[index of the value of every
+    row]}, all other columns are stored as plain lists. Missing values are
+    stored as None. The index is not stored.
+    '''
+    data = {}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object and all([isinstance(v, str) for v in \
+                                           values.dropna()]):
+            codes, categories = pd.factorize(values)
+            data[col] = {'categories':categories.tolist(),
+                         'codes':codes.tolist()}
+        else:
+            data[col] = [None if isinstance(v, float) and np.isnan(v) else v \
+                         for v in values.tolist()]
+    return {'length':len(df), 'columns':list(df.columns), 'data':data}
+
+
+def from_columns(columns):
+    '''
+    Converts data in the column format written by to_columns() back into a
+    data frame.
+    '''
+    data = {}
+    for col in columns['columns']:
+        values = columns['data'][col]
+        if isinstance(values, dict):
+            categories = values['categories']
+            values = [categories[c] if c >= 0 else None for c in \
+                      values['codes']]
+        data[col] = values
+    return pd.DataFrame(data, columns=columns['columns'])
+
+
+def write_JSON_file(filename, data, compress=False):
+    if compress:
+        with gzip.open(filename, 'wt', encoding='utf-8') as outfile:
+            json.dump(data, outfile, default=to_builtin)
+    else:
+        with open(filename, 'w') as outfile:
+            json.dump(data, outfile, default=to_builtin)
+
+
+def read_JSON_file(filename):
+    if filename.endswith('.gz'):
+        with gzip.open(filename, 'rt', encoding='utf-8') as infile:
+            return json.load(infile)
+    with open(filename, 'r') as infile:
+        return json.load(infile)
+
+
+def write_static_artifact(artifact_path, data, compress=False):
+    '''
+    Writes static data (for example the node list or schedule of a school)
+    to a content-addressed file in artifact_path, named after the sha256 hash
+    of its content. Identical data is only written once. Returns the file
+    name of the artifact.
+    '''
+    os.makedirs(artifact_path, exist_ok=True)
+    content = json.dumps(data, sort_keys=True, default=to_builtin)
+    name = hashlib.sha256(content.encode('utf-8')).hexdigest() + '.json'
+    if compress:
+        name += '.gz'
+    filename = join(artifact_path, name)
+    if not os.path.exists(filename):
+        # write to a temporary file first, such that concurrent writers of
+        # the same artifact never leave a partially written file behind
+        tmp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+        write_JSON_file(tmp_filename, data, compress)
+        os.replace(tmp_filename, filename)
+    return name
+
+
+def get_network_columns(G):
+    '''
+    Returns the edges of a contact network in the column format of
+    to_columns(), with the columns source, target, contact_type and
+    link_type.
+    '''
+    edges = pd.DataFrame([(u, v, data.get('contact_type'),
+                           data.get('link_type')) for u, v, data in \
+                          G.edges(data=True)],
+                         columns=['source', 'target', 'contact_type',
+                                  'link_type'])
+    return to_columns(edges)
+
 
 def dump_JSON(path, school,
               test_type, index_case, screen_frequency_student, 
               screen_frequency_teacher, mask, half_classes,
               node_list, schedule, rep_transmission_events,
-              state_data):
-
+              state_data, G=None, artifact_path=None, compress=False):
+    '''
+    Writes the representative run of a prevention strategy in a school to a
+    JSON file in path. The static data of the school (node list, schedule and
+    optionally the contact network G) is identical for all prevention
+    strategies. It is written only once per school to content-addressed files
+    in artifact_path (default: the folder "static" in path) and the strategy
+    file references these files by their path relative to path. The
+    transmission events and agent states are stored in the column format of
+    to_columns(). If compress = True, all files are gzip compressed and get
+    the suffix ".gz". See load_JSON() to read the files.
+    '''
     school_type = school['type']
     classes = school['classes']
     students = school['students']
@@ -384,24 +641,26 @@ def dump_JSON(path, school,
     turnovers = {'same':0, 'one':1, 'two':2, 'three':3}
     turnover = turnovers[turnover]
     bool_dict = {True:'T', False:'F'}
-    
-    node_list = json.loads(node_list.to_json(orient='split'))
-    del node_list['index']
-    schedule = json.loads(schedule.to_json(orient='split'))
-    del schedule['index']
+
+    if artifact_path == None:
+        artifact_path = join(path, 'static')
+    static = {'node_list':to_columns(node_list),
+              'schedule':to_columns(schedule)}
+    if G != None:
+        static['network'] = get_network_columns(G)
+    artifacts = {}
+    for name, data in static.items():
+        artifact = write_static_artifact(artifact_path, data, compress)
+        artifacts[name] = os.path.relpath(join(artifact_path, artifact), path)
 
     # can be empty, if there are no transmission events in the simulation
-    try:
-        rep_transmission_events = json.loads(rep_transmission_events\
-            .to_json(orient='split'))
-        del rep_transmission_events['index']
-        state_data = json.loads(state_data.to_json(orient='split'))
-        del state_data['index']
-    except AttributeError:
-        pass
+    if isinstance(rep_transmission_events, pd.DataFrame):
+        rep_transmission_events = to_columns(rep_transmission_events)
+    if isinstance(state_data, pd.DataFrame):
+        state_data = to_columns(state_data)
 
-    
-    data = {'school_type':school_type,
+    data = {'format_version':2,
+            'school_type':school_type,
             'classes':classes,
             'students':students,
             'floors':floors,
@@ -412,16 +671,46 @@ def dump_JSON(path, school,
             'screen_frequency_student':screen_frequency_student,
             'mask':mask,
             'half_classes':half_classes,
-            'node_list':node_list,
-            'schedule':schedule,
+            'artifacts':artifacts,
             'rep_trans_events':rep_transmission_events,
             'agent_states':state_data}
-    
-    with open(join(path, 'test-{}_'.format(ttype) + \
+
+    filename = join(path, 'test-{}_'.format(ttype) + \
                    'turnover-{}_index-{}_tf-{}_'
                    .format(turnover, index_case[0], screen_frequency_teacher) +\
                    'sf-{}_mask-{}_half-{}.txt'\
                    .format(screen_frequency_student, bool_dict[mask],\
-                    bool_dict[half_classes])),'w')\
-                   as outfile:
-        json.dump(data, outfile)
+                    bool_dict[half_classes]))
+    if compress:
+        filename += '.gz'
+    write_JSON_file(filename, data, compress)
+
+
+def load_JSON(filename, load_static=True):
+    '''
+    Reads a prevention strategy file written by dump_JSON() and returns its
+    content with the transmission events, agent states and (if load_static
+    = True) the static node list, schedule and network as data frames. Files
+    in the old format, with embedded node lists and schedules in the "split"
+    format of pandas, can be read as well.
+    '''
+    data = read_JSON_file(filename)
+
+    if data.get('format_version', 1) == 1:
+        for key in ['node_list', 'schedule', 'rep_trans_events',
+                    'agent_states']:
+            if isinstance(data.get(key), dict):
+                data[key] = pd.DataFrame(data[key]['data'],
+                                         columns=data[key]['columns'])
+        return data
+
+    for key in ['rep_trans_events', 'agent_states']:
+        if isinstance(data[key], dict):
+            data[key] = from_columns(data[key])
+
+    if load_static:
+        path = os.path.dirname(filename)
+        for name, artifact in data['artifacts'].items():
+            data[name] = from_columns(read_JSON_file(join(path, artifact)))
+
+    return data
@@ -0,0 +1,518 @@
+import os
+import sys
+import copy
+import json
+import time
+import pickle
+import platform
+import argparse
+import subprocess
+from datetime import datetime
+from os.path import join, dirname, abspath
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+# make the repository modules importable if the benchmark is started from the
+# command line in an arbitrary working directory
+REPOSITORY_PATH = dirname(abspath(__file__))
+for path in [join(REPOSITORY_PATH, 'nursing_home'),
+             join(REPOSITORY_PATH, 'school'), REPOSITORY_PATH]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import analysis_functions as af
+import build_school_library as bsl
+import construct_school_network as csn
+from model_school import SEIRX_school
+from model_nursing_home import SEIRX_nursing_home
+from ensemble_runner import Scenario, run_model, run_replicates
+from result_cache import get_code_version, to_builtin
+
+# version of the format of the benchmark results
+FORMAT_VERSION = 1
+
+# all runs of the benchmark use the seeds FIRST_SEED, FIRST_SEED + 1, ...
+FIRST_SEED = 0
+
+SCHOOL_PATH = join(REPOSITORY_PATH, 'data', 'school')
+NURSING_HOME_PATH = join(REPOSITORY_PATH, 'data', 'nursing_home')
+NURSING_HOME_GRAPHS = ['interactions_single_quarter',
+                       'interactions_2_quarters',
+                       'interactions_3_quarters',
+                       'interactions_4_quarters']
+
+# synthetic schools (array based generator, see
+# build_school_library.generate_school())
+SYNTHETIC_SCHOOL_TYPE = 'primary'
+SYNTHETIC_CLASS_NUMBERS = [4, 10, 20, 50, 100]
+SYNTHETIC_CLASS_SIZE = 20
+SYNTHETIC_FLOORS = 2
+
+# testing regimes: no testing at all, and daily preventive screening of all
+# agent groups that are screened (teachers and students, employees and
+# residents) with same day antigen tests
+REGIMES = ['no_testing', 'daily_screening']
+
+# parameters of the scenarios, as in the screening frequency studies of the
+# school and nursing home scenarios
+SCHOOL_PARAMS = {'verbosity':0,
+                 'index_case':'teacher',
+                 'diagnostic_test_type':'two_day_PCR',
+                 'preventive_screening_test_type':'same_day_antigen',
+                 'agent_types':{
+                    agent_type:{'screening_interval':None,
+                                'index_probability':0,
+                                'transmission_risk':0.01,
+                                'reception_risk':1,
+                                'mask':False} for agent_type in \
+                    ['student', 'teacher', 'family_member']}}
+SCHOOL_SCREENED = ['student', 'teacher']
+SCHOOL_STEPS = 500
+
+NURSING_HOME_PARAMS = {'verbosity':0,
+                       'index_case':'employee',
+                       'diagnostic_test_type':'one_day_PCR',
+                       'preventive_screening_test_type':'same_day_antigen',
+                       'agent_types':{
+                          agent_type:{'screening_interval':None,
+                                      'index_probability':0,
+                                      'transmission_risk':0.0275,
+                                      'reception_risk':1} for agent_type in \
+                          ['employee', 'resident']}}
+NURSING_HOME_SCREENED = ['employee', 'resident']
+NURSING_HOME_STEPS = 300
+
+# phases of SEIRX.step() and the methods that implement them. Time spent in
+# step() outside of these methods (for example agents acting on their test
+# results) is reported as the phase 'other'
+STEP_PHASES = {'symptomatic_testing':'test_symptomatic_agents',
+               'test_results':'collect_test_results',
+               'contact_tracing':'quarantine_contacts',
+               'screening':'screen_agents'}
+
+
+class BenchmarkCase():
+    '''
+    A single benchmark case: a model class together with a contact network,
+    the constructor parameters of the model and the maximum number of steps
+    of a run. School cases also have the schedule of the school, which is
+    needed to reconstruct the transmission chain of a run.
+    '''
+
+    def __init__(self, name, model_class, G, model_params, N_steps,
+        observables, schedule=None):
+        self.name = name
+        self.model_class = model_class
+        self.G = G
+        self.model_params = copy.deepcopy(model_params)
+        self.N_steps = N_steps
+        self.observables = observables
+        self.schedule = schedule
+
+    def create_model(self, seed):
+        return self.model_class(self.G, seed=seed, **self.model_params)
+
+    def get_scenario(self):
+        return Scenario(self.model_class, self.G, self.model_params,
+                        self.observables, N_steps=self.N_steps)
+
+
+def get_regime_params(params, screened, regime):
+    '''
+    Returns a copy of the model parameters params for the testing regime
+    ('no_testing' or 'daily_screening'), where screened are the agent groups
+    that are screened daily.
+    '''
+    params = copy.deepcopy(params)
+    if regime == 'no_testing':
+        params['testing'] = False
+    elif regime == 'daily_screening':
+        params['testing'] = 'preventive'
+        for agent_type in screened:
+            params['agent_types'][agent_type]['screening_interval'] = 1
+    else:
+        raise ValueError('unknown testing regime {}'.format(regime))
+    return params
+
+
+def get_synthetic_school(N_classes, class_size=SYNTHETIC_CLASS_SIZE,
+    N_floors=SYNTHETIC_FLOORS, school_type=SYNTHETIC_SCHOOL_TYPE):
+    '''
+    Generates the contact network and schedule of a synthetic school with the
+    parameters of the school library (see build_school_library.py). Small
+    schools have fewer teachers than the library's number of contacts between
+    teachers, for them the number of far contacts between teachers is reduced
+    to the number of other teachers.
+    '''
+    school_name = bsl.get_school_name(school_type, N_classes, class_size,
+                                      N_floors)
+    N_teachers = csn.get_N_teachers(school_type, N_classes)
+    N_intermediate = bsl.NETWORK_PARAMS['N_teacher_contacts_intermediate']
+    N_far = min(bsl.NETWORK_PARAMS['N_teacher_contacts_far'],
+                N_teachers - N_intermediate - 1)
+    params = dict(bsl.NETWORK_PARAMS, school_type=school_type,
+        N_classes=N_classes, class_size=class_size, N_floors=N_floors,
+        family_sizes=bsl.FAMILY_SIZES, N_teacher_contacts_far=N_far,
+        seed=bsl.get_school_seed(FIRST_SEED, school_name))
+    G, schedule, node_list = bsl.generate_school(params)
+    return school_name, G, schedule
+
+
+def load_nursing_home_graph(graph_name):
+    '''
+    Loads a nursing home interaction network. The networks of nursing homes
+    with several quarters contain a few edges between residents of different
+    quarters that still carry the legacy attribute 'area' = 'facility'
+    instead of a contact type. These contacts are facility-wide contacts and
+    get the contact type 'far'.
+    '''
+    with open(join(NURSING_HOME_PATH, '{}.gpickle'.format(graph_name)),
+              'rb') as f:
+        G = pickle.load(f)
+    for u, v, data in G.edges(data=True):
+        if 'contact_type' not in data and data.get('area') == 'facility':
+            data['contact_type'] = 'far'
+            del data['area']
+    return G
+
+
+def get_cases(regimes=REGIMES, class_numbers=SYNTHETIC_CLASS_NUMBERS,
+    nursing_homes=NURSING_HOME_GRAPHS, names=None):
+    '''
+    Returns the list of benchmark cases: the test school
+    (data/school/test_volksschule.gpickle), the synthetic schools with the
+    given numbers of classes and the nursing home interaction networks, each
+    of them in every testing regime. If names is given, only cases whose name
+    contains one of the names are returned.
+    '''
+    # the schedule of the test school is stored without the teacher IDs, its
+    # rows are the teachers t1, t2, ... in order
+    schedule = pd.read_csv(join(SCHOOL_PATH, 'test_volksschule_schedule.csv'))
+    schedule.index = pd.Index(['t{}'.format(i + 1) for i in \
+                               range(len(schedule))], name='teacher')
+    with open(join(SCHOOL_PATH, 'test_volksschule.gpickle'), 'rb') as f:
+        schools = [('test_volksschule', pickle.load(f), schedule)]
+    for N_classes in class_numbers:
+        schools.append(get_synthetic_school(N_classes))
+
+    cases = []
+    for regime in regimes:
+        for school_name, G, schedule in schools:
+            cases.append(BenchmarkCase('school/{}/{}'.format(school_name,
+                regime), SEIRX_school, G, get_regime_params(SCHOOL_PARAMS,
+                SCHOOL_SCREENED, regime), SCHOOL_STEPS,
+                af.get_ensemble_observables_school, schedule))
+        for graph_name in nursing_homes:
+            G = load_nursing_home_graph(graph_name)
+            cases.append(BenchmarkCase('nursing_home/{}/{}'.format(\
+                graph_name, regime), SEIRX_nursing_home, G,
+                get_regime_params(NURSING_HOME_PARAMS,
+                NURSING_HOME_SCREENED, regime), NURSING_HOME_STEPS,
+                af.get_ensemble_observables_nursing_home))
+
+    if names != None:
+        cases = [c for c in cases if any([n in c.name for n in names])]
+    return cases
+
+
+def get_timing_statistics(times):
+    times = np.asarray(times, dtype=float)
+    return {'N':len(times), 'mean':times.mean(), 'median':np.median(times),
+            'min':times.min(), 'max':times.max()}
+
+
+def time_function(function, repeats):
+    '''
+    Calls function repeats times and returns the timing statistics (in
+    seconds) together with the return value of the last call.
+    '''
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return get_timing_statistics(times), result
+
+
+def add_phase_timer(timers, phase, owner, method):
+    # the method is replaced by a timed version on the instance only, such
+    # that the model classes are not modified
+    function = getattr(owner, method)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timers[phase] += time.perf_counter() - start
+    setattr(owner, method, timed)
+
+
+def time_step_phases(case, seed):
+    '''
+    Runs the model of a case once and returns the time spent in the phases of
+    SEIRX.step() (see STEP_PHASES), in data collection, in the interaction of
+    agents (schedule.step()) and in the rest of step(), summed over all steps
+    of the run and per step.
+    '''
+    model = case.create_model(seed)
+    timers = {phase:0.0 for phase in list(STEP_PHASES.keys()) + \
+              ['data_collection', 'agent_interaction']}
+    for phase, method in STEP_PHASES.items():
+        add_phase_timer(timers, phase, model, method)
+    add_phase_timer(timers, 'data_collection', model.datacollector, 'collect')
+    add_phase_timer(timers, 'agent_interaction', model.schedule, 'step')
+
+    total = 0.0
+    N_steps = 0
+    for i in range(case.N_steps):
+        start = time.perf_counter()
+        model.step()
+        total += time.perf_counter() - start
+        N_steps += 1
+        if len([a for a in model.schedule.agents if \
+            (a.exposed == True or a.infectious == True)]) == 0:
+            break
+
+    timers['other'] = max(total - sum(timers.values()), 0.0)
+    return {'N_steps':N_steps,
+            'total':total,
+            'phases':{phase:{'total':t, 'per_step':t / N_steps} for \
+                      phase, t in timers.items()}}
+
+
+def time_runs(case, runs):
+    '''
+    Runs the model of a case to completion once for every seed and returns
+    the timing statistics of the runs (without model construction) and of
+    the number of steps of the runs.
+    '''
+    times = []
+    steps = []
+    for seed in range(FIRST_SEED, FIRST_SEED + runs):
+        model = case.create_model(seed)
+        start = time.perf_counter()
+        run_model(model, case.N_steps)
+        times.append(time.perf_counter() - start)
+        steps.append(model.Nstep)
+    statistics = get_timing_statistics(times)
+    statistics['mean_steps'] = float(np.mean(steps))
+    return statistics
+
+
+def time_ensemble(case, runs):
+    '''
+    Runs an ensemble of runs of a case (model construction, run and
+    observables, see ensemble_runner.run_replicates()) and returns the
+    throughput in runs per second.
+    '''
+    scenario = case.get_scenario()
+    start = time.perf_counter()
+    run_replicates(scenario, FIRST_SEED, FIRST_SEED + runs)
+    duration = time.perf_counter() - start
+    return {'N_runs':runs, 'time':duration, 'runs_per_second':runs / duration}
+
+
+def time_post_processing(case, repeats):
+    '''
+    Times the post-processing of a single completed run: the observables of
+    the ensemble statistics and, for schools, the transmission chain and the
+    agent states.
+    '''
+    model = case.create_model(FIRST_SEED)
+    run_model(model, case.N_steps)
+    timings = {}
+    timings[case.observables.__name__], row = time_function(
+        lambda: case.observables(model, FIRST_SEED), repeats)
+    if type(case.schedule) != type(None):
+        timings['get_transmission_chain'], tm_events = time_function(
+            lambda: af.get_transmission_chain(model, case.schedule), repeats)
+        timings['get_agent_states'], states = time_function(
+            lambda: af.get_agent_states(model, tm_events), repeats)
+    return {'infected_agents':sum([af.test_infection(a) for a in \
+                                   model.schedule.agents]),
+            'functions':timings}
+
+
+def time_copies(case, repeats):
+    '''
+    Times pickling, unpickling and deep copying of a model that has run for a
+    few steps, and checks that the copies continue the run exactly like the
+    original model.
+    '''
+    model = case.create_model(FIRST_SEED)
+    for i in range(5):
+        model.step()
+    dump, data = time_function(lambda: pickle.dumps(model), repeats)
+    load, unpickled = time_function(lambda: pickle.loads(data), repeats)
+    deepcopy, copied = time_function(lambda: copy.deepcopy(model), repeats)
+
+    # the copies share the global numpy random state with the original
+    rows = []
+    for m in [model, unpickled, copied]:
+        np_random_state = np.random.get_state()
+        run_model(m, case.N_steps)
+        rows.append(json.dumps(case.observables(m, FIRST_SEED),
+                               default=to_builtin))
+        np.random.set_state(np_random_state)
+    assert rows[0] == rows[1] == rows[2], \
+        '{}: copies of the model do not continue the run'.format(case.name)
+    return {'size':len(data), 'dump':dump, 'load':load, 'deepcopy':deepcopy}
+
+
+def run_case(case, runs=10, repeats=5):
+    '''
+    Runs all benchmarks of a single case and returns the results.
+    '''
+    result = {'name':case.name,
+              'model_class':case.model_class.__name__,
+              'N_nodes':case.G.number_of_nodes(),
+              'N_edges':case.G.number_of_edges(),
+              'model_params':case.model_params,
+              'N_steps':case.N_steps}
+    # the first construction of a model from a graph includes the one-time
+    # preparation of the graph, later constructions reuse it
+    result['first_construction'], model = time_function(
+        lambda: case.create_model(FIRST_SEED), 1)
+    result['construction'], model = time_function(
+        lambda: case.create_model(FIRST_SEED), repeats)
+    result['step_phases'] = time_step_phases(case, FIRST_SEED)
+    result['runs'] = time_runs(case, runs)
+    result['ensemble'] = time_ensemble(case, runs)
+    result['post_processing'] = time_post_processing(case, repeats)
+    result['copies'] = time_copies(case, repeats)
+    return result
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=REPOSITORY_PATH, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_environment():
+    import mesa
+    return {'python':platform.python_version(),
+            'numpy':np.__version__,
+            'pandas':pd.__version__,
+            'networkx':nx.__version__,
+            'mesa':mesa.__version__,
+            'platform':platform.platform(),
+            'processor':platform.processor(),
+            'N_cpus':os.cpu_count()}
+
+
+def run_benchmarks(cases, runs=10, repeats=5, verbose=False):
+    '''
+    Runs the benchmarks of all cases and returns the results: the
+    environment (versions of python and the packages, the platform), the git
+    commit and the version of the simulation code (see
+    result_cache.get_code_version()), the settings of the benchmark and the
+    results of every case (see run_case()). All times are in seconds.
+    '''
+    results = {'format':'benchmark',
+               'version':FORMAT_VERSION,
+               'created':datetime.now().isoformat(timespec='seconds'),
+               'git_commit':get_git_commit(),
+               'code_version':get_code_version(),
+               'environment':get_environment(),
+               'settings':{'runs':runs, 'repeats':repeats,
+                           'first_seed':FIRST_SEED},
+               'cases':[]}
+    for j, case in enumerate(cases):
+        if verbose:
+            print('case {} / {}: {}'.format(j + 1, len(cases), case.name))
+        results['cases'].append(run_case(case, runs, repeats))
+    return results
+
+
+def save_results(path, results):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=1, default=to_builtin)
+
+
+def load_results(path):
+    with open(path, 'r') as results_file:
+        results = json.load(results_file)
+    assert results.get('format') == 'benchmark', \
+        '{} is not a benchmark result'.format(path)
+    assert results['version'] == FORMAT_VERSION, \
+        'unsupported benchmark format version {}'.format(results['version'])
+    return results
+
+
+def get_summary(case):
+    '''
+    Returns the headline numbers of the results of a case: mean construction
+    time, mean time per step, mean time per run, ensemble throughput and the
+    time of the post-processing functions.
+    '''
+    summary = {'construction':case['construction']['mean'],
+               'step':case['step_phases']['total'] / \
+                      case['step_phases']['N_steps'],
+               'run':case['runs']['mean'],
+               'runs_per_second':case['ensemble']['runs_per_second']}
+    for function, timing in case['post_processing']['functions'].items():
+        summary[function] = timing['mean']
+    return summary
+
+
+def compare_results(baseline, results):
+    '''
+    Compares two benchmark results and returns a data frame with the headline
+    numbers (see get_summary()) of all cases that are in both results, and
+    the ratio of the new to the baseline number.
+    '''
+    baseline_cases = {case['name']:case for case in baseline['cases']}
+    rows = []
+    for case in results['cases']:
+        if case['name'] not in baseline_cases:
+            continue
+        old = get_summary(baseline_cases[case['name']])
+        new = get_summary(case)
+        for metric in new.keys():
+            if metric in old:
+                rows.append({'case':case['name'], 'metric':metric,
+                             'baseline':old[metric], 'new':new[metric],
+                             'ratio':new[metric] / old[metric]})
+    return pd.DataFrame(rows, columns=['case', 'metric', 'baseline', 'new',
+                                       'ratio'])
+
+
+if __name__ == '__main__':
+    # command line interface, e.g.
+    # python benchmark.py benchmark_results.json --runs 20
+    # python benchmark.py benchmark_new.json --compare benchmark_old.json
+    parser = argparse.ArgumentParser(description='benchmark the SEIRX '+\
+        'models on the school and nursing home scenarios')
+    parser.add_argument('path', help='JSON file the results are written to')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='number of runs per case')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='number of repetitions of single measurements')
+    parser.add_argument('--classes', type=int, nargs='*',
+                        default=SYNTHETIC_CLASS_NUMBERS,
+                        help='numbers of classes of the synthetic schools')
+    parser.add_argument('--regimes', nargs='*', default=REGIMES,
+                        help='testing regimes')
+    parser.add_argument('--cases', nargs='*', default=None,
+                        help='only run cases whose name contains one of '+\
+                        'these names')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file with baseline results to compare to')
+    args = parser.parse_args()
+
+    cases = get_cases(args.regimes, args.classes, names=args.cases)
+    results = run_benchmarks(cases, args.runs, args.repeats, verbose=True)
+    save_results(args.path, results)
+    print('results of {} cases written to {}'.format(len(cases), args.path))
+
+    if args.compare != None:
+        comparison = compare_results(load_results(args.compare), results)
+        with pd.option_context('display.max_rows', None,
+                               'display.max_columns', None,
+                               'display.width', 120):
+            print(comparison)
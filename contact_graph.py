@@ -0,0 +1,547 @@
+import os
+import copy
+import json
+import pickle
+import shutil
+import weakref
+import argparse
+import threading
+from types import MappingProxyType
+from os.path import join
+
+import numpy as np
+import networkx as nx
+
+from result_cache import to_builtin
+
+# version of the on-disk format. Files written with a different major version
+# cannot be read
+FORMAT_VERSION = 1
+
+
+class ContactGraph():
+    '''
+    Compact, immutable representation of an undirected contact network with
+    node and edge attributes, stored in compressed sparse row (CSR) form: the
+    neighbours of the node with index i are indices[indptr[i]:indptr[i + 1]],
+    every edge appears once for each of its two nodes. Node IDs are kept in
+    the order of the nodes of the original networkx graph, the neighbours of
+    every node in the order of its adjacency in the original graph, such that
+    converting back to networkx (see to_networkx()) restores the graph
+    including the iteration order of nodes and edges.
+
+    Attributes are stored as one array per attribute. String attributes (for
+    example 'type', 'unit' or 'contact_type') are dictionary encoded as
+    integer codes into a list of categories, numeric attributes (for example
+    'age' or 'floor') are stored as floats. Missing attributes are stored as
+    the code -1 or NaN. Node attributes have one value per node, edge
+    attributes one value per entry of the CSR structure. Graph attributes
+    (G.graph, for example the map of families to students of school networks)
+    are kept as they are and have to be JSON serializable.
+
+    On disk, a contact graph is a directory with a small JSON header
+    (header.json: format version, node IDs, attribute categories and types)
+    and one .npy file per array, which are memory mapped when the graph is
+    loaded (see load()).
+    '''
+
+    def __init__(self, node_IDs, indptr, indices, node_attributes={},
+        edge_attributes={}, graph_attributes={}):
+        self.node_IDs = list(node_IDs)
+        self.indptr = indptr
+        self.indices = indices
+        # {attribute:{'values':array, 'kind':'categorical' or 'numeric',
+        # 'categories':[category, ...] or None, 'dtype':'int', 'float', 'bool'
+        # or 'str'}}
+        self.node_attributes = dict(node_attributes)
+        self.edge_attributes = dict(edge_attributes)
+        self.graph_attributes = dict(graph_attributes)
+        self._node_index = None
+        self._networkx = None
+
+    def number_of_nodes(self):
+        return len(self.node_IDs)
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def get_node_index(self):
+        '''
+        Returns the dictionary {node ID:node index}.
+        '''
+        if self._node_index == None:
+            self._node_index = {ID:i for i, ID in enumerate(self.node_IDs)}
+        return self._node_index
+
+    def neighbours(self, ID):
+        i = self.get_node_index()[ID]
+        return [self.node_IDs[j] for j in \
+                self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    def get_node_attribute(self, attribute):
+        '''
+        Returns the values of a node attribute for all nodes, decoded into a
+        list (None for nodes without the attribute).
+        '''
+        return decode_attribute(self.node_attributes[attribute])
+
+    @classmethod
+    def from_networkx(cls, G):
+        '''
+        Creates a contact graph from an undirected networkx graph.
+        '''
+        assert not G.is_directed(), 'only undirected graphs are supported'
+        node_IDs = list(G.nodes())
+        node_index = {ID:i for i, ID in enumerate(node_IDs)}
+
+        indptr = np.zeros(len(node_IDs) + 1, dtype=np.int64)
+        indices = []
+        edge_data = []
+        for i, ID in enumerate(node_IDs):
+            for neighbour, data in G.adj[ID].items():
+                indices.append(node_index[neighbour])
+                edge_data.append(data)
+            indptr[i + 1] = len(indices)
+        indices = np.asarray(indices, dtype=np.int64)
+
+        node_data = [data for ID, data in G.nodes(data=True)]
+        node_attributes = {attribute:encode_attribute(attribute,
+            [data.get(attribute) for data in node_data]) for attribute in \
+            get_attribute_names(node_data)}
+        edge_attributes = {attribute:encode_attribute(attribute,
+            [data.get(attribute) for data in edge_data]) for attribute in \
+            get_attribute_names(edge_data)}
+
+        return cls(node_IDs, indptr, indices, node_attributes, edge_attributes,
+                   copy.deepcopy(G.graph))
+
+    def to_networkx(self):
+        '''
+        Returns a new networkx graph with the nodes, edges and attributes of
+        the contact graph.
+        '''
+        G = nx.Graph()
+        G.graph.update(copy.deepcopy(self.graph_attributes))
+        node_values = {attribute:decode_attribute(spec) for attribute, spec \
+                       in self.node_attributes.items()}
+        G.add_nodes_from([(ID, {attribute:values[i] for attribute, values in \
+            node_values.items() if values[i] != None}) \
+            for i, ID in enumerate(self.node_IDs)])
+
+        edge_values = {attribute:decode_attribute(spec) for attribute, spec \
+                       in self.edge_attributes.items()}
+        indptr = np.asarray(self.indptr)
+        indices = np.asarray(self.indices)
+        # the adjacency of every node is filled in the stored order of its
+        # neighbours. networkx offers no public way to set the order of the
+        # neighbours of a node independently of the order in which edges are
+        # added, therefore the adjacency dictionaries are filled directly. Both
+        # directions of an edge share the same attribute dictionary, as in
+        # graphs built with add_edge()
+        adj = G._adj
+        for i, ID in enumerate(self.node_IDs):
+            for k in range(indptr[i], indptr[i + 1]):
+                neighbour = self.node_IDs[indices[k]]
+                if ID in adj[neighbour]:
+                    adj[ID][neighbour] = adj[neighbour][ID]
+                else:
+                    adj[ID][neighbour] = {attribute:values[k] for \
+                        attribute, values in edge_values.items() \
+                        if values[k] != None}
+        return G
+
+    def get_networkx(self):
+        '''
+        Returns the networkx version of the contact graph. The conversion is
+        done once and cached, such that all models that are created from the
+        same contact graph (for example all runs of an ensemble) share the
+        same networkx graph, as they would if the graph was loaded from a
+        gpickle once.
+        '''
+        if self._networkx == None:
+            self._networkx = self.to_networkx()
+        return self._networkx
+
+    def save(self, path):
+        '''
+        Writes the contact graph to the directory at path. An existing
+        contact graph at path is replaced.
+        '''
+        header = {'format':'contact_graph',
+                  'version':FORMAT_VERSION,
+                  'N_nodes':self.number_of_nodes(),
+                  'N_edges':self.number_of_edges(),
+                  'node_IDs':self.node_IDs,
+                  'node_attributes':{attribute:get_header_spec(spec) for \
+                    attribute, spec in self.node_attributes.items()},
+                  'edge_attributes':{attribute:get_header_spec(spec) for \
+                    attribute, spec in self.edge_attributes.items()},
+                  'graph_attributes':self.graph_attributes}
+
+        # the graph is written to a temporary directory that replaces the old
+        # graph once it is complete
+        tmp_path = '{}.tmp{}'.format(path.rstrip('/'), os.getpid())
+        os.makedirs(tmp_path)
+        np.save(join(tmp_path, 'indptr.npy'), np.asarray(self.indptr))
+        np.save(join(tmp_path, 'indices.npy'), np.asarray(self.indices))
+        for prefix, attributes in [('node', self.node_attributes),
+                                   ('edge', self.edge_attributes)]:
+            for attribute, spec in attributes.items():
+                np.save(join(tmp_path, '{}_{}.npy'.format(prefix, attribute)),
+                        np.asarray(spec['values']))
+        with open(join(tmp_path, 'header.json'), 'w') as header_file:
+            json.dump(header, header_file, default=to_builtin)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        '''
+        Reads a contact graph from the directory at path. If mmap = True
+        (default), the arrays are memory mapped read-only instead of being
+        read into memory.
+        '''
+        with open(join(path, 'header.json'), 'r') as header_file:
+            header = json.load(header_file)
+        assert header.get('format') == 'contact_graph', \
+            '{} is not a contact graph'.format(path)
+        assert header['version'] == FORMAT_VERSION, \
+            'unsupported contact graph format version {}'.format(\
+            header['version'])
+
+        mmap_mode = 'r' if mmap else None
+        def load_array(name):
+            return np.load(join(path, '{}.npy'.format(name)),
+                           mmap_mode=mmap_mode, allow_pickle=False)
+
+        node_attributes = {attribute:dict(spec, values=load_array(\
+            'node_{}'.format(attribute))) for attribute, spec in \
+            header['node_attributes'].items()}
+        edge_attributes = {attribute:dict(spec, values=load_array(\
+            'edge_{}'.format(attribute))) for attribute, spec in \
+            header['edge_attributes'].items()}
+        return cls(header['node_IDs'], load_array('indptr'),
+                   load_array('indices'), node_attributes, edge_attributes,
+                   header.get('graph_attributes', {}))
+
+    @classmethod
+    def from_gpickle(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_networkx(pickle.load(f))
+
+    def to_gpickle(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self.to_networkx(), f, pickle.HIGHEST_PROTOCOL)
+
+
+
+class CompiledGraph():
+    '''
+    Validated, read-only view of a contact network (networkx graph or
+    ContactGraph) for a given set of contact type weights, as used by the
+    simulation: node IDs in the order of the nodes of the network, a stable
+    mapping of node IDs to contiguous integer indices, the attributes (for
+    example type, unit and age) of every node and the neighbours of every
+    node as {neighbour index:contact type} and {neighbour index:weight}, in
+    the order of the adjacency of the node in the network.
+
+    Compiled graphs are created with compile_graph(), which caches them, such
+    that all models created from the same network with the same contact type
+    weights share one compiled graph. Compiled graphs are therefore never
+    modified after they are created: node IDs, attributes and edges are
+    tuples and all mappings are read-only views (types.MappingProxyType).
+    The network they were compiled from is never modified either.
+
+    node_IDs: list of node IDs.
+    node_attributes: dictionary {attribute:list of the values of all nodes},
+    with None for nodes without the attribute.
+    indptr, indices: neighbours of all nodes in CSR form (see ContactGraph).
+    contact_types: list of the contact types of all entries of indices.
+    '''
+
+    def __init__(self, node_IDs, node_attributes, indptr, indices,
+        contact_types, contact_type_weights):
+        assert len(node_IDs) > 0, 'graph has no nodes'
+        assert len(indices) > 0, 'graph has no edges'
+        for contact_type in set(contact_types):
+            assert contact_type in {'very_far', 'far', 'intermediate',
+                'close'}, 'contact type {} not recognised'.format(contact_type)
+
+        self.contact_type_weights = MappingProxyType(dict(\
+            contact_type_weights))
+        self.node_IDs = tuple(node_IDs)
+        self.node_index = MappingProxyType({ID:i for i, ID in \
+                                            enumerate(self.node_IDs)})
+        self.node_attributes = MappingProxyType({attribute:tuple(values) \
+            for attribute, values in node_attributes.items()})
+        self.node_types = self.node_attributes['type']
+        self.node_units = self.node_attributes.get('unit',
+                                                   (None,) * len(node_IDs))
+
+        # neighbours of every node as {neighbour index:contact type} and
+        # {neighbour index:weight of the contact type}
+        indptr = np.asarray(indptr)
+        indices = np.asarray(indices)
+        bounds = indptr.tolist()
+        neighbours = indices.tolist()
+        self.contact_types = tuple([MappingProxyType(dict(zip(\
+            neighbours[bounds[i]:bounds[i + 1]],
+            contact_types[bounds[i]:bounds[i + 1]]))) \
+            for i in range(len(self.node_IDs))])
+        self.weights = tuple([MappingProxyType({j:self.contact_type_weights[\
+            contact_type] for j, contact_type in node_contact_types.items()}) \
+            for node_contact_types in self.contact_types])
+
+        # edges as pairs of node indices, in the order of the edges of the
+        # network: networkx lists every edge with the node that comes first
+        # in the order of the nodes
+        rows = np.repeat(np.arange(len(self.node_IDs)), np.diff(indptr))
+        first = indices >= rows
+        self.edges = tuple(zip(rows[first].tolist(), indices[first].tolist()))
+        self._edge_index = None
+
+    def __getstate__(self):
+        # read-only views cannot be pickled or copied, they are stored as
+        # dictionaries and restored by __setstate__()
+        state = dict(self.__dict__)
+        state['contact_type_weights'] = dict(self.contact_type_weights)
+        state['node_index'] = dict(self.node_index)
+        state['node_attributes'] = dict(self.node_attributes)
+        state['contact_types'] = tuple([dict(c) for c in self.contact_types])
+        state['weights'] = tuple([dict(w) for w in self.weights])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for key in ['contact_type_weights', 'node_index', 'node_attributes']:
+            setattr(self, key, MappingProxyType(state[key]))
+        self.contact_types = tuple([MappingProxyType(c) for c in \
+                                    state['contact_types']])
+        self.weights = tuple([MappingProxyType(w) for w in state['weights']])
+
+    @classmethod
+    def from_networkx(cls, G, contact_type_weights):
+        assert type(G) == nx.Graph, 'not a networkx graph or contact graph'
+        node_IDs = list(G.nodes())
+        node_index = {ID:i for i, ID in enumerate(node_IDs)}
+        node_data = [data for ID, data in G.nodes(data=True)]
+        node_attributes = {attribute:[data.get(attribute) for data in \
+            node_data] for attribute in get_attribute_names(node_data)}
+
+        indptr = np.zeros(len(node_IDs) + 1, dtype=np.int64)
+        indices = []
+        contact_types = []
+        for i, ID in enumerate(node_IDs):
+            for neighbour, data in G.adj[ID].items():
+                indices.append(node_index[neighbour])
+                contact_types.append(data.get('contact_type'))
+            indptr[i + 1] = len(indices)
+        return cls(node_IDs, node_attributes, indptr, indices, contact_types,
+                   contact_type_weights)
+
+    @classmethod
+    def from_contact_graph(cls, graph, contact_type_weights):
+        '''
+        Compiles a ContactGraph directly from its arrays, without converting
+        it to networkx.
+        '''
+        node_attributes = {attribute:decode_attribute(spec) for attribute, \
+            spec in graph.node_attributes.items()}
+        if 'contact_type' in graph.edge_attributes:
+            contact_types = decode_attribute(\
+                graph.edge_attributes['contact_type'])
+        else:
+            contact_types = [None] * len(graph.indices)
+        return cls(graph.node_IDs, node_attributes, graph.indptr,
+                   graph.indices, contact_types, contact_type_weights)
+
+    def number_of_nodes(self):
+        return len(self.node_IDs)
+
+    def number_of_edges(self):
+        return len(self.edges)
+
+    def get_nodes(self, node_type):
+        '''
+        Returns the IDs of all nodes of the given type, in the order of the
+        nodes of the graph.
+        '''
+        return [ID for ID, t in zip(self.node_IDs, self.node_types) \
+                if t == node_type]
+
+    def get_edge_index(self):
+        '''
+        Returns the dictionary {(source index, target index):position} that
+        assigns every directed edge (both directions of every edge of the
+        graph) a fixed position.
+        '''
+        if self._edge_index == None:
+            edge_index = {}
+            for u, v in self.edges:
+                edge_index[(u, v)] = len(edge_index)
+                edge_index[(v, u)] = len(edge_index)
+            self._edge_index = edge_index
+        return self._edge_index
+
+    def get_weight(self, u, v):
+        '''
+        Returns the weight of the edge between the nodes with IDs u and v.
+        '''
+        return self.weights[self.node_index[u]][self.node_index[v]]
+
+
+# compiled graphs by contact network (networkx graph or ContactGraph) and
+# contact type weights. Networks are held weakly, such that compiled graphs
+# are discarded together with their network
+_compiled_graphs = weakref.WeakKeyDictionary()
+_compiled_graphs_lock = threading.Lock()
+
+
+def hash_contact_types(G):
+    '''
+    Returns a fingerprint of the contact types of all edges of the contact
+    network G (networkx graph or ContactGraph) in edge order. The fingerprint
+    is only valid within the same process.
+    '''
+    if isinstance(G, ContactGraph):
+        contact_types = G.edge_attributes['contact_type']
+        return hash((tuple(contact_types['categories']),
+                     np.asarray(contact_types['values']).tobytes()))
+    return hash(tuple(data.get('contact_type') for u, v, data in \
+                      G.edges(data=True)))
+
+
+def compile_graph(G, contact_type_weights):
+    '''
+    Validates the contact network G (networkx graph or ContactGraph) and
+    returns its compiled version (see CompiledGraph) for the given contact
+    type weights. Contact graphs are compiled directly from their arrays.
+    Compiled graphs are cached by the identity of the network and the contact
+    type weights, such that repeated calls with the same network (for example
+    for all runs of an ensemble) do not validate and compile it again. The
+    number of nodes and edges and a fingerprint of the contact types of the
+    network (see hash_contact_types()) are stored with the compiled graph and
+    the network is compiled again if they changed. Other changes to a
+    networkx graph after it was compiled, for example changed node
+    attributes or rewired edges with the same contact types, are not
+    detected.
+    '''
+    key = tuple(sorted(contact_type_weights.items()))
+    with _compiled_graphs_lock:
+        try:
+            fingerprint, compiled = _compiled_graphs.get(G, {}).get(key,
+                                                                (None, None))
+        except TypeError:
+            # objects that are not networks cannot be cached, compiling fails
+            # for them below
+            fingerprint, compiled = None, None
+        if compiled != None and \
+           compiled.number_of_nodes() == G.number_of_nodes() and \
+           compiled.number_of_edges() == G.number_of_edges() and \
+           fingerprint == hash_contact_types(G):
+            return compiled
+
+        if isinstance(G, ContactGraph):
+            compiled = CompiledGraph.from_contact_graph(G,
+                                                        contact_type_weights)
+        else:
+            compiled = CompiledGraph.from_networkx(G, contact_type_weights)
+        _compiled_graphs.setdefault(G, {})[key] = (hash_contact_types(G),
+                                                   compiled)
+        return compiled
+
+
+def get_weighted_graph(G, contact_type_weights):
+    '''
+    Returns a copy of the networkx contact network G with the weight of the
+    contact type of every edge as the edge attribute 'weight', for example
+    to lay out the graph for visualisation.
+    '''
+    H = G.copy()
+    nx.set_edge_attributes(H, {(u, v):contact_type_weights[data[\
+        'contact_type']] for u, v, data in G.edges(data=True)}, 'weight')
+    return H
+
+
+def get_attribute_names(data):
+    names = []
+    for d in data:
+        for attribute in d.keys():
+            if attribute not in names:
+                names.append(attribute)
+    return names
+
+
+def encode_attribute(attribute, values):
+    '''
+    Encodes the values of an attribute (None for missing values) as an array
+    of integer codes into a list of categories (strings) or an array of floats
+    (numbers and booleans).
+    '''
+    present = [v for v in values if v != None]
+    if all([isinstance(v, str) for v in present]):
+        categories = sorted(set(present))
+        codes = {c:i for i, c in enumerate(categories)}
+        dtype = np.int8 if len(categories) < 128 else np.int32
+        return {'kind':'categorical', 'categories':categories, 'dtype':'str',
+                'values':np.asarray([codes[v] if v != None else -1 \
+                                     for v in values], dtype=dtype)}
+
+    if all([isinstance(v, (bool, np.bool_)) for v in present]):
+        dtype = 'bool'
+    elif all([isinstance(v, (int, np.integer)) for v in present]):
+        dtype = 'int'
+    elif all([isinstance(v, (int, float, np.integer, np.floating)) for v in \
+              present]):
+        dtype = 'float'
+    else:
+        raise ValueError('attribute {} has values that are neither strings '\
+            'nor numbers'.format(attribute))
+    return {'kind':'numeric', 'categories':None, 'dtype':dtype,
+            'values':np.asarray([float(v) if v != None else np.nan \
+                                 for v in values], dtype=float)}
+
+
+def decode_attribute(spec):
+    values = np.asarray(spec['values'])
+    if spec['kind'] == 'categorical':
+        categories = spec['categories']
+        return [categories[c] if c >= 0 else None for c in values.tolist()]
+    convert = {'bool':bool, 'int':int, 'float':float}[spec['dtype']]
+    return [convert(v) if not np.isnan(v) else None for v in values.tolist()]
+
+
+def get_header_spec(spec):
+    return {key:value for key, value in spec.items() if key != 'values'}
+
+
+def load_contact_graph(path, mmap=True):
+    '''
+    Loads a contact network either from a contact graph directory (see
+    ContactGraph.save()) or from a networkx gpickle.
+    '''
+    if os.path.isdir(path):
+        return ContactGraph.load(path, mmap)
+    return ContactGraph.from_gpickle(path)
+
+
+if __name__ == '__main__':
+    # command line interface to convert contact networks, e.g.
+    # python contact_graph.py data/school/test_volksschule.gpickle \
+    #     data/school/test_volksschule.graph
+    parser = argparse.ArgumentParser(description='convert contact networks '+\
+        'between networkx gpickles and the contact graph format')
+    parser.add_argument('source', help='gpickle file or contact graph '+\
+        'directory')
+    parser.add_argument('target', help='contact graph directory or gpickle '+\
+        'file (if the name ends with .gpickle)')
+    args = parser.parse_args()
+
+    graph = load_contact_graph(args.source)
+    if args.target.endswith('.gpickle'):
+        graph.to_gpickle(args.target)
+    else:
+        graph.save(args.target)
+    print('{}: {} nodes, {} edges'.format(args.target, graph.number_of_nodes(),
+                                          graph.number_of_edges()))
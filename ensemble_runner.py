@@ -0,0 +1,715 @@
+import sys
+import copy
+import json
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from result_cache import hash_graph, hash_parameters, get_code_version
+from sweep_journal import get_blocks
+from ensemble_statistics import EnsembleStatistics, RunningStatistics, \
+    RunReservoir
+
+# number of runs per block of runs if runs are distributed over several
+# worker processes and no block size is specified
+DEFAULT_BLOCK_SIZE = 10
+
+# hashes of graphs that have already been fingerprinted in this process,
+# keyed by the id of the graph object. The graph object itself is stored as
+# well, to keep the id from being reused by a different graph
+_graph_hashes = {}
+
+
+def get_graph_hash(G):
+    try:
+        graph, graph_hash = _graph_hashes[id(G)]
+        if graph is G:
+            return graph_hash
+    except KeyError:
+        pass
+    graph_hash = hash_graph(G)
+    _graph_hashes[id(G)] = (G, graph_hash)
+    return graph_hash
+
+
+def run_model(model, N_steps):
+    '''
+    Runs a model for at most N_steps steps. The run ends early, if the
+    outbreak is over, i.e. there are no more exposed or infectious agents.
+    '''
+    for i in range(N_steps):
+        model.step()
+        if len([a for a in model.schedule.agents if \
+            (a.exposed == True or a.infectious == True)]) == 0:
+            break
+    return model
+
+
+
+class Scenario():
+    '''
+    A single point in a parameter sweep: a model class together with the
+    contact network and the constructor parameters that are used to create a
+    model instance for every run of the ensemble.
+
+    model_class: SEIRX model class, for example SEIRX_school or
+    SEIRX_nursing_home.
+
+    G: networkx graph, contact network of the scenario.
+
+    model_params: dictionary of keyword arguments that are passed to the model
+    constructor (except G and seed). The dictionary is copied, such that it can
+    be modified safely after the scenario has been created (for example the
+    'agent_types' dictionary in the loops over screening intervals).
+
+    observables: function with the signature observables(model, run) that
+    returns a dictionary of observables of a single run, for example
+    analysis_functions.get_ensemble_observables_school.
+
+    N_steps: integer, maximum number of steps of a single run. Default = 500.
+
+    labels: dictionary of scenario parameters (for example the test type and
+    screening intervals) that are reported together with the ensemble
+    statistics of the scenario.
+    '''
+
+    def __init__(self, model_class, G, model_params, observables,
+        N_steps=500, labels={}):
+        self.model_class = model_class
+        self.G = G
+        self.model_params = copy.deepcopy(model_params)
+        self.observables = observables
+        self.N_steps = N_steps
+        self.labels = dict(labels)
+        self._key = None
+
+    def create_model(self, seed):
+        return self.model_class(self.G, seed=seed, **self.model_params)
+
+    def get_key(self):
+        '''
+        Returns a hash of everything that determines the outcome of a run of
+        the scenario for a given seed: the contents of the contact network,
+        the model class, all constructor parameters, the maximum number of
+        steps, the observable function and the version of the simulation code.
+        '''
+        if self._key == None:
+            extra_files = [getattr(sys.modules[f.__module__], '__file__', None)\
+                for f in [self.model_class, self.observables]]
+            self._key = hash_parameters({
+                'graph':get_graph_hash(self.G),
+                'model_class':'{}.{}'.format(self.model_class.__module__,
+                                             self.model_class.__name__),
+                'model_params':self.model_params,
+                'N_steps':self.N_steps,
+                'observables':'{}.{}'.format(self.observables.__module__,
+                                             self.observables.__name__),
+                'code_version':get_code_version(extra_files)})
+        return self._key
+
+    def get_cache_key(self, first_seed, last_seed):
+        '''
+        Returns the key of the ensemble of runs with seeds in the range
+        [first_seed, last_seed)
+        '''
+        return hash_parameters({'scenario':self.get_key(),
+                                'seeds':[first_seed, last_seed]})
+
+
+def run_replicates(scenario, first_seed, last_seed, reservoir=None):
+    '''
+    Runs the scenario once for every seed in [first_seed, last_seed) and
+    returns the list of observable rows of all runs. If a RunReservoir is
+    given, every run is offered to the reservoir while its model is still
+    available.
+    '''
+    rows = []
+    for seed in range(first_seed, last_seed):
+        model = scenario.create_model(seed)
+        run_model(model, scenario.N_steps)
+        rows.append(scenario.observables(model, seed))
+        if reservoir != None:
+            reservoir.add(rows[-1], model)
+    return rows
+
+
+class CostModel():
+    '''
+    Predicts the computational cost (run time in seconds) of runs of a
+    scenario, to order work by cost when running sweeps in parallel. Run times
+    are recorded per scenario while a sweep is running. For scenarios with
+    recorded run times, the cost of a run is the mean recorded run time per
+    run. For all other scenarios, the cost is estimated from the size of the
+    contact network (number of nodes + number of edges) and the recorded run
+    time per run and network size of all other scenarios.
+
+    path: string, optional. If given, the recorded run times are loaded from
+    and stored to a JSON file at this path, such that predictions improve over
+    successive sweeps.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path
+        # {scenario key:{'runtime':float, 'runs':int, 'size':int}}
+        self.runtimes = {}
+        if self.path != None:
+            try:
+                with open(self.path, 'r') as runtime_file:
+                    self.runtimes = json.load(runtime_file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+    def record(self, scenario, runs, runtime):
+        key = scenario.get_key()
+        if key not in self.runtimes:
+            self.runtimes[key] = {'runtime':0, 'runs':0,
+                'size':get_graph_size(scenario.G)}
+        self.runtimes[key]['runtime'] += runtime
+        self.runtimes[key]['runs'] += runs
+
+    def save(self):
+        if self.path != None:
+            with open(self.path, 'w') as runtime_file:
+                json.dump(self.runtimes, runtime_file)
+
+    def predict(self, scenario, runs):
+        key = scenario.get_key()
+        if key in self.runtimes and self.runtimes[key]['runs'] > 0:
+            return runs * self.runtimes[key]['runtime'] / \
+                self.runtimes[key]['runs']
+
+        size = get_graph_size(scenario.G)
+        # run time per run and graph element of all scenarios with records
+        costs = [r['runtime'] / r['runs'] / r['size'] for r in \
+                 self.runtimes.values() if r['runs'] > 0 and r['size'] > 0]
+        if len(costs) > 0:
+            return runs * size * np.median(costs)
+        else:
+            return runs * size
+
+
+def get_graph_size(G):
+    return G.number_of_nodes() + G.number_of_edges()
+
+
+# scenarios of the sweep that is executed by a worker process. Set once per
+# worker by _init_worker(), such that contact networks are not sent to the
+# worker with every unit of work
+_worker_scenarios = None
+# empty RunReservoirs of the scenarios (or None), from which every unit of
+# work spawns the reservoir of its block of runs
+_worker_reservoirs = None
+
+def _init_worker(scenarios, reservoirs=None):
+    global _worker_scenarios, _worker_reservoirs
+    _worker_scenarios = scenarios
+    _worker_reservoirs = reservoirs
+
+
+def _run_unit(unit):
+    i, first_seed, last_seed = unit
+    reservoir = None
+    if _worker_reservoirs != None:
+        reservoir = _worker_reservoirs[i].spawn()
+    start = time.perf_counter()
+    rows = run_replicates(_worker_scenarios[i], first_seed, last_seed,
+                          reservoir)
+    return i, first_seed, last_seed, rows, reservoir, \
+        time.perf_counter() - start
+
+
+def run_units(scenarios, runs, first_seed=0, cache=None, journal=None,
+    block_size=None, N_workers=1, cost_model=None, verbose=False,
+    on_block=None, reservoirs=None):
+    '''
+    Runs all blocks of runs of all scenarios that are not yet recorded in the
+    journal, using the seeds first_seed to first_seed + runs - 1 for every
+    scenario. See run_ensemble() for the description of the parameters.
+
+    on_block: function with the signature on_block(i, first_seed, last_seed,
+    block_rows, block_reservoir) that is called for every block that is
+    looked up in the cache or simulated, where i is the index of the scenario
+    in the list of scenarios. Blocks that are already recorded in the journal
+    are skipped and not passed to on_block.
+
+    reservoirs: list with an empty RunReservoir for every scenario, optional.
+    If given, the runs of every simulated block are offered to a reservoir
+    spawned from the reservoir of the scenario, which is passed to on_block
+    as block_reservoir. For blocks from the cache, block_reservoir is None.
+    '''
+    if block_size == None and N_workers > 1:
+        block_size = DEFAULT_BLOCK_SIZE
+    if cost_model == None:
+        cost_model = CostModel()
+
+    last_seed = first_seed + runs
+
+    def finish(i, block_first_seed, block_last_seed, block_rows, cache,
+        block_reservoir=None):
+        finish_unit(scenarios[i], block_first_seed, block_last_seed,
+                    block_rows, cache, journal)
+        if on_block != None:
+            on_block(i, block_first_seed, block_last_seed, block_rows,
+                     block_reservoir)
+
+    # units of work that still have to be simulated: (scenario, first seed,
+    # last seed). Blocks that are already in the journal or cache are skipped
+    units = []
+    for i, scenario in enumerate(scenarios):
+        seeds = range(first_seed, last_seed)
+        if journal != None:
+            completed_seeds = journal.get_completed_seeds(scenario.get_key())
+            seeds = [s for s in seeds if s not in completed_seeds]
+
+        for block_first_seed, block_last_seed in get_blocks(seeds, block_size):
+            block_rows = None
+            if cache != None:
+                block_rows = cache.get(scenario.get_cache_key(\
+                    block_first_seed, block_last_seed))
+            if block_rows == None:
+                units.append((i, block_first_seed, block_last_seed))
+            else:
+                # blocks from the cache are not stored in the cache again
+                finish(i, block_first_seed, block_last_seed, block_rows, None)
+
+    # expensive units first, such that the cheap units fill up the idle
+    # workers at the end of the sweep
+    units.sort(key=lambda u: cost_model.predict(scenarios[u[0]], u[2] - u[1]),
+               reverse=True)
+
+    if N_workers > 1 and len(units) > 1:
+        # units are handed out one at a time (chunksize = 1): whenever a
+        # worker is idle, it takes the next unit from the shared queue
+        with Pool(N_workers, initializer=_init_worker,
+                  initargs=(scenarios, reservoirs)) as pool:
+            results = pool.imap_unordered(_run_unit, units, chunksize=1)
+            for j, (i, block_first_seed, block_last_seed, block_rows,
+                    block_reservoir, runtime) in enumerate(results):
+                cost_model.record(scenarios[i],
+                    block_last_seed - block_first_seed, runtime)
+                finish(i, block_first_seed, block_last_seed, block_rows, cache,
+                       block_reservoir)
+                if verbose and j % 10 == 0:
+                    print('unit {} / {}'.format(j, len(units)))
+    else:
+        _init_worker(scenarios, reservoirs)
+        for j, unit in enumerate(units):
+            i, block_first_seed, block_last_seed, block_rows, \
+                block_reservoir, runtime = _run_unit(unit)
+            cost_model.record(scenarios[i],
+                block_last_seed - block_first_seed, runtime)
+            finish(i, block_first_seed, block_last_seed, block_rows, cache,
+                   block_reservoir)
+            if verbose and j % 10 == 0:
+                print('unit {} / {}'.format(j, len(units)))
+
+    cost_model.save()
+
+
+def get_ensemble_rows(scenarios, runs, first_seed=0, cache=None, journal=None,
+    block_size=None, N_workers=1, cost_model=None, verbose=False):
+    '''
+    Runs an ensemble of runs for every scenario in a list of scenarios, using
+    the seeds first_seed to first_seed + runs - 1 for every scenario. See
+    run_ensemble() for the description of the parameters.
+
+    Returns a list with the list of observable rows of every scenario.
+    '''
+    # observable rows of every scenario by first seed of the block
+    rows = [{} for scenario in scenarios]
+
+    def on_block(i, block_first_seed, block_last_seed, block_rows,
+        block_reservoir):
+        if journal == None:
+            rows[i][block_first_seed] = block_rows
+
+    run_units(scenarios, runs, first_seed, cache, journal, block_size,
+              N_workers, cost_model, verbose, on_block)
+
+    if journal != None:
+        return [journal.get_rows(scenario.get_key(), first_seed,
+                first_seed + runs) for scenario in scenarios]
+    else:
+        return [[row for block in sorted(r.keys()) for row in r[block]] \
+                for r in rows]
+
+
+def get_ensemble_statistics(scenarios, runs, first_seed=0, cache=None,
+    journal=None, block_size=None, N_workers=1, cost_model=None,
+    verbose=False, k=200, reservoirs=None):
+    '''
+    Runs an ensemble of runs for every scenario in a list of scenarios, like
+    get_ensemble_rows(), but aggregates the observables of every block of
+    runs as soon as it is completed (see EnsembleStatistics) instead of
+    keeping the rows of all runs in memory. Rows of blocks that are already
+    recorded in the journal are streamed from the journal one block at a
+    time. k is the accuracy parameter of the quantile sketches.
+
+    reservoirs: list with a RunReservoir for every scenario, optional. If
+    given, all runs of the ensemble of a scenario are added to its reservoir.
+    Records are only created for runs that are simulated, runs from the
+    journal or the cache are added without a record.
+
+    Returns a list with the EnsembleStatistics of every scenario.
+    '''
+    statistics = [EnsembleStatistics(k) for scenario in scenarios]
+
+    if journal != None:
+        for i, scenario in enumerate(scenarios):
+            for row in journal.iter_rows(scenario.get_key(), first_seed,
+                                         first_seed + runs):
+                statistics[i].add(row)
+                if reservoirs != None:
+                    reservoirs[i].add(row)
+
+    def on_block(i, block_first_seed, block_last_seed, block_rows,
+        block_reservoir):
+        statistics[i].add_rows(block_rows)
+        if reservoirs != None:
+            if block_reservoir != None:
+                reservoirs[i].merge(block_reservoir)
+            else:
+                for row in block_rows:
+                    reservoirs[i].add(row)
+
+    worker_reservoirs = None
+    if reservoirs != None:
+        worker_reservoirs = [r.spawn() for r in reservoirs]
+    run_units(scenarios, runs, first_seed, cache, journal, block_size,
+              N_workers, cost_model, verbose, on_block, worker_reservoirs)
+
+    return statistics
+
+
+def finish_unit(scenario, first_seed, last_seed, block_rows, cache, journal):
+    '''
+    Stores the observable rows of a completed block of runs in the cache and
+    in the journal (if given).
+    '''
+    if cache != None:
+        cache.put(scenario.get_cache_key(first_seed, last_seed), block_rows,
+                  scenario=scenario.get_key(), seeds=[first_seed, last_seed])
+    if journal != None:
+        journal.commit(scenario.get_key(), first_seed, last_seed, block_rows)
+
+
+def run_ensemble(scenario, runs, first_seed=0, cache=None, journal=None,
+    block_size=None, N_workers=1, cost_model=None):
+    '''
+    Runs an ensemble of runs of a scenario, using the seeds first_seed to
+    first_seed + runs - 1. Runs are executed in blocks of at most block_size
+    consecutive seeds (one block for all runs if block_size = None and
+    N_workers = 1).
+
+    If a SweepJournal is given, blocks of seeds that are already recorded in
+    the journal are not run again and every newly completed block is committed
+    to the journal, such that an interrupted ensemble can be resumed.
+
+    If a ResultCache is given, the observables of every block are looked up in
+    the cache first and the simulation is skipped entirely on a cache hit.
+    Otherwise the results are stored in the cache.
+
+    If N_workers > 1, blocks are distributed dynamically over a pool of
+    N_workers worker processes: every worker takes a new block as soon as it
+    has finished its last one. Blocks with the highest predicted cost (see
+    CostModel) are started first. If no block_size is given, blocks of
+    DEFAULT_BLOCK_SIZE runs are used.
+
+    Returns a data frame with one row of observables per run.
+    '''
+    rows = get_ensemble_rows([scenario], runs, first_seed, cache, journal,
+        block_size, N_workers, cost_model)[0]
+    return pd.DataFrame(rows)
+
+
+def run_sweep(scenarios, runs, first_seed=0, cache=None, journal=None,
+    block_size=None, N_workers=1, cost_model=None, verbose=False, k=200):
+    '''
+    Runs an ensemble of runs for every scenario in a list of scenarios and
+    calculates the ensemble statistics (see analysis_functions.get_statistics)
+    of all observables. See run_ensemble() for the description of the cache,
+    journal, block_size, N_workers and cost_model parameters. Blocks of runs
+    of all scenarios are scheduled together, such that workers never idle at
+    the end of a scenario. If the sweep is interrupted, running it again with
+    the same journal skips all completed blocks of runs.
+
+    Observables are aggregated online while blocks are completed (see
+    EnsembleStatistics), the rows of the individual runs are not kept in
+    memory. Means and standard deviations are exact, quantiles are exact for
+    ensembles of up to k runs and approximated by a quantile sketch with a
+    rank error of the order of 1 / k for larger ensembles.
+
+    Returns a data frame with one row per scenario that contains the labels of
+    the scenario and the ensemble statistics.
+    '''
+    # scenario keys are calculated once in the main process, before the
+    # scenarios are handed to the workers
+    for scenario in scenarios:
+        scenario.get_key()
+
+    statistics = get_ensemble_statistics(scenarios, runs, first_seed, cache,
+        journal, block_size, N_workers, cost_model, verbose, k)
+
+    return get_sweep_statistics(scenarios, statistics)
+
+
+def run_representative_sweep(scenarios, runs, get_record,
+    statistic='infected_agents_median', max_records=100, first_seed=0,
+    cache=None, journal=None, block_size=None, N_workers=1, cost_model=None,
+    verbose=False, k=200):
+    '''
+    Runs a sweep like run_sweep() and picks a representative run of every
+    scenario: the run whose observable is closest to an ensemble statistic of
+    the observable (by default the run whose number of infected agents is
+    closest to the median). Instead of storing the models of all runs, a
+    RunReservoir keeps the observable row and a compact record (for example
+    analysis_functions.get_run_record) of a small number of candidate runs
+    per scenario while the ensemble is running. If the chosen candidate has
+    no record (for example because its block of runs was read from the
+    journal or the cache), its seed is run again to create the record.
+
+    get_record: function with the signature get_record(model, run) that
+    returns the compact record of a finished run.
+
+    statistic: string, name of the ensemble statistic (see
+    EnsembleStatistics.get_value()), for example 'infected_agents_median'.
+
+    max_records: integer, maximum number of records kept per scenario.
+
+    See run_sweep() for the description of the other parameters.
+
+    Returns the data frame of ensemble statistics (see run_sweep()) with the
+    additional column representative_run (seed of the representative run) and
+    the list of records of the representative runs of all scenarios.
+    '''
+    for scenario in scenarios:
+        scenario.get_key()
+
+    observable = EnsembleStatistics().parse_statistic(statistic)[0]
+    reservoirs = [RunReservoir(observable, get_record, max_records) for \
+                  scenario in scenarios]
+    statistics = get_ensemble_statistics(scenarios, runs, first_seed, cache,
+        journal, block_size, N_workers, cost_model, verbose, k, reservoirs)
+
+    records = []
+    representative_runs = []
+    for scenario, scenario_statistics, reservoir in zip(scenarios, statistics,
+                                                        reservoirs):
+        candidate = reservoir.get_closest(scenario_statistics.get_value(\
+            statistic))
+        record = candidate['record']
+        if record == None:
+            model = scenario.create_model(candidate['run'])
+            run_model(model, scenario.N_steps)
+            record = get_record(model, candidate['run'])
+        records.append(record)
+        representative_runs.append(candidate['run'])
+
+    results = get_sweep_statistics(scenarios, statistics)
+    results['representative_run'] = representative_runs
+    return results, records
+
+
+def get_sweep_statistics(scenarios, ensemble_statistics):
+    '''
+    Collects the ensemble statistics of all observables for every scenario,
+    given a list with the EnsembleStatistics of every scenario. For backwards
+    compatibility, lists of observable rows are accepted as well.
+
+    Returns a data frame with one row per scenario that contains the labels of
+    the scenario and the ensemble statistics.
+    '''
+    results = []
+    for scenario, statistics in zip(scenarios, ensemble_statistics):
+        if not isinstance(statistics, EnsembleStatistics):
+            rows = statistics
+            statistics = EnsembleStatistics(max(len(rows), 1))
+            statistics.add_rows(rows)
+        row = dict(scenario.labels)
+        row.update(statistics.get_all_statistics())
+        results.append(row)
+
+    return pd.DataFrame(results)
+
+
+def run_adaptive_sweep(scenarios, targets, min_runs=100, max_runs=10000,
+    batch_runs=None, first_seed=0, confidence=0.95, relative=False,
+    cache=None, journal=None, block_size=None, N_workers=1, cost_model=None,
+    verbose=False, k=200):
+    '''
+    Runs an ensemble for every scenario in a list of scenarios, like
+    run_sweep(), but determines the number of runs of every scenario
+    adaptively: runs are added in batches until the confidence intervals of
+    all target statistics of the scenario are narrower than the requested
+    precision, or the scenario has max_runs runs. Scenarios that converge
+    quickly stop early, while the remaining scenarios keep running. Seeds are
+    consecutive, starting at first_seed, such that the runs of an adaptive
+    sweep are the first runs of a sweep with a fixed number of runs.
+
+    targets: dictionary of {statistic:precision}, where the statistic is the
+    name of an ensemble statistic column (for example
+    'infected_agents_median' or 'tests_per_day_per_agent_mean', see
+    EnsembleStatistics.get_confidence_interval()) and the precision is the
+    largest acceptable half width of its confidence interval.
+
+    min_runs: integer, number of runs of every scenario before convergence
+    is checked for the first time. Default = 100.
+
+    max_runs: integer, maximum number of runs of every scenario.
+    Default = 10000.
+
+    batch_runs: integer, number of runs that are added to every scenario that
+    has not converged yet, before convergence is checked again. Default =
+    min_runs.
+
+    confidence: float, confidence level of the confidence intervals.
+    Default = 0.95.
+
+    relative: bool, if True, precisions are relative to the value of the
+    statistic (for example 0.05 for +-5%) instead of absolute.
+
+    See run_ensemble() for the description of the cache, journal, block_size,
+    N_workers and cost_model parameters. All scenarios that have not
+    converged run their next batch together, such that workers stay busy.
+
+    Returns a data frame with one row per scenario that contains the labels of
+    the scenario, the ensemble statistics, the number of runs (N_runs),
+    whether all targets were reached (converged) and the achieved precision
+    (half width of the confidence interval) of every target statistic
+    ({statistic}_precision).
+    '''
+    if batch_runs == None:
+        batch_runs = min_runs
+    for scenario in scenarios:
+        scenario.get_key()
+
+    statistics = [EnsembleStatistics(k) for scenario in scenarios]
+    precisions = [{} for scenario in scenarios]
+    converged = [False for scenario in scenarios]
+
+    N_runs = 0
+    active = list(range(len(scenarios)))
+    while len(active) > 0:
+        runs = min(min_runs if N_runs == 0 else batch_runs,
+                   max_runs - N_runs)
+        batch_statistics = get_ensemble_statistics(
+            [scenarios[i] for i in active], runs, first_seed + N_runs, cache,
+            journal, block_size, N_workers, cost_model, verbose, k)
+        N_runs += runs
+
+        for i, scenario_statistics in zip(active, batch_statistics):
+            statistics[i].merge(scenario_statistics)
+            precisions[i] = get_precisions(statistics[i], targets,
+                                           confidence, relative)
+            converged[i] = all([precisions[i][statistic] <= precision for \
+                statistic, precision in targets.items()])
+
+        active = [i for i in active if not converged[i]]
+        if N_runs >= max_runs:
+            break
+        if verbose:
+            print('{} runs: {} / {} scenarios converged'.format(N_runs,
+                len(scenarios) - len(active), len(scenarios)))
+
+    results = get_sweep_statistics(scenarios, statistics)
+    results['N_runs'] = [s.count() for s in statistics]
+    results['converged'] = converged
+    for statistic in targets.keys():
+        results['{}_precision'.format(statistic)] = \
+            [p[statistic] for p in precisions]
+    return results
+
+
+def get_precisions(statistics, targets, confidence=0.95, relative=False):
+    '''
+    Returns the half widths of the confidence intervals of the target
+    statistics of an EnsembleStatistics. Statistics without a confidence
+    interval (too few runs) have a precision of infinity.
+    '''
+    precisions = {}
+    for statistic in targets.keys():
+        lower, upper = statistics.get_confidence_interval(statistic,
+                                                          confidence)
+        half_width = (upper - lower) / 2
+        if relative:
+            value = statistics.get_value(statistic)
+            # a statistic of zero can only be reached with a zero-width
+            # interval
+            if value != 0:
+                half_width = half_width / abs(value)
+            elif half_width > 0:
+                half_width = np.inf
+        if np.isnan(half_width):
+            half_width = np.inf
+        precisions[statistic] = half_width
+    return precisions
+
+
+def run_crn_comparison(scenarios, runs, baseline=0, first_seed=0,
+    observables=None, confidence=0.95, cache=None, journal=None,
+    block_size=None, N_workers=1, cost_model=None, verbose=False):
+    '''
+    Compares a group of scenarios (for example different screening intervals
+    or test types on the same contact network) using common random numbers:
+    all scenarios are run in the common random numbers mode of the model
+    (crn = True, see SEIRX), such that run k of every scenario uses the seed
+    first_seed + k and shares the index case, the epidemiological parameters
+    of all agents and the transmission draws per day and contact with run k
+    of all other scenarios. Differences between the runs of two scenarios are
+    therefore only caused by the differences between their interventions,
+    and the paired differences have a much smaller variance than differences
+    between independent ensembles.
+
+    baseline: integer, index of the scenario all other scenarios are compared
+    to. Default = 0.
+
+    observables: list of observables that are compared. Default = all
+    numeric observables except the run number.
+
+    See run_ensemble() for the description of the other parameters.
+
+    Returns a data frame with one row per scenario that contains the labels of
+    the scenario and for every observable the mean of the paired differences
+    to the baseline ({col}_difference_mean), their variance
+    ({col}_difference_var), the standard error and confidence interval of the
+    mean difference ({col}_difference_sem, {col}_difference_lower,
+    {col}_difference_upper) and the variance of the difference of two
+    independent runs ({col}_independent_var) for comparison.
+    '''
+    crn_scenarios = [Scenario(s.model_class, s.G,
+        dict(s.model_params, crn=True), s.observables, s.N_steps, s.labels) \
+        for s in scenarios]
+    for scenario in crn_scenarios:
+        scenario.get_key()
+
+    ensemble_rows = get_ensemble_rows(crn_scenarios, runs, first_seed, cache,
+        journal, block_size, N_workers, cost_model, verbose)
+    ensemble_results = [pd.DataFrame(rows) for rows in ensemble_rows]
+
+    baseline_results = ensemble_results[baseline]
+    if observables == None:
+        observables = [col for col in baseline_results.select_dtypes(\
+            include='number').columns if col != 'run']
+
+    results = []
+    for scenario, scenario_results in zip(crn_scenarios, ensemble_results):
+        row = dict(scenario.labels)
+        for col in observables:
+            differences = RunningStatistics()
+            for a, b in zip(scenario_results[col], baseline_results[col]):
+                differences.update(a - b)
+            lower, upper = differences.mean_confidence_interval(confidence)
+            row.update({
+                '{}_difference_mean'.format(col):differences.get_mean(),
+                '{}_difference_var'.format(col):differences.get_std()**2,
+                '{}_difference_sem'.format(col):differences.get_std() / \
+                    np.sqrt(differences.n),
+                '{}_difference_lower'.format(col):lower,
+                '{}_difference_upper'.format(col):upper,
+                '{}_independent_var'.format(col):scenario_results[col].var() +\
+                    baseline_results[col].var()})
+        results.append(row)
+
+    return pd.DataFrame(results)
@@ -0,0 +1,362 @@
+import random
+from statistics import NormalDist
+
+import numpy as np
+
+
+class KLLSketch():
+    '''
+    Mergeable quantile sketch (Karnin, Lang & Liberty 2016) with bounded
+    memory. Values are stored in a hierarchy of compactors, where values in
+    compactor h carry a weight of 2^h. If the sketch is full, the lowest full
+    compactor is sorted and every second value is promoted to the next
+    compactor. As long as no compaction has happened (fewer than k values),
+    the sketch stores all values and quantiles are exact.
+
+    k: integer, controls accuracy and memory. The rank error of quantiles is
+    of the order of 1 / k, the sketch stores about 3 * k values. Default = 200.
+
+    seed: integer, seed of the coin flips used for compactions, for
+    reproducible sketches. Default = 0.
+    '''
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.c = 2 / 3
+        self.random = random.Random(seed)
+        self.compactors = []
+        self.size = 0
+        self.max_size = 0
+        self.grow()
+
+    def grow(self):
+        self.compactors.append([])
+        self.max_size = sum([self.capacity(h) for h in \
+            range(len(self.compactors))])
+
+    def capacity(self, h):
+        depth = len(self.compactors) - h - 1
+        return int(np.ceil(self.c**depth * self.k)) + 1
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.size += 1
+        if self.size >= self.max_size:
+            self.compress()
+
+    def compress(self):
+        for h in range(len(self.compactors)):
+            if len(self.compactors[h]) >= self.capacity(h):
+                if h + 1 >= len(self.compactors):
+                    self.grow()
+                self.compactors[h + 1].extend(self.compact(h))
+                self.size = sum([len(c) for c in self.compactors])
+                break
+
+    def compact(self, h):
+        # sort the compactor and promote every second value, starting at a
+        # random offset. If the compactor holds an odd number of values, the
+        # smallest value stays in the compactor
+        values = sorted(self.compactors[h])
+        offset = self.random.randint(0, 1)
+        if len(values) % 2 == 1:
+            self.compactors[h] = values[0:1]
+            values = values[1:]
+        else:
+            self.compactors[h] = []
+        return values[offset::2]
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.grow()
+        for h, compactor in enumerate(other.compactors):
+            self.compactors[h].extend(compactor)
+        self.size = sum([len(c) for c in self.compactors])
+        while self.size >= self.max_size:
+            self.compress()
+
+    def count(self):
+        return sum([len(c) * 2**h for h, c in enumerate(self.compactors)])
+
+    def quantile(self, q):
+        '''
+        Returns the q-quantile of the values added to the sketch, using the
+        same linear interpolation between ranks as pandas.Series.quantile().
+        '''
+        n = self.count()
+        if n == 0:
+            return np.nan
+
+        values = np.asarray([v for c in self.compactors for v in c],
+                            dtype=float)
+        weights = np.asarray([2**h for h, c in enumerate(self.compactors) \
+                              for v in c])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        # index of the highest (0-based) rank covered by every value
+        last_rank = np.cumsum(weights[order]) - 1
+
+        rank = q * (n - 1)
+        lower = values[np.searchsorted(last_rank, np.floor(rank))]
+        upper = values[np.searchsorted(last_rank, np.ceil(rank))]
+        return lower + (rank - np.floor(rank)) * (upper - lower)
+
+
+
+class RunningStatistics():
+    '''
+    Online statistics of a single observable: exact count, mean and variance
+    (Welford's algorithm, merged with the parallel formula of Chan et al.) and
+    approximate quantiles through a KLLSketch. Missing values (None and NaN)
+    are ignored, as in pandas.
+    '''
+
+    def __init__(self, k=200):
+        self.n = 0
+        self.mean = 0.0
+        self.M2 = 0.0
+        self.sketch = KLLSketch(k)
+
+    def update(self, value):
+        if value == None:
+            return
+        value = float(value)
+        if np.isnan(value):
+            return
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.M2 += delta * (value - self.mean)
+        self.sketch.update(value)
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.M2 += other.M2 + delta**2 * self.n * other.n / n
+        self.n = n
+        self.sketch.merge(other.sketch)
+
+    def get_mean(self):
+        return self.mean if self.n > 0 else np.nan
+
+    def get_std(self):
+        return np.sqrt(self.M2 / (self.n - 1)) if self.n > 1 else np.nan
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def mean_confidence_interval(self, confidence=0.95):
+        if self.n < 2:
+            return (np.nan, np.nan)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        half_width = z * self.get_std() / np.sqrt(self.n)
+        return (self.mean - half_width, self.mean + half_width)
+
+    def quantile_confidence_interval(self, q, confidence=0.95):
+        # distribution-free interval from the order statistics whose ranks
+        # bracket the rank of the quantile (normal approximation of the
+        # binomial distribution of the number of values below the quantile)
+        if self.n < 2:
+            return (np.nan, np.nan)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        spread = z * np.sqrt(self.n * q * (1 - q))
+        lower = max(np.floor(self.n * q - spread), 0)
+        upper = min(np.ceil(self.n * q + spread), self.n - 1)
+        return (self.quantile(lower / (self.n - 1)),
+                self.quantile(upper / (self.n - 1)))
+
+
+
+class EnsembleStatistics():
+    '''
+    Online aggregator of the observables of all runs of an ensemble. Rows of
+    observables (as returned for example by
+    analysis_functions.get_ensemble_observables_school) are added one at a
+    time and are not stored. Aggregators of different parts of an ensemble
+    (for example computed by different workers) can be merged.
+
+    k: integer, accuracy parameter of the quantile sketches, see KLLSketch.
+    '''
+
+    def __init__(self, k=200):
+        self.k = k
+        # running statistics by observable, in the order in which the
+        # observables first appeared
+        self.observables = {}
+
+    def add(self, row):
+        for col, value in row.items():
+            if col not in self.observables:
+                self.observables[col] = RunningStatistics(self.k)
+            try:
+                self.observables[col].update(value)
+            except (TypeError, ValueError):
+                # non-numeric observables are not aggregated
+                pass
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def merge(self, other):
+        for col, stats in other.observables.items():
+            if col not in self.observables:
+                self.observables[col] = RunningStatistics(self.k)
+            self.observables[col].merge(stats)
+
+    def count(self):
+        return max([s.n for s in self.observables.values()] + [0])
+
+    def get_statistics(self, col):
+        '''
+        Returns the ensemble statistics of an observable with the same keys as
+        analysis_functions.get_statistics().
+        '''
+        stats = self.observables[col]
+        return {
+            '{}_mean'.format(col):stats.get_mean(),
+            '{}_median'.format(col):stats.quantile(0.5),
+            '{}_0.025'.format(col):stats.quantile(0.025),
+            '{}_0.75'.format(col):stats.quantile(0.75),
+            '{}_0.25'.format(col):stats.quantile(0.25),
+            '{}_0.975'.format(col):stats.quantile(0.975),
+            '{}_std'.format(col):stats.get_std(),
+        }
+
+    def parse_statistic(self, statistic):
+        # splits the column name of a statistic into the observable and either
+        # 'mean' or the quantile, for example 'infected_agents_median' into
+        # ('infected_agents', 0.5)
+        col, name = statistic.rsplit('_', 1)
+        if name == 'mean':
+            return col, name
+        elif name == 'median':
+            return col, 0.5
+        try:
+            return col, float(name)
+        except ValueError:
+            raise ValueError('unknown statistic {}'.format(statistic))
+
+    def get_value(self, statistic):
+        '''
+        Returns the value of a single ensemble statistic, given by its column
+        name as returned by get_statistics().
+        '''
+        col, q = self.parse_statistic(statistic)
+        if q == 'mean':
+            return self.observables[col].get_mean()
+        return self.observables[col].quantile(q)
+
+    def get_confidence_interval(self, statistic, confidence=0.95):
+        '''
+        Returns the confidence interval (lower, upper) of an ensemble
+        statistic, given by its column name as returned by get_statistics(),
+        for example 'infected_agents_median' or 'tests_per_day_per_agent_mean'.
+        Intervals of means use the normal approximation, intervals of the
+        median and other quantiles are based on order statistics.
+        '''
+        col, q = self.parse_statistic(statistic)
+        if q == 'mean':
+            return self.observables[col].mean_confidence_interval(confidence)
+        return self.observables[col].quantile_confidence_interval(q,
+                                                                  confidence)
+
+    def get_all_statistics(self):
+        row = {}
+        for col in self.observables.keys():
+            row.update(self.get_statistics(col))
+        return row
+
+
+
+class RunReservoir():
+    '''
+    Small reservoir of candidate runs of an ensemble, used to pick a
+    representative run (for example the run whose number of infected agents
+    is closest to the ensemble median) without keeping the models of all runs.
+    For every distinct value of the observable, the first run (lowest seed)
+    with that value is kept as a candidate. Candidates are stored with their
+    observable row and, for at most max_records candidates, a compact record
+    of the run (see analysis_functions.get_run_record()). Since runs are
+    reproducible from their seed, the record of any candidate without a
+    record can be recreated by running its seed again.
+
+    observable: string, observable that is compared to the ensemble
+    statistic. Default = 'infected_agents'.
+
+    get_record: function with the signature get_record(model, run) that
+    returns the compact record of a finished run. Default = None (no
+    records are kept).
+
+    max_records: integer, maximum number of records that are kept.
+    Default = 100.
+    '''
+
+    def __init__(self, observable='infected_agents', get_record=None,
+        max_records=100):
+        self.observable = observable
+        self.get_record = get_record
+        self.max_records = max_records
+        # {value:{'run':seed, 'row':observable row, 'record':record or None}}
+        self.candidates = {}
+
+    def spawn(self):
+        '''
+        Returns an empty reservoir with the same settings, for example to
+        collect the candidates of a block of runs in a worker process.
+        '''
+        return RunReservoir(self.observable, self.get_record,
+                            self.max_records)
+
+    def count_records(self):
+        return len([c for c in self.candidates.values() if \
+                    c['record'] != None])
+
+    def needs_record(self, row):
+        # a record is only created for runs that become the candidate of
+        # their value
+        value = row[self.observable]
+        return self.get_record != None and \
+            self.count_records() < self.max_records and \
+            (value not in self.candidates or \
+            (self.candidates[value]['record'] == None and \
+             row['run'] < self.candidates[value]['run']))
+
+    def add(self, row, model=None):
+        '''
+        Adds the observable row of a run. If the model of the run is given
+        and the run becomes a candidate, its record is stored as well.
+        '''
+        value = row[self.observable]
+        record = None
+        if model != None and self.needs_record(row):
+            record = self.get_record(model, row['run'])
+        self.add_candidate(value, {'run':row['run'], 'row':row,
+                                   'record':record})
+
+    def add_candidate(self, value, candidate):
+        if value not in self.candidates or \
+           candidate['run'] < self.candidates[value]['run']:
+            if candidate['record'] != None and \
+               self.count_records() >= self.max_records:
+                candidate = dict(candidate, record=None)
+            self.candidates[value] = candidate
+
+    def merge(self, other):
+        for value, candidate in other.candidates.items():
+            self.add_candidate(value, candidate)
+
+    def get_closest(self, target):
+        '''
+        Returns the candidate {'run', 'row', 'record'} whose value of the
+        observable is closest to the target (for example the ensemble
+        median). Ties are resolved in favour of the smaller value.
+        '''
+        if len(self.candidates) == 0:
+            return None
+        value = min(self.candidates.keys(),
+                    key=lambda v: (abs(v - target), v))
+        return self.candidates[value]
@@ -1,5 +1,6 @@
+import copy
+import random
 import numpy as np
-import networkx as nx
 from scipy.special import gamma
 from scipy.optimize import root_scalar
 
@@ -12,6 +13,7 @@ sys.path.insert(0,'school')
 sys.path.insert(0, 'nursing_home')
 
 from testing_strategy import Testing
+from contact_graph import ContactGraph, compile_graph
 from agent_resident import resident
 from agent_employee import employee
 from agent_student import student
@@ -105,18 +107,6 @@ def check_probability(var):
 	return var
 
 
-def check_graph(var):
-    assert type(var) == nx.Graph, 'not a networkx graph'
-    assert len(var.nodes) > 0, 'graph has no nodes'
-    assert len(var.edges) > 0, 'graph has no edges'
-    areas = [e[2]['contact_type'] for e in var.edges(data=True)]
-    areas = set(areas)
-    for a in areas:
-        assert a in {'very_far', 'far', 'intermediate',
-            'close'}, 'contact type {} not recognised'.format(a)
-    return var
-
-
 def check_index_case(var, agent_types):
 	allowed_strings = agent_types[:]
 	allowed_strings.extend(['continuous'])
@@ -160,6 +150,29 @@ def weibull_two_param(shape, scale):
     return scale * np.random.weibull(shape)
 
 
+# mutable state of agents and models that is stored in snapshots (see
+# SEIRX.snapshot). The epidemiological parameters of agents are part of the
+# state, since they are drawn at random when the agents are created
+AGENT_STATE = ['exposure_duration', 'time_until_symptoms', 'infection_duration',
+    'symptom_draw', 'exposed', 'infectious', 'symptomatic_course', 'symptoms',
+    'recovered', 'tested', 'pending_test', 'known_positive', 'quarantined',
+    'quarantine_start', 'sample', 'contact_to_infected', 'days_since_exposure',
+    'days_quarantined', 'days_since_tested', 'transmissions',
+    'transmission_targets']
+
+MODEL_STATE = ['Nstep', 'running', 'param_rerolls', 'new_positive_tests',
+    'screened_agents', 'screen_counters', 'days_since_last_agent_screen',
+    'scheduled_follow_up_screen', 'number_of_diagnostic_tests',
+    'number_of_preventive_screening_tests', 'undetected_infections',
+    'predetected_infections', 'pending_test_infections',
+    'quarantine_counters', 'crn_seed']
+
+# identifiers of the independent random number streams used in common random
+# numbers mode (see SEIRX)
+CRN_STREAMS = {'index_case':0, 'epi_params':1, 'transmission':2,
+               'external_infection':3}
+
+
 class SEIRX(Model):
     '''
     A model with a number of different agents that reproduces
@@ -172,7 +185,14 @@ class SEIRX(Model):
     Nodes have to have the node attribute 'type' which specifies the agent type
     of the given node (for example 'student' or 'teacher' in a school scenario).
     In addition, nodes can have the attribute 'unit', which assigns them to a
-    unit in space (for example a 'class' in a school scenario).
+    unit in space (for example a 'class' in a school scenario). Alternatively,
+    a ContactGraph (see contact_graph.py) with the same attributes. The graph
+    is compiled once and the compiled graph is shared by all models created
+    from the same graph (see contact_graph.compile_graph()). A graph that is
+    changed in place after a model was created from it is only compiled again
+    if its number of nodes or edges or the contact types of its edges
+    changed. Pass a copy of the graph after other changes (for example to
+    node attributes).
 
     verbosity: integer in [0, 1, 2], controls text output to std out to track
     simulation progress and transmission dynamics. Default = 0.
@@ -295,6 +315,17 @@ class SEIRX(Model):
     seed: positive integer, fixes the seed of the simulation to enable
     repeatable simulation runs. If seed = None, the simulation will be 
     initialized at random.
+
+    crn: bool, default = False. Common random numbers mode for the comparison
+    of interventions. If True, the index case, the epidemiological parameters
+    and the symptom course of every agent, the external infections per day and
+    agent and the transmission draws per day and contact (edge) are taken from
+    separate random number streams that only depend on the seed and not on
+    the course of the simulation. Two models with the same seed and contact
+    network that only differ in their testing strategy therefore share the
+    same randomness, and differences between them are only caused by the
+    interventions. Test outcomes and the timing of preventive screens still
+    use the regular random number generator of the model.
     '''
 
     def __init__(self, G, verbosity, testing,
@@ -305,7 +336,7 @@ class SEIRX(Model):
         preventive_screening_test_type,
         follow_up_testing_interval, liberating_testing,
         index_case, agent_types, age_transmission_risk_discount,
-        age_symptom_discount, seed=None):
+        age_symptom_discount, seed=None, crn=False):
 
         # mesa models already implement fixed seeds through their own random
         # number generations. Sadly, we need to use the Weibull distribution
@@ -315,6 +346,44 @@ class SEIRX(Model):
         if seed != None:
             np.random.seed(seed)
 
+        # mesa stores the random number generator as an attribute of the
+        # model class, which is shared between all instances of the class.
+        # Every model gets its own generator (with the same random numbers),
+        # such that several models can be simulated side by side, for example
+        # forks of a snapshot
+        self.random = random.Random(seed)
+
+        # constructor parameters, used to create forks of the model (see
+        # fork())
+        self.params = {'verbosity':verbosity, 'testing':testing,
+            'exposure_duration':exposure_duration,
+            'time_until_symptoms':time_until_symptoms,
+            'infection_duration':infection_duration,
+            'quarantine_duration':quarantine_duration,
+            'subclinical_modifier':subclinical_modifier,
+            'infection_risk_contact_type_weights':\
+                infection_risk_contact_type_weights,
+            'K1_contact_types':K1_contact_types,
+            'diagnostic_test_type':diagnostic_test_type,
+            'preventive_screening_test_type':preventive_screening_test_type,
+            'follow_up_testing_interval':follow_up_testing_interval,
+            'liberating_testing':liberating_testing,
+            'index_case':index_case, 'agent_types':agent_types,
+            'age_transmission_risk_discount':age_transmission_risk_discount,
+            'age_symptom_discount':age_symptom_discount,
+            'seed':seed, 'crn':crn}
+
+        # common random numbers mode: all random draws that should be shared
+        # between scenarios are derived from the seed and the purpose of the
+        # draw (see get_crn_generator)
+        self.crn = check_bool(crn)
+        if self.crn:
+            self.crn_seed = seed if seed != None else \
+                self.random.randrange(2**32)
+            # random draws of the current day for transmissions along every
+            # directed edge and for external infections of every agent
+            self.crn_draws = {}
+
     	# sets the level of detail of text output to stdout (0 = no output)
         self.verbosity = check_positive_int(verbosity)
         # flag to turn off the testing & tracing strategy
@@ -372,12 +441,33 @@ class SEIRX(Model):
             check_discount(age_symptom_discount)
 
         ## agents and their interactions
-        # interaction graph of agents
-        self.G = check_graph(G)
-        # add weights as edge attributes so they can be visualised easily
-        for e in G.edges(data=True):
-            G[e[0]][e[1]]['weight'] = self.infection_risk_contact_type_weights\
-            	[G[e[0]][e[1]]['contact_type']]
+        # interaction graph of agents, a networkx graph or a contact graph in
+        # the compact format (see contact_graph.py). The graph is validated
+        # and compiled once per graph and set of contact type weights, all
+        # models created from the same graph share the compiled graph (see
+        # contact_graph.compile_graph()). Contact graphs are compiled from
+        # their arrays, their networkx version is only created if it is
+        # needed (see G). The graph itself is not modified
+        self.contact_graph = G
+        self.compiled_graph = compile_graph(G,
+            self.infection_risk_contact_type_weights)
+
+        # stable mapping of node IDs to contiguous integer indices, in the
+        # order of the nodes in the contact graph. Agents, transmission logs
+        # and all lookups during the simulation use the indices, node IDs are
+        # only needed to export results (see get_node_ID())
+        self.node_IDs = self.compiled_graph.node_IDs
+        self.node_index = self.compiled_graph.node_index
+        # neighbours of every node as {neighbour index:contact type} and
+        # {neighbour index:weight of the contact type}
+        self.contact_types = self.compiled_graph.contact_types
+        self.contact_weights = self.compiled_graph.weights
+
+        # in common random numbers mode, every node (by its index) and every
+        # directed edge gets a fixed position in the arrays of random draws
+        # of a day
+        if self.crn:
+            self.crn_edge_index = self.compiled_graph.get_edge_index()
 
         # extract the different agent types from the contact graph
         self.agent_types = list(agent_types.keys())
@@ -448,14 +538,20 @@ class SEIRX(Model):
         ## add agents
         # extract the agent nodes from the graph and add them to the scheduler
         for agent_type in self.agent_types:
-            IDs = [x for x,y in G.nodes(data=True) if y['type'] == agent_type]
+            IDs = self.compiled_graph.get_nodes(agent_type)
             self.num_agents.update({agent_type:len(IDs)})
 
             # get the agent locations (units) from the graph node attributes
-            units = [self.G.nodes[ID]['unit'] for ID in IDs]
+            units = [self.compiled_graph.node_units[self.node_index[ID]] \
+                     for ID in IDs]
             for ID, unit in zip(IDs, units):
 
                 tmp_epi_params = {}
+                # in common random numbers mode, every agent draws its
+                # parameters from its own stream
+                if self.crn:
+                    agent_rng = self.get_crn_generator('epi_params',
+                        self.node_index[ID])
                 # for each of the three epidemiological parameters, check if
                 # the parameter is an integer (if yes, pass it directly to the
                 # agent constructor), or if it is specified by the shape and 
@@ -468,6 +564,10 @@ class SEIRX(Model):
                         if isinstance(param, int):
                             tmp_epi_params[param_name] = param
 
+                        elif self.crn:
+                            tmp_epi_params[param_name] = \
+                                round(param[1] * agent_rng.weibull(param[0]))
+
                         else:
                             tmp_epi_params[param_name] = \
                                 round(weibull_two_param(param[0], param[1]))
@@ -489,14 +589,30 @@ class SEIRX(Model):
                     tmp_epi_params['time_until_symptoms'], 
                     tmp_epi_params['infection_duration'], 
                     verbosity)
+                if self.crn:
+                    # draw that decides on a symptomatic disease course
+                    a.symptom_draw = agent_rng.random()
                 self.schedule.add(a)
 
+        # agents by node index (None for nodes that are not agents) and the
+        # position of every agent in the schedule, which determines the order
+        # in which agents interact with their contacts
+        self.agents_by_index = [None] * len(self.node_IDs)
+        self.schedule_positions = [None] * len(self.node_IDs)
+        for position, a in enumerate(self.schedule.agents):
+            self.agents_by_index[a.index] = a
+            self.schedule_positions[a.index] = position
+
 		# infect the first agent in single index case mode
         if self.index_case != 'continuous':
             infection_targets = [
                 a for a in self.schedule.agents if a.type == index_case]
             # pick a random agent to infect in the selected agent group
-            target = self.random.randint(0, len(infection_targets) - 1)
+            if self.crn:
+                target = int(self.get_crn_generator('index_case')\
+                    .integers(0, len(infection_targets)))
+            else:
+                target = self.random.randint(0, len(infection_targets) - 1)
             infection_targets[target].exposed = True
             if self.verbosity > 0:
                 print('{} exposed: {}'.format(index_case,
@@ -513,6 +629,10 @@ class SEIRX(Model):
             'reactive':{agent_type: False for agent_type in self.agent_types},
             'follow_up':{agent_type: False for agent_type in self.agent_types},
             'preventive':{agent_type: False for agent_type in self.agent_types}}
+        # dictionary of counters of the screens of every type per agent group
+        self.screen_counters = {
+            screen_type:{agent_type: 0 for agent_type in self.agent_types} \
+            for screen_type in ['reactive', 'follow_up', 'preventive']}
 
 
         # dictionary of counters that count the days since a given agent group
@@ -569,6 +689,191 @@ class SEIRX(Model):
                 })
 
 
+    def __getstate__(self):
+        # the views of the compiled graph that the model keeps for fast access
+        # cannot be pickled or copied, they are restored from the compiled
+        # graph by __setstate__()
+        state = dict(self.__dict__)
+        for key in ['node_index', 'contact_types', 'contact_weights']:
+            state.pop(key, None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.node_index = self.compiled_graph.node_index
+        self.contact_types = self.compiled_graph.contact_types
+        self.contact_weights = self.compiled_graph.weights
+
+
+    def snapshot(self):
+        '''
+        Returns a snapshot of the current state of the simulation: the state
+        of all agents, the testing and screening state and counters of the
+        model, the step counters of the schedule, the history of the
+        DataCollector and the state of the random number generators. The
+        contact network is not copied. The records of the DataCollector are
+        never modified once they are collected and are shared with the model
+        instead of being copied. See fork() to continue a simulation from a
+        snapshot.
+        '''
+        agents = {}
+        for a in self.schedule.agents:
+            state = {key:a.__dict__[key] for key in AGENT_STATE if \
+                     key in a.__dict__}
+            state['transmission_targets'] = dict(a.transmission_targets)
+            agents[a.index] = state
+
+        model_state = {key:copy.deepcopy(self.__dict__[key]) for key in \
+                       MODEL_STATE if key in self.__dict__}
+        model_state['newly_positive_agents'] = \
+            [a.index for a in self.newly_positive_agents]
+
+        return {'model_class':type(self),
+                'G':self.contact_graph,
+                'params':self.params,
+                'model':model_state,
+                'agents':agents,
+                'schedule':{'steps':self.schedule.steps,
+                            'time':self.schedule.time},
+                'datacollector':{
+                    'model_vars':{var:list(values) for var, values in \
+                                  self.datacollector.model_vars.items()},
+                    'agent_records':dict(\
+                                  self.datacollector._agent_records)},
+                'random_state':self.random.getstate(),
+                'np_random_state':np.random.get_state()}
+
+
+    @classmethod
+    def fork(cls, snapshot, **param_overrides):
+        '''
+        Creates a new model that continues the simulation from a snapshot
+        (see snapshot()). Constructor parameters can be overridden, for
+        example to change the testing strategy, test types or screening
+        intervals (agent_types) from the time of the snapshot on. Parameters
+        that determine the epidemiological state (for example the
+        durations) are part of the snapshot and cannot be changed. If a seed
+        is given, the random number generators are reseeded with it, otherwise
+        the fork continues with the random numbers of the snapshot. The fork
+        continues the step counters of the snapshot and its DataCollector
+        starts with the history of the snapshot, such that the agent states,
+        transmission chain and visualisations of a fork cover the whole
+        simulation, including the days before the snapshot.
+        '''
+        params = dict(snapshot['params'])
+        params.update(param_overrides)
+        model = snapshot['model_class'](snapshot['G'], **params)
+
+        for key, value in snapshot['model'].items():
+            if key != 'newly_positive_agents':
+                setattr(model, key, copy.deepcopy(value))
+
+        for index, state in snapshot['agents'].items():
+            agent = model.agents_by_index[index]
+            agent.__dict__.update(state)
+            agent.transmission_targets = dict(state['transmission_targets'])
+        model.newly_positive_agents = [model.agents_by_index[index] for \
+            index in snapshot['model']['newly_positive_agents']]
+
+        model.schedule.steps = snapshot['schedule']['steps']
+        model.schedule.time = snapshot['schedule']['time']
+        # the fork appends to its own lists and dictionary of records, the
+        # records of the days before the snapshot are shared
+        for var, values in snapshot['datacollector']['model_vars'].items():
+            if var in model.datacollector.model_vars:
+                model.datacollector.model_vars[var] = list(values)
+        model.datacollector._agent_records = \
+            dict(snapshot['datacollector']['agent_records'])
+
+        if 'seed' in param_overrides and param_overrides['seed'] != None:
+            seed = param_overrides['seed']
+            model.random.seed(seed)
+            np.random.seed(seed)
+            if model.crn:
+                model.crn_seed = seed
+        else:
+            model.random.setstate(snapshot['random_state'])
+            np.random.set_state(snapshot['np_random_state'])
+        if model.crn:
+            model.crn_draws = {}
+
+        return model
+
+
+    @property
+    def G(self):
+        '''
+        networkx version of the contact network, for example for analysis
+        and visualisation. Contact graphs in the compact format are converted
+        when the networkx graph is first needed, the conversion is shared by
+        all models created from the same contact graph (see
+        ContactGraph.get_networkx()).
+        '''
+        if isinstance(self.contact_graph, ContactGraph):
+            return self.contact_graph.get_networkx()
+        return self.contact_graph
+
+
+    def get_crn_generator(self, stream, *keys):
+        '''
+        Returns a numpy random number generator for common random numbers
+        mode that only depends on the seed of the model, the purpose of the
+        random numbers (one of CRN_STREAMS) and additional integer keys (for
+        example the index of an agent or the day).
+        '''
+        return np.random.default_rng([self.crn_seed, CRN_STREAMS[stream]] + \
+                                     list(keys))
+
+
+    def get_crn_draw(self, stream, index):
+        '''
+        Returns the uniform random number of the current day with the given
+        index in a stream of daily draws ('transmission' for directed edges,
+        'external_infection' for agents). Draws of a day are generated in a
+        single batch the first time they are needed.
+        '''
+        if self.crn_draws.get(stream, (None, None))[0] != self.Nstep:
+            N = len(self.crn_edge_index) if stream == 'transmission' else \
+                len(self.node_IDs)
+            self.crn_draws[stream] = (self.Nstep,
+                self.get_crn_generator(stream, self.Nstep).random(N))
+        return self.crn_draws[stream][1][index]
+
+
+    def get_transmission_draw(self, source, target):
+        return self.get_crn_draw('transmission',
+            self.crn_edge_index[(source, target)])
+
+
+    def get_external_infection_draw(self, index):
+        return self.get_crn_draw('external_infection', index)
+
+
+    def get_node_ID(self, index):
+        return self.node_IDs[index]
+
+
+    def get_agent(self, ID):
+        return self.agents_by_index[self.node_index[ID]]
+
+
+    def get_neighbours(self, index, agent_type=None, contact_types=None):
+        '''
+        Returns the agents that share an edge with the node with the given
+        index in the contact network, in the order of the schedule. The
+        neighbours can be restricted to an agent type and to a list of
+        contact types.
+        '''
+        neighbours = [self.agents_by_index[j] for j, contact_type in \
+            self.contact_types[index].items() if contact_types == None or \
+            contact_type in contact_types]
+        neighbours = [a for a in neighbours if a != None and \
+                      (agent_type == None or a.type == agent_type)]
+        neighbours.sort(key=lambda a: self.schedule_positions[a.index])
+        return neighbours
+
+
     def get_risk_age_modifier(self, age):
         '''linear function such that at age 18 the risk is that of an adult (=1).
         The slope of the line needs to be calibrated.
@@ -642,6 +947,7 @@ class SEIRX(Model):
 
         if len(untested_agents) > 0:
             self.screened_agents[screen_type][agent_group] = True
+            self.screen_counters[screen_type][agent_group] += 1
             self.days_since_last_agent_screen[agent_group] = 0
 
             for a in untested_agents:
@@ -674,9 +980,8 @@ class SEIRX(Model):
         # find all agents that share edges with the agent
         # that are classified as K1 contact types in the testing
         # strategy
-        K1_contacts = [e[1] for e in self.G.edges(a.ID, data=True) if
-            e[2]['contact_type'] in self.Testing.K1_contact_types]
-        K1_contacts = [a for a in self.schedule.agents if a.ID in K1_contacts]
+        K1_contacts = self.get_neighbours(a.index,
+            contact_types=self.Testing.K1_contact_types)
 
         for K1_contact in K1_contacts:
             if self.verbosity > 0:
@@ -67,10 +67,8 @@ class resident(agent_SEIRX):
 
     def get_resident_resident_contacts(self):
         # resident <-> resident contacts are determined by the contact network
-        # get a list of neighbor IDs from the interaction network
-        contacts = [tup[1] for tup in list(self.model.G.edges(self.ID))]
-        # get the neighboring agents from the scheduler using their IDs
-        contacts = [a for a in self.model.schedule.agents if a.ID in contacts]
+        # get the neighboring agents from the interaction network
+        contacts = self.model.get_neighbours(self.index)
         return contacts
 
 
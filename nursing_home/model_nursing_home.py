@@ -149,7 +149,7 @@ class SEIRX_nursing_home(SEIRX):
                               'reception_risk': 0.015}},
         age_transmission_risk_discount = {'slope':None, 'intercept':1},
         age_symptom_discount = {'slope':None, 'intercept':0.6},
-        seed=None):
+        seed=None, crn=False):
 
         super().__init__(G, verbosity, testing,
             exposure_duration, time_until_symptoms, infection_duration,
@@ -159,7 +159,7 @@ class SEIRX_nursing_home(SEIRX):
             preventive_screening_test_type,
             follow_up_testing_interval, liberating_testing,
             index_case, agent_types, age_transmission_risk_discount,
-            age_symptom_discount, seed)
+            age_symptom_discount, seed, crn)
 
 
 
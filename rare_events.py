@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+
+
+def count_cumulative_infections(model, agent_types=None):
+    '''
+    Counts the agents that have been infected so far (exposed, infectious or
+    recovered), optionally only for the given list of agent types.
+    '''
+    return len([a for a in model.schedule.agents if \
+        (agent_types == None or a.type in agent_types) and \
+        (a.exposed or a.infectious or a.recovered)])
+
+
+def outbreak_is_over(model):
+    return len([a for a in model.schedule.agents if \
+        (a.exposed == True or a.infectious == True)]) == 0
+
+
+def clone_model(state, seed):
+    '''
+    Returns an independent model that continues the simulation from a
+    snapshot of a model (see SEIRX.snapshot()) with new random numbers drawn
+    from the given seed. The contact network is shared between all clones.
+    '''
+    return state['model_class'].fork(state, seed=seed)
+
+
+def run_until_level(model, level, N_steps, score):
+    '''
+    Runs a model until the score (for example the cumulative number of
+    infections) reaches the level, the outbreak is over or the model has
+    reached N_steps steps. Returns True if the level has been reached.
+    '''
+    while model.Nstep < N_steps:
+        if score(model) >= level:
+            return True
+        if outbreak_is_over(model):
+            return False
+        model.step()
+    return score(model) >= level
+
+
+def estimate_splitting(scenario, levels, N_per_level, seed, score=None):
+    '''
+    A single estimate of the probabilities that the score of a run of the
+    scenario reaches each of the given (increasing) levels, using fixed
+    effort multilevel splitting: N_per_level runs are started from scratch
+    and run until they reach the first level. For every following level,
+    N_per_level runs are continued from states that are drawn uniformly (with
+    replacement) from the states that reached the previous level, each with
+    new random numbers. States are stored as snapshots (see SEIRX.snapshot())
+    and continued as forks of the snapshot. The probability to reach level i
+    is the product of the fractions of runs that reached the levels 1 to i,
+    which is an unbiased estimator.
+
+    Returns the list of estimated probabilities of all levels and the number
+    of simulated steps.
+    '''
+    if score == None:
+        score = count_cumulative_infections
+
+    rng = np.random.default_rng(seed)
+    N_steps = 0
+
+    # states that reached the last level. Initially, every run starts from a
+    # newly created model
+    states = None
+    probability = 1
+    probabilities = []
+    for level in levels:
+        successes = []
+        if states == None or len(states) > 0:
+            for n in range(N_per_level):
+                run_seed = int(rng.integers(2**31))
+                if states == None:
+                    model = scenario.create_model(run_seed)
+                else:
+                    model = clone_model(states[rng.integers(len(states))],
+                                        run_seed)
+                start = model.Nstep
+                if run_until_level(model, level, scenario.N_steps, score):
+                    successes.append(model.snapshot())
+                N_steps += model.Nstep - start
+
+        probability *= len(successes) / N_per_level
+        probabilities.append(probability)
+        states = successes
+
+    return probabilities, N_steps
+
+
+def run_splitting(scenario, levels, N_per_level=100, repetitions=10,
+    first_seed=0, confidence=0.95, score=None):
+    '''
+    Estimates the tail probabilities P(score >= level) of the runs of a
+    scenario for a list of increasing levels (for example cumulative numbers
+    of infections) with multilevel splitting (see estimate_splitting()).
+    Runs that reach a level are cloned to explore the rare large outbreaks,
+    instead of spending most of the simulation time on outbreaks that end
+    after the index case. The estimate is repeated independently repetitions
+    times (with the seeds first_seed to first_seed + repetitions - 1), the
+    confidence intervals are based on the spread of the repetitions.
+
+    score: function with the signature score(model) that is monotonically
+    increasing during a run. Default = count_cumulative_infections. Use for
+    example lambda model: count_cumulative_infections(model, ['resident'])
+    to estimate the probability of more than a number of infected residents.
+
+    Returns a data frame with one row per level that contains the estimated
+    probability, its standard error and confidence interval and the number of
+    simulated steps of all repetitions.
+    '''
+    levels = sorted(levels)
+    estimates = []
+    N_steps = 0
+    for repetition in range(repetitions):
+        probabilities, repetition_steps = estimate_splitting(scenario, levels,
+            N_per_level, first_seed + repetition, score)
+        estimates.append(probabilities)
+        N_steps += repetition_steps
+    estimates = np.asarray(estimates)
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    probability = estimates.mean(axis=0)
+    if repetitions > 1:
+        sem = estimates.std(axis=0, ddof=1) / np.sqrt(repetitions)
+    else:
+        sem = np.nan * probability
+
+    return pd.DataFrame({'level':levels,
+                         'probability':probability,
+                         'sem':sem,
+                         'lower':np.maximum(probability - z * sem, 0),
+                         'upper':np.minimum(probability + z * sem, 1),
+                         'repetitions':repetitions,
+                         'N_steps':N_steps})
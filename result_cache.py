@@ -0,0 +1,252 @@
+import os
+import json
+import hashlib
+import argparse
+from os.path import join, getsize, getmtime, isfile, dirname, abspath
+
+import numpy as np
+
+
+# simulation source files whose content defines the outcome of a model run.
+# Changing any of these files changes the code version and therefore
+# invalidates all cached results that were computed with the old code
+SOURCE_FILES = ['model_SEIRX.py', 'agent_SEIRX.py', 'testing_strategy.py',
+                'analysis_functions.py', 'contact_graph.py',
+                'nursing_home/model_nursing_home.py',
+                'nursing_home/agent_resident.py',
+                'nursing_home/agent_employee.py',
+                'school/model_school.py',
+                'school/agent_student.py',
+                'school/agent_teacher.py',
+                'school/agent_family_member.py']
+
+REPOSITORY_PATH = dirname(abspath(__file__))
+
+
+def to_builtin(obj):
+    '''
+    Converts numpy scalars and arrays to native python types, so they can be
+    serialized to JSON. Used as the "default" argument of json.dump()
+    '''
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=repr)
+    return repr(obj)
+
+
+def hash_parameters(params):
+    '''
+    Returns a sha256 hex digest of a (nested) dictionary of parameters. Keys
+    are sorted, such that the hash does not depend on insertion order.
+    '''
+    s = json.dumps(params, sort_keys=True, default=to_builtin)
+    return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+
+def hash_graph(G):
+    '''
+    Returns a sha256 hex digest of the contents of a networkx graph, i.e. all
+    nodes and edges together with their attributes. The edge attribute
+    'weight' is ignored, since it is derived from the contact type (earlier
+    versions of the SEIRX model wrote it to the graph). Contact graphs in
+    the compact format (see contact_graph.py) have the same hash as the
+    networkx graph they represent.
+    '''
+    if hasattr(G, 'get_networkx'):
+        G = G.get_networkx()
+    h = hashlib.sha256()
+    nodes = sorted(G.nodes(data=True), key=lambda n: str(n[0]))
+    for ID, data in nodes:
+        h.update(json.dumps([ID, data], sort_keys=True,
+            default=to_builtin).encode('utf-8'))
+
+    edges = [tuple(sorted((str(u), str(v)))) + \
+             (json.dumps({key:val for key, val in data.items() if \
+                key != 'weight'}, sort_keys=True, default=to_builtin),)
+             for u, v, data in G.edges(data=True)]
+    edges.sort()
+    for e in edges:
+        h.update(json.dumps(e).encode('utf-8'))
+
+    return h.hexdigest()
+
+
+def get_code_version(extra_files=[]):
+    '''
+    Returns a sha256 hex digest of the source code of the simulation (see
+    SOURCE_FILES) and of additional source files (for example the module in
+    which a custom observable function is defined), together with the version
+    of mesa.
+    '''
+    import mesa
+    h = hashlib.sha256()
+    h.update(mesa.__version__.encode('utf-8'))
+
+    files = [join(REPOSITORY_PATH, f) for f in SOURCE_FILES]
+    files.extend([abspath(f) for f in extra_files if f != None])
+    for f in sorted(set(files)):
+        if isfile(f):
+            with open(f, 'rb') as src:
+                h.update(src.read())
+
+    return h.hexdigest()
+
+
+
+class ResultCache():
+    '''
+    Content-addressed on-disk cache for the per-run observables of simulation
+    ensembles. Every cache entry is a JSON file named after its key that stores
+    the list of observable rows (one row per run) of an ensemble, together with
+    the key of the scenario and the seed range that produced them.
+
+    path: string, directory in which cache entries are stored. Will be created
+    if it does not exist.
+
+    max_size: integer, maximum size of the cache on disk in bytes. If the cache
+    grows larger than max_size, the least recently used entries are evicted.
+    If max_size = None, entries are never evicted. Default = 1 GB.
+    '''
+
+    def __init__(self, path, max_size=1024**3):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_entry_path(self, key):
+        return join(self.path, '{}.json'.format(key))
+
+    def entries(self):
+        return [join(self.path, f) for f in os.listdir(self.path) \
+                if f.endswith('.json')]
+
+    def size(self):
+        return sum([getsize(f) for f in self.entries()])
+
+    def get(self, key):
+        '''
+        Returns the observable rows stored under key or None, if there is no
+        such entry. A hit marks the entry as recently used.
+        '''
+        entry_path = self.get_entry_path(key)
+        try:
+            with open(entry_path, 'r') as entry_file:
+                entry = json.load(entry_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        # the modification time of an entry is used as its last access time
+        # for the LRU eviction, since access times are unreliable on many
+        # file systems
+        os.utime(entry_path)
+        return entry['rows']
+
+    def put(self, key, rows, scenario=None, seeds=None):
+        '''
+        Stores the observable rows of an ensemble under key. The file is first
+        written to a temporary location and then moved, such that concurrent
+        readers never see a partially written entry.
+        '''
+        entry = {'scenario':scenario,
+                 'seeds':seeds,
+                 'rows':rows}
+        entry_path = self.get_entry_path(key)
+        tmp_path = entry_path + '.{}.tmp'.format(os.getpid())
+        with open(tmp_path, 'w') as entry_file:
+            json.dump(entry, entry_file, default=to_builtin)
+        os.replace(tmp_path, entry_path)
+
+        self.evict()
+
+    def evict(self, max_size=None):
+        '''
+        Removes the least recently used entries until the cache is smaller
+        than max_size (defaults to the max_size of the cache).
+        Returns the number of removed entries.
+        '''
+        if max_size == None:
+            max_size = self.max_size
+        if max_size == None:
+            return 0
+
+        entries = [(getmtime(f), getsize(f), f) for f in self.entries()]
+        entries.sort()
+        total_size = sum([e[1] for e in entries])
+
+        removed = 0
+        for mtime, size, f in entries:
+            if total_size <= max_size:
+                break
+            # entries might have been removed by another process in the
+            # meantime
+            try:
+                os.remove(f)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+        return removed
+
+    def invalidate(self, key=None, scenario=None):
+        '''
+        Removes cache entries. If a key is given, only the entry with this key
+        is removed. If a scenario key is given, all entries that were computed
+        for this scenario (regardless of the seed range) are removed. If
+        neither is given, the whole cache is cleared.
+        Returns the number of removed entries.
+        '''
+        if key != None:
+            try:
+                os.remove(self.get_entry_path(key))
+                return 1
+            except FileNotFoundError:
+                return 0
+
+        removed = 0
+        for f in self.entries():
+            if scenario != None:
+                try:
+                    with open(f, 'r') as entry_file:
+                        entry_scenario = json.load(entry_file)['scenario']
+                except (FileNotFoundError, json.JSONDecodeError):
+                    entry_scenario = None
+                if entry_scenario != scenario:
+                    continue
+            try:
+                os.remove(f)
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+        return removed
+
+
+if __name__ == '__main__':
+    # command line interface to inspect and invalidate a result cache, e.g.
+    # python result_cache.py ../data/school/cache --invalidate
+    parser = argparse.ArgumentParser(description='inspect and invalidate '+\
+        'the on-disk cache of simulation ensemble results')
+    parser.add_argument('path', help='directory of the cache')
+    parser.add_argument('--invalidate', action='store_true',
+        help='remove entries (all entries if no --key or --scenario is given)')
+    parser.add_argument('--key', default=None,
+        help='only remove the entry with the given key')
+    parser.add_argument('--scenario', default=None,
+        help='only remove entries computed for the given scenario key')
+    parser.add_argument('--max-size', type=int, default=None,
+        help='evict least recently used entries until the cache is smaller '+\
+             'than the given size in bytes')
+    args = parser.parse_args()
+
+    cache = ResultCache(args.path, max_size=None)
+    if args.invalidate:
+        removed = cache.invalidate(key=args.key, scenario=args.scenario)
+        print('removed {} entries'.format(removed))
+    if args.max_size != None:
+        removed = cache.evict(args.max_size)
+        print('evicted {} entries'.format(removed))
+    print('{} entries, {} bytes'.format(len(cache.entries()), cache.size()))
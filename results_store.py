@@ -0,0 +1,253 @@
+import os
+import json
+import uuid
+import argparse
+from os.path import join, exists
+
+import numpy as np
+import pandas as pd
+
+from result_cache import hash_parameters, to_builtin
+
+
+class ResultsStore():
+    '''
+    Columnar on-disk store of simulation results. Rows of observables (for
+    example the rows of single runs returned by
+    analysis_functions.get_ensemble_observables_school or the rows of
+    ensemble statistics returned by ensemble_runner.run_sweep) are stored in
+    partitions, one partition per combination of scenario parameters (for
+    example school type, test type, index case and screening intervals).
+    Every call of append() writes a new chunk to a partition, in which every
+    column is stored as a separate NumPy .npy file.
+
+    The scenario parameters of all partitions are kept in a small index file,
+    such that queries only read the index and the requested columns of the
+    matching partitions. No other partition is opened.
+
+    Directory layout:
+        index.json                          parameters and chunks of all
+                                            partitions
+        partitions/<partition>/<chunk>/     one .npy file per column
+
+    The store assumes a single writing process at a time.
+
+    path: string, directory of the store. Will be created with the first
+    append, if it does not exist.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        # {partition:{'params':dict, 'chunks':[[chunk, rows], ...],
+        # 'rows':int, 'columns':[column, ...]}}
+        self.partitions = {}
+        try:
+            with open(join(self.path, 'index.json'), 'r') as index_file:
+                self.partitions = json.load(index_file)['partitions']
+        except FileNotFoundError:
+            pass
+
+    def save_index(self):
+        # the index is replaced atomically, such that an interrupted append
+        # leaves an orphaned chunk directory but never a corrupted index
+        tmp_path = join(self.path, 'index.json.tmp')
+        with open(tmp_path, 'w') as index_file:
+            json.dump({'partitions':self.partitions}, index_file,
+                      default=to_builtin)
+        os.replace(tmp_path, join(self.path, 'index.json'))
+
+    def get_partition(self, params):
+        return hash_parameters(normalize_parameters(params))[0:16]
+
+    def append(self, params, rows):
+        '''
+        Appends rows of observables to the partition of the given scenario
+        parameters.
+
+        params: dictionary of scenario parameters, for example
+        {'school_type':'primary', 'test_type':'PCR', 'turnover':1,
+         'index_case':'teacher', 'screen_frequency_teacher':7, ...}.
+        Values have to be JSON serializable and are normalized (see
+        normalize_parameters()), such that for example 7, 7.0 and np.int64(7)
+        belong to the same partition.
+
+        rows: list of dictionaries of observables or a data frame.
+        '''
+        rows = pd.DataFrame(rows)
+        if len(rows) == 0:
+            return
+
+        params = normalize_parameters(params)
+        partition = self.get_partition(params)
+        if partition not in self.partitions:
+            self.partitions[partition] = {'params':params, 'chunks':[],
+                                          'rows':0, 'columns':[]}
+        entry = self.partitions[partition]
+
+        # chunks get a unique name, such that the chunk directory of an
+        # interrupted append (files written, index not saved) is never reused
+        chunk = '{:06d}-{}'.format(len(entry['chunks']), uuid.uuid4().hex[0:8])
+        chunk_path = join(self.path, 'partitions', partition, chunk)
+        os.makedirs(chunk_path)
+        for col in rows.columns:
+            np.save(join(chunk_path, '{}.npy'.format(col)),
+                    to_column(rows[col]), allow_pickle=False)
+
+        entry['chunks'].append([chunk, len(rows)])
+        entry['rows'] += len(rows)
+        entry['columns'] += [col for col in rows.columns if \
+                             col not in entry['columns']]
+        self.save_index()
+
+    def append_frame(self, df, param_columns):
+        '''
+        Appends a data frame that contains the scenario parameters as columns
+        (for example the result of ensemble_runner.run_sweep()). Rows are
+        split into partitions by the values of the param_columns.
+        '''
+        for values, rows in df.groupby(param_columns, sort=False,
+                                       dropna=False):
+            if len(param_columns) == 1:
+                values = [values]
+            params = dict(zip(param_columns, values))
+            self.append(params, rows.drop(columns=param_columns))
+
+    def find(self, **filters):
+        '''
+        Returns the list of partitions whose scenario parameters match all
+        filters. A filter is either a single value or a list (or tuple or
+        set) of accepted values of a scenario parameter.
+        '''
+        partitions = []
+        for partition, entry in self.partitions.items():
+            match = True
+            for param, accepted in filters.items():
+                if param not in entry['params']:
+                    match = False
+                    break
+                value = entry['params'][param]
+                if isinstance(accepted, (list, tuple, set)):
+                    if value not in accepted:
+                        match = False
+                elif value != accepted:
+                    match = False
+            if match:
+                partitions.append(partition)
+        return partitions
+
+    def get_scenarios(self, **filters):
+        '''
+        Returns a data frame with the scenario parameters and the number of
+        stored rows of all partitions that match the filters (see find()).
+        '''
+        scenarios = []
+        for partition in self.find(**filters):
+            row = dict(self.partitions[partition]['params'])
+            row['rows'] = self.partitions[partition]['rows']
+            row['partition'] = partition
+            scenarios.append(row)
+        return pd.DataFrame(scenarios)
+
+    def read_partition(self, partition, columns=None):
+        entry = self.partitions[partition]
+        if columns == None:
+            columns = entry['columns']
+        chunks = []
+        for chunk, N_rows in entry['chunks']:
+            chunk_path = join(self.path, 'partitions', partition, chunk)
+            data = {}
+            for col in columns:
+                col_path = join(chunk_path, '{}.npy'.format(col))
+                # columns that are missing in a chunk are filled with NaN
+                if exists(col_path):
+                    data[col] = np.load(col_path, allow_pickle=False)
+                else:
+                    data[col] = np.full(N_rows, np.nan)
+            chunks.append(pd.DataFrame(data, columns=columns))
+        if len(chunks) == 0:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(chunks, ignore_index=True)
+
+    def query(self, columns=None, **filters):
+        '''
+        Returns a data frame with the scenario parameters and the requested
+        observable columns (default: all columns) of all rows in partitions
+        whose scenario parameters match the filters (see find()), for example
+        store.query(['infected_agents'], school_type='primary',
+                    test_type='PCR', screen_frequency_teacher=7)
+        '''
+        frames = []
+        for partition in self.find(**filters):
+            df = self.read_partition(partition, columns)
+            params = self.partitions[partition]['params']
+            for i, (param, value) in enumerate(params.items()):
+                df.insert(i, param, [value] * len(df))
+            frames.append(df)
+        if len(frames) == 0:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+def normalize_value(value):
+    '''
+    Converts a scenario parameter to its canonical JSON value: numpy scalars
+    become python scalars, floats with an integral value become integers
+    (a screening interval of 7.0 is the interval 7) and NaN (for example a
+    missing parameter in a data frame) becomes None. Lists, tuples and
+    dictionaries are normalized element-wise.
+    '''
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, dict):
+        return {key:normalize_value(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_value(val) for val in value]
+    if isinstance(value, float):
+        if np.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def normalize_parameters(params):
+    '''
+    Returns a copy of a dictionary of scenario parameters with normalized
+    values (see normalize_value()).
+    '''
+    return {param:normalize_value(value) for param, value in params.items()}
+
+
+def to_column(values):
+    '''
+    Converts a column of a data frame to a NumPy array that can be stored
+    without pickling: numeric and boolean columns keep their type, all other
+    columns are stored as strings.
+    '''
+    values = values.to_numpy()
+    if values.dtype.kind in 'biuf':
+        return values
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        return values.astype(str)
+
+
+if __name__ == '__main__':
+    # command line interface to inspect a results store, e.g.
+    # python results_store.py /data/results test_type=PCR index_case=teacher
+    parser = argparse.ArgumentParser(description='list the scenarios of a '+\
+        'results store')
+    parser.add_argument('path', help='directory of the results store')
+    parser.add_argument('filters', nargs='*', help='filters of the form '+\
+        'parameter=value, values are parsed as JSON if possible')
+    args = parser.parse_args()
+
+    filters = {}
+    for f in args.filters:
+        param, value = f.split('=', 1)
+        try:
+            filters[param] = json.loads(value)
+        except json.JSONDecodeError:
+            filters[param] = value
+    print(ResultsStore(args.path).get_scenarios(**filters))
@@ -15,7 +15,7 @@ class student(agent_SEIRX):
             exposure_duration, time_until_symptoms, infection_duration,
             verbosity)
 
-        self.age = model.G.nodes(data=True)[self.unique_id]['age']
+        self.age = model.compiled_graph.node_attributes['age'][self.index]
         
 
         ## age adjustments
@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import pickle
+import hashlib
+import argparse
+from multiprocessing import Pool
+from os.path import join, exists, dirname, abspath
+
+# make the repository modules importable if the builder is started from the
+# command line in an arbitrary working directory
+SCHOOL_PATH = dirname(abspath(__file__))
+for path in [SCHOOL_PATH, dirname(SCHOOL_PATH)]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import construct_school_network as csn
+from result_cache import hash_parameters, to_builtin
+
+# different age structures in Austrian school types
+AGE_BRACKETS = {'primary':[6, 7, 8, 9],
+                'primary_dc':[6, 7, 8, 9],
+                'lower_secondary':[10, 11, 12, 13],
+                'lower_secondary_dc':[10, 11, 12, 13],
+                'upper_secondary':[14, 15, 16, 17],
+                'secondary':[10, 11, 12, 13, 14, 15, 16, 17]}
+
+# school characteristics that span the library
+SCHOOL_TYPES = ['primary', 'primary_dc', 'lower_secondary',
+                'lower_secondary_dc', 'upper_secondary', 'secondary']
+CLASS_NUMBERS = [4, 6, 8, 10, 14, 20, 24, 30, 40, 50, 70, 100]
+CLASS_SIZES = [10, 15, 20, 25, 30]
+FLOOR_NUMBERS = [1, 2, 3, 4]
+
+# probability of a household having a certain size. The shares of the
+# household sizes do not add up to exactly one and are normalized
+HOUSEHOLD_SIZES = {1:0.3747, 2:0.3035, 3:0.1473, 4:0.1134, 5:0.0445, 6:0.0175}
+FAMILY_SIZES = {size:share / sum(HOUSEHOLD_SIZES.values()) for size, share \
+                in HOUSEHOLD_SIZES.items()}
+
+# fixed parameters of all networks in the library
+NETWORK_PARAMS = {'N_hours':8,
+                  'N_cross_class_contacts':0,
+                  'N_teacher_contacts_far':10,
+                  'N_teacher_contacts_intermediate':2,
+                  'time_period':'post_lockdown'}
+
+# source files that define the generated networks. Changing any of these
+# files regenerates the whole library
+GENERATOR_FILES = [join(SCHOOL_PATH, 'construct_school_network.py'),
+                   abspath(__file__)]
+
+
+def get_school_name(school_type, N_classes, class_size, N_floors):
+    return '{}_classes-{}_students-{}_floors-{}'.format(school_type,
+        N_classes, class_size, N_floors)
+
+
+def get_generator_version():
+    h = hashlib.sha256()
+    for f in GENERATOR_FILES:
+        with open(f, 'rb') as src:
+            h.update(src.read())
+    return h.hexdigest()
+
+
+def get_school_seed(seed, school_name):
+    '''
+    Deterministic seed of a single school, derived from the seed of the
+    library and the name of the school, such that every school gets the same
+    network independently of the order in which schools are built and of the
+    number of worker processes.
+    '''
+    key = '{}_{}'.format(seed, school_name).encode('utf-8')
+    return int(hashlib.sha256(key).hexdigest()[0:8], 16)
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def get_artifact_paths(path, school_name):
+    return {'network':join(path, 'networks',
+                           '{}.gpickle'.format(school_name)),
+            'schedule':join(path, 'schedules',
+                            '{}_schedule.csv'.format(school_name)),
+            'node_list':join(path, 'node_lists',
+                             '{}_node_list.csv'.format(school_name))}
+
+
+def write_artifact(path, write):
+    # artifacts are written to a temporary file first and moved in place
+    # once they are complete, such that an interrupted build never leaves
+    # a truncated artifact behind
+    tmp_path = '{}.tmp{}'.format(path, os.getpid())
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def generate_school(params):
+    '''
+    Generates the contact network (networkx graph), schedule (see
+    construct_school_network.get_schedule()) and node list of a single school
+    with the array based generator. params contains the school
+    characteristics (school_type, N_classes, class_size, N_floors), the
+    family sizes, the fixed network parameters (see NETWORK_PARAMS) and the
+    seed of the school. The age bracket defaults to the age bracket of the
+    school type, optional parameters are the cross_class_sampling and the
+    households (see construct_school_network.compose_school_edges()). Raises
+    an AssertionError if the school cannot be built.
+    '''
+    network, schedule = csn.compose_school_edges(params['school_type'],
+        params['N_classes'], params['class_size'], params['N_floors'],
+        params.get('age_bracket', AGE_BRACKETS[params['school_type']]),
+        params['family_sizes'], params['N_hours'],
+        params['N_cross_class_contacts'], params['N_teacher_contacts_far'],
+        params['N_teacher_contacts_intermediate'], params['time_period'],
+        params['seed'],
+        cross_class_sampling=params.get('cross_class_sampling', 'students'),
+        households=params.get('households'))
+    return csn.network_to_graph(network), csn.get_schedule(schedule), \
+        csn.network_to_node_list(network)
+
+
+def build_school(task):
+    '''
+    Builds the contact network, schedule and node list of a single school and
+    writes them to the library. Returns the manifest entry of the school.
+    Schools that cannot be built (for example because the school has fewer
+    teachers than contacts between teachers, or because there is no schedule
+    for the school type) are recorded with the error message.
+    '''
+    path, school_name, params = task
+    entry = {'params':params}
+    try:
+        G, schedule, node_list = generate_school(params)
+    except AssertionError as e:
+        entry['error'] = str(e)
+        return school_name, entry
+
+    def write_network(p):
+        with open(p, 'wb') as f:
+            pickle.dump(G, f, pickle.HIGHEST_PROTOCOL)
+
+    artifacts = get_artifact_paths(path, school_name)
+    write_artifact(artifacts['network'], write_network)
+    write_artifact(artifacts['schedule'], lambda p: schedule.to_csv(p))
+    write_artifact(artifacts['node_list'],
+        lambda p: node_list.to_csv(p, index=False))
+
+    entry['files'] = {artifact:{'path':os.path.relpath(artifact_path, path),
+                                'sha256':hash_file(artifact_path)} \
+                      for artifact, artifact_path in artifacts.items()}
+    entry['N_nodes'] = G.number_of_nodes()
+    entry['N_edges'] = G.number_of_edges()
+    return school_name, entry
+
+
+def is_valid(path, entry, params):
+    '''
+    Checks whether the manifest entry of a school was built with the given
+    parameters and all its artifacts exist with the recorded content.
+    '''
+    if entry == None or hash_parameters(entry['params']) != \
+       hash_parameters(params):
+        return False
+    if 'error' in entry:
+        return True
+    for artifact in entry['files'].values():
+        artifact_path = join(path, artifact['path'])
+        if not exists(artifact_path) or \
+           hash_file(artifact_path) != artifact['sha256']:
+            return False
+    return True
+
+
+def load_manifest(path):
+    try:
+        with open(join(path, 'manifest.json'), 'r') as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {'schools':{}}
+
+
+def save_manifest(path, manifest):
+    tmp_path = join(path, 'manifest.json.tmp')
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True,
+                  default=to_builtin)
+    os.replace(tmp_path, join(path, 'manifest.json'))
+
+
+def build_library(path, school_types=SCHOOL_TYPES, class_numbers=CLASS_NUMBERS,
+    class_sizes=CLASS_SIZES, floor_numbers=FLOOR_NUMBERS,
+    family_sizes=FAMILY_SIZES, network_params=NETWORK_PARAMS, seed=0,
+    N_workers=1, verbose=False):
+    '''
+    Builds the library of school contact networks for all combinations of
+    school type, number of classes, class size and number of floors: one
+    networkx graph (networks/<school>.gpickle), schedule
+    (schedules/<school>_schedule.csv) and node list
+    (node_lists/<school>_node_list.csv) per school, generated with the array
+    based generator (see construct_school_network.compose_school_edges()).
+
+    Every school is generated with its own seed, derived from the seed of the
+    library and the name of the school, such that the library is
+    reproducible. Schools are distributed over a pool of N_workers worker
+    processes. Schools whose artifacts already exist and match the manifest
+    (same parameters, seed and generator version, same file hashes) are
+    skipped, such that an interrupted build can be resumed and only schools
+    whose parameters changed are rebuilt.
+
+    The manifest (manifest.json) lists every school with its parameters, the
+    paths and sha256 hashes of its artifacts and the number of nodes and
+    edges of the network, or the error message if the school could not be
+    built.
+
+    Returns the manifest.
+    '''
+    for folder in ['networks', 'schedules', 'node_lists']:
+        os.makedirs(join(path, folder), exist_ok=True)
+    manifest = load_manifest(path)
+    manifest['generator_version'] = get_generator_version()
+
+    tasks = []
+    for school_type in school_types:
+        for N_classes in class_numbers:
+            for class_size in class_sizes:
+                for N_floors in floor_numbers:
+                    school_name = get_school_name(school_type, N_classes,
+                                                 class_size, N_floors)
+                    params = dict(network_params, school_type=school_type,
+                        N_classes=N_classes, class_size=class_size,
+                        N_floors=N_floors, family_sizes=family_sizes,
+                        seed=get_school_seed(seed, school_name),
+                        generator_version=manifest['generator_version'])
+                    if not is_valid(path, manifest['schools'].get(\
+                                    school_name), params):
+                        tasks.append((path, school_name, params))
+
+    # large schools first, such that the small schools fill up the idle
+    # workers at the end of the build
+    tasks.sort(key=lambda t: t[2]['N_classes'] * t[2]['class_size'],
+               reverse=True)
+    if verbose:
+        print('building {} schools'.format(len(tasks)))
+
+    def finish(j, school_name, entry):
+        manifest['schools'][school_name] = entry
+        save_manifest(path, manifest)
+        if verbose and j % 10 == 0:
+            print('school {} / {}'.format(j, len(tasks)))
+
+    if N_workers > 1 and len(tasks) > 1:
+        with Pool(N_workers) as pool:
+            results = pool.imap_unordered(build_school, tasks, chunksize=1)
+            for j, (school_name, entry) in enumerate(results):
+                finish(j, school_name, entry)
+    else:
+        for j, task in enumerate(tasks):
+            school_name, entry = build_school(task)
+            finish(j, school_name, entry)
+
+    save_manifest(path, manifest)
+    return manifest
+
+
+if __name__ == '__main__':
+    # command line interface to build the library, e.g.
+    # python build_school_library.py ../data/school --workers 8
+    parser = argparse.ArgumentParser(description='build the library of '+\
+        'school contact networks')
+    parser.add_argument('path', help='directory of the library')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the library')
+    parser.add_argument('--school_types', nargs='*', default=SCHOOL_TYPES,
+                        help='school types to build')
+    args = parser.parse_args()
+
+    manifest = build_library(args.path, school_types=args.school_types,
+        seed=args.seed, N_workers=args.workers, verbose=True)
+    errors = [s for s, e in manifest['schools'].items() if 'error' in e]
+    print('{} schools, {} could not be built'.format(\
+        len(manifest['schools']), len(errors)))
@@ -205,6 +205,10 @@ def generate_family(G, student_ID, family_counter, family_sizes):
         'link_type': 'family_family' or 'family_student', depending on relation
         'contact_type': 'close'
 
+    The student every family member belongs to is recorded in the graph
+    attribute 'family_students' ({family member ID:student ID}), which is used
+    to export the node list (see get_node_list()).
+
     Returns the graph with added family members for every student, as well as
     the incremented family member counter.
     '''
@@ -230,128 +234,207 @@ def generate_family(G, student_ID, family_counter, family_sizes):
         # all family members also have contact to the student they belong to
         G.add_edge(f1, student_ID, link_type ='student_family',
                    contact_type='close')
+
+    G.graph.setdefault('family_students', {}).update(
+        {f:student_ID for f in family_nodes})
         
     return G, family_counter + N_family_members
 
 
-def generate_schedule_primary(N_classes):
+## schedules
+# schedules are built as integer matrices: the teacher schedule has one row
+# per teacher and one column per teaching unit (TEACHING_UNITS, every unit
+# lasts two hours), with the class taught by the teacher in that unit. For
+# school types with daycare, the teacher schedule has an additional column
+# with the afternoon group supervised by the teacher, and the student
+# schedule has one row per student and the columns 'morning' (class) and
+# 'afternoon' (group). In all schedules, 0 stands for no class or group.
+TEACHING_UNITS = ['hour_1', 'hour_2', 'hour_3', 'hour_4']
+STUDENT_PERIODS = ['morning', 'afternoon']
 
-	assert N_classes % 2 == 0, 'number of classes must be even'
-	N_teachers = N_classes + int(N_classes / 2)
-	teacher_nodes = ['t{}'.format(i) for i in range(1, N_teachers + 1)]
 
-	schedule = {t:[] for t in teacher_nodes}
-
-	# the first two hours are taught by teachers 1 to N_classes:
-	for i in range(1, N_classes + 1):
-	    schedule['t{}'.format(i)].extend([i] * 2)
-	# the rest of the teachers take a break in the faculty room
-	for i in range(N_classes + 1, N_teachers + 1):
-	    schedule['t{}'.format(i)].extend([pd.NA] * 2)
-	# the next two hours are shared between the teachers of the primary subjects
-	# and additional teachers for the secondary subject, such that every teacher
-	# sees a total of two different classes every day
-	for i, j in enumerate(range(N_classes + 1, N_teachers + 1)):
-	    schedule['t{}'.format(j)].append(i + 1)
-	    schedule['t{}'.format(j)].append(i + int(N_classes / 2) + 1)
-	for i,j in enumerate(range(1, int(N_classes / 2) + 1)):
-	    schedule['t{}'.format(j)].append(i + int(N_classes / 2) + 1)
-	    schedule['t{}'.format(j)].append(pd.NA)
-	for i,j in enumerate(range(int(N_classes / 2) + 1, N_classes + 1)):
-	    schedule['t{}'.format(j)].append(pd.NA)
-	    schedule['t{}'.format(j)].append(i + 1)
-
-	# convert the schedule to a data frame
-	schedule_df = pd.DataFrame(columns=['teacher'] + ['hour_{}'.format(i) for i in range(1, 5)])
-	schedule_df['teacher'] = teacher_nodes
-	schedule_df.index = teacher_nodes
-	for t in teacher_nodes:
-	    for hour, c in enumerate(schedule[t]):
-	        schedule_df.loc[t, 'hour_{}'.format(hour + 1)] = c
-
-	schedule_df = schedule_df.drop(columns=['teacher'])
-
-	return schedule_df
+def get_teacher_schedule_primary(N_classes):
+    '''
+    Teaching schedule of primary schools: the first two units are taught by
+    the class teachers 1 to N_classes. The next two units are shared between
+    the class teachers and additional teachers N_classes + 1 to
+    1.5 * N_classes for the secondary subjects, such that every teacher sees
+    a total of two different classes every day.
+    '''
+    assert N_classes % 2 == 0, 'number of classes must be even'
+    N_teachers = get_N_teachers('primary', N_classes)
+    half = N_classes // 2
+    classes = np.arange(1, N_classes + 1)
+    schedule = np.zeros((N_teachers, len(TEACHING_UNITS)), dtype=int)
+    schedule[0:N_classes, 0] = classes
+    schedule[0:N_classes, 1] = classes
+    schedule[N_classes:, 2] = classes[0:half]
+    schedule[N_classes:, 3] = classes[half:]
+    schedule[0:half, 2] = classes[half:]
+    schedule[half:N_classes, 3] = classes[0:half]
+    return schedule
+
+
+def get_teacher_schedule_primary_daycare(N_classes):
+    '''
+    Teaching schedule of primary schools with daycare: the first three units
+    are taught by teachers 1 to N_classes, with classes shifted by one in the
+    third unit. The fourth unit is taught by teachers N_classes + 1 to
+    2 * N_classes, who also supervise the afternoon groups (see
+    add_afternoon_supervision()).
+    '''
+    N_teachers = get_N_teachers('primary_dc', N_classes)
+    classes = np.arange(1, N_classes + 1)
+    schedule = np.zeros((N_teachers, len(TEACHING_UNITS)), dtype=int)
+    schedule[0:N_classes, 0] = classes
+    schedule[0:N_classes, 1] = classes
+    schedule[0:N_classes, 2] = classes % N_classes + 1
+    schedule[N_classes:, 3] = classes
+    return add_afternoon_supervision(schedule, N_classes)
 
 
-def generate_schedule_primary_daycare(N_classes, class_size):
+def get_teacher_schedule_subject(school_type, N_classes, shift):
+    '''
+    Teaching schedule of secondary schools, where subjects are taught by
+    subject teachers instead of class teachers: teachers 1 to N_classes teach
+    the first and third unit, teachers N_classes + 1 to 2 * N_classes the
+    second and fourth unit. In the third and fourth unit, every teacher
+    teaches the class that is shift classes further than the class the
+    teacher taught before, such that every class sees four different teachers
+    and every teacher two different classes every day (for more than one
+    class).
+    '''
+    N_teachers = get_N_teachers(school_type, N_classes)
+    classes = np.arange(1, N_classes + 1)
+    shifted_classes = (classes - 1 + shift) % N_classes + 1
+    schedule = np.zeros((N_teachers, len(TEACHING_UNITS)), dtype=int)
+    schedule[0:N_classes, 0] = classes
+    schedule[N_classes:2 * N_classes, 1] = classes
+    schedule[0:N_classes, 2] = shifted_classes
+    schedule[N_classes:2 * N_classes, 3] = shifted_classes
+    return schedule
+
+
+def add_afternoon_supervision(schedule, N_classes):
+    '''
+    Adds the afternoon column to a teacher schedule: the afternoon groups are
+    supervised by teachers N_classes + 1 to 2 * N_classes, every two teachers
+    supervise a group.
+    '''
+    afternoon = np.zeros((len(schedule), 1), dtype=int)
+    afternoon[N_classes:2 * N_classes, 0] = np.arange(N_classes) // 2 + 1
+    return np.hstack([schedule, afternoon])
 
-	## teacher schedule
-	N_teachers = N_classes * 2
-	teacher_nodes = ['t{}'.format(i) for i in range(1, N_teachers + 1)]
 
-	teacher_schedule = {t:[] for t in teacher_nodes}
-
-	# the first two hours are taught by teachers 1 to N_classes:
-	for i in range(1, N_classes + 1):
-		teacher_schedule['t{}'.format(i)].extend([i] * 2)
-	for i in range(N_classes + 1, N_classes * 2 + 1):
-		teacher_schedule['t{}'.format(i)].extend([pd.NA] * 2)
-	# the third hour is also taught by teachers 1 to N_classes, but classes
-	# are shifted:
-	for i in range(1, N_classes + 1):
-		teacher_schedule['t{}'.format(i)].append(i % N_classes + 1)
-	for i in range(N_classes + 1, N_classes * 2 + 1):
-		teacher_schedule['t{}'.format(i)].append(pd.NA)
-	    
-	# the fourth hour is taught by teachers N_classes + 1 to N_classes * 2
-	for i, j in enumerate(range(N_classes + 1, N_classes * 2 + 1)):
-		teacher_schedule['t{}'.format(j)].append(i + 1)
-	for i in range(1, N_classes + 1):
-		teacher_schedule['t{}'.format(i)].append(pd.NA)
-	    
-	# the afternoon supervision is done by teachers N_classes + 1 to N_classes * 2
-	# and every two teachers supervise a group
-	for i, j in enumerate(range(N_classes + 1, N_classes * 2 + 1)):
-		teacher_schedule['t{}'.format(j)].append(int(i / 2 + 1))
-	for i in range(1, N_classes + 1):
-		teacher_schedule['t{}'.format(i)].append(pd.NA)
-	    
-	teacher_schedule_df = pd.DataFrame(columns=['teacher'] + \
-								['hour_{}'.format(i) for i in range(1, 5)])
-	teacher_schedule_df['teacher'] = teacher_nodes
-	teacher_schedule_df.index = teacher_nodes
-	for t in teacher_nodes:
-		for hour, c in enumerate(teacher_schedule[t]):
-			teacher_schedule_df.loc[t, 'hour_{}'.format(hour + 1)] = c
-	        
-	teacher_schedule_df = teacher_schedule_df.rename(columns={'hour_5':'afternoon'})
-	teacher_schedule_df = teacher_schedule_df.drop(columns=['teacher'])
-
-	## student schedule
-	# pick half of the students at random to participate in full daycare
-	student_nodes = ['s{}'.format(i) for i in range(1, N_classes * class_size + 1)]
-	full_day_care_students = np.random.choice(student_nodes, \
-	                            int((N_classes * class_size) / 2), replace=False)
-	non_day_care_students = [s for s in student_nodes if s not in full_day_care_students]
-
-	student_schedule = {s:[] for s in student_nodes}
-	daycare_counter = 0
-	for i, s in enumerate(student_nodes):
-		student_schedule[s].append(int(i/class_size) + 1)
-	for i, s in enumerate(full_day_care_students):
-		student_schedule[s].append(int(i/class_size) + 1)
-	for s in non_day_care_students:
-		student_schedule[s].append(pd.NA)
-
-	student_schedule_df = pd.DataFrame(columns=['student', 'morning', 'afternoon'])
-	student_schedule_df['student'] = student_nodes
-	student_schedule_df.index = student_nodes
-	for s in student_nodes:
-	    for i, daytime in enumerate(['morning', 'afternoon']):
-	        student_schedule_df.loc[s, daytime] = student_schedule[s][i]
-
-	return teacher_schedule_df, student_schedule_df
+def get_student_schedule_daycare(N_classes, class_size, rng=None):
+    '''
+    Schedule of the students in schools with daycare: all students attend
+    their class in the morning. Half of the students, picked at random with
+    the numpy random number generator rng (default: the global numpy random
+    state), participate in full daycare and are distributed over afternoon
+    groups of the size of a class in the order in which they were picked.
+    '''
+    if rng == None:
+        rng = np.random
+    N_students = N_classes * class_size
+    full_day_care_students = rng.choice(N_students,
+                                int(N_students / 2), replace=False)
+    schedule = np.zeros((N_students, len(STUDENT_PERIODS)), dtype=int)
+    schedule[:, 0] = np.arange(N_students) // class_size + 1
+    schedule[full_day_care_students, 1] = \
+        np.arange(len(full_day_care_students)) // class_size + 1
+    return schedule
+
+
+def get_schedule_matrices(school_type, N_classes, class_size, rng=None):
+    '''
+    Builds the schedule matrices of a school (see the description of the
+    schedules above). Returns the teacher schedule and the student schedule,
+    which is None for school types without daycare. The afternoon groups of
+    the students are drawn with rng (see get_student_schedule_daycare()).
+    '''
+    teacher_schedules = {
+        'primary':lambda: get_teacher_schedule_primary(N_classes),
+        'primary_dc':lambda: get_teacher_schedule_primary_daycare(N_classes),
+        # teachers in lower and upper secondary schools teach neighbouring
+        # classes, which are mostly of the same age. In schools with students
+        # of all ages, teachers teach classes in the lower and the upper half
+        # of the school
+        'lower_secondary':lambda: get_teacher_schedule_subject(
+            'lower_secondary', N_classes, 1),
+        'lower_secondary_dc':lambda: add_afternoon_supervision(
+            get_teacher_schedule_subject('lower_secondary_dc', N_classes, 1),
+            N_classes),
+        'upper_secondary':lambda: get_teacher_schedule_subject(
+            'upper_secondary', N_classes, 1),
+        'secondary':lambda: get_teacher_schedule_subject('secondary',
+            N_classes, max(1, N_classes // 2))
+    }
+    assert school_type in teacher_schedules, \
+        'no schedule available for school type {}'.format(school_type)
+
+    teacher_schedule = teacher_schedules[school_type]()
+    student_schedule = None
+    if school_type.endswith('_dc'):
+        student_schedule = get_student_schedule_daycare(N_classes, class_size,
+                                                        rng)
+    return teacher_schedule, student_schedule
+
+
+def get_schedule_frames(teacher_schedule, student_schedule=None):
+    '''
+    Converts schedule matrices into the data frames returned by the
+    generate_schedule_* functions: the teacher schedule with the teachers as
+    index and the teaching units (and 'afternoon') as columns and, for school
+    types with daycare, the student schedule with the students as index and
+    the columns 'student', 'morning' and 'afternoon'. Missing classes and
+    groups are NA.
+    '''
+    columns = TEACHING_UNITS + ['afternoon'] * \
+        (teacher_schedule.shape[1] - len(TEACHING_UNITS))
+    teacher_schedule_df = pd.DataFrame(
+        np.where(teacher_schedule > 0, teacher_schedule, pd.NA),
+        index=['t{}'.format(i) for i in range(1, len(teacher_schedule) + 1)],
+        columns=columns).astype('Int64')
+    if type(student_schedule) == type(None):
+        return teacher_schedule_df
+
+    student_nodes = ['s{}'.format(i) for i in \
+                     range(1, len(student_schedule) + 1)]
+    student_schedule_df = pd.DataFrame(
+        np.where(student_schedule > 0, student_schedule, pd.NA),
+        index=student_nodes, columns=STUDENT_PERIODS).astype('Int64')
+    student_schedule_df.insert(0, 'student', student_nodes)
+    return teacher_schedule_df, student_schedule_df
+
+
+def generate_schedule_primary(N_classes):
+    return get_schedule_frames(*get_schedule_matrices('primary', N_classes, 0))
+
+
+def generate_schedule_primary_daycare(N_classes, class_size):
+    return get_schedule_frames(*get_schedule_matrices('primary_dc', N_classes,
+                                                      class_size))
 
 
 def generate_schedule_lower_secondary(N_classes):
-	pass
+    return get_schedule_frames(*get_schedule_matrices('lower_secondary',
+                                                      N_classes, 0))
+
+
 def generate_schedule_lower_secondary_daycare(N_classes, class_size):
-	pass
+    return get_schedule_frames(*get_schedule_matrices('lower_secondary_dc',
+                                                      N_classes, class_size))
+
+
 def generate_schedule_upper_secondary(N_classes):
-	pass
+    return get_schedule_frames(*get_schedule_matrices('upper_secondary',
+                                                      N_classes, 0))
+
+
 def generate_schedule_secondary(N_classes):
-	pass
+    return get_schedule_frames(*get_schedule_matrices('secondary', N_classes,
+                                                      0))
 
 
 def get_N_teachers(school_type, N_classes):
@@ -366,65 +449,59 @@ def get_N_teachers(school_type, N_classes):
 	return teachers[school_type]
 
 
-def set_teacher_student_contacts(G, school_type, N_classes, class_size):
-	schedulers = {
-		'primary':generate_schedule_primary,
-		'primary_dc':generate_schedule_primary_daycare,
-		'lower_secondary':generate_schedule_lower_secondary,
-		'lower_secondary_dc':generate_schedule_lower_secondary_daycare,
-		'upper_secondary':generate_schedule_upper_secondary,
-		'secondary':generate_schedule_secondary
-	}
+def get_teacher_student_pairs(teacher_schedule, student_schedule, class_size):
+    '''
+    Returns the arrays (teachers, students) of all pairs of teacher and
+    student (row indices of the schedules) that have contact according to the
+    schedules: every teacher has contact to all students of the classes the
+    teacher teaches (in the order in which the teacher teaches them, every
+    class once) and, for school types with daycare, to all students of the
+    afternoon group the teacher supervises.
+    '''
+    taught = teacher_schedule[:, 0:len(TEACHING_UNITS)]
+    N_classes = taught.max() if taught.size > 0 else 0
+    # every pair of teacher and class, once, in the order of the units
+    teachers, units = np.nonzero(taught)
+    pairs = teachers * (N_classes + 1) + taught[teachers, units]
+    pairs, first = np.unique(pairs, return_index=True)
+    pairs = pairs[np.lexsort((first, pairs // (N_classes + 1)))]
+    teachers, classes = pairs // (N_classes + 1), pairs % (N_classes + 1)
+    sources = [np.repeat(teachers, class_size)]
+    targets = [np.repeat((classes - 1) * class_size, class_size) + \
+               np.tile(np.arange(class_size), len(pairs))]
+
+    if type(student_schedule) != type(None):
+        supervised = teacher_schedule[:, len(TEACHING_UNITS)]
+        groups = student_schedule[:, 1]
+        for t in np.nonzero(supervised)[0]:
+            students_in_group = np.nonzero(groups == supervised[t])[0]
+            sources.append(np.full(len(students_in_group), t))
+            targets.append(students_in_group)
+    return np.concatenate(sources), np.concatenate(targets)
 
-	N_teachers = get_N_teachers(school_type, N_classes)
-	teacher_nodes = ['t{}'.format(i) for i in range(1, N_teachers + 1)]
 
-	# school types with daycare are handled separately, because they need an
-	# additional schedule for students in the afternoon
-	if school_type.endswith('_dc'):
-		teacher_schedule_df, student_schedule_df = \
-			schedulers[school_type](N_teachers, class_size)
-
-		# morning classes: create links between the teachers and all students
-		# in the classes taught by the teachers
-		for t in teacher_nodes:
-			classes_taught = teacher_schedule_df\
-				.drop(columns=['afternoon'])\
-				.loc[t]\
-				.dropna()\
-				.unique()
-			for c in classes_taught:
-				students_in_class = [x for x,y in G.nodes(data=True) if \
-		                            (y['type'] == 'student') and \
-		                             y['unit'] == 'class_{}'.format(c)]
-				for s in students_in_class:
-					G.add_edge(t, s, link_type='student_teacher', 
-		                       contact_type='far')
-
-		# afternoon supervision: create links between the teachers supervising
-		# the afternoon groups and all students in the afternoon groups. Note:
-		# the information about which students are in which afternoon group are
-		# taken from the student schedule, because students are assigned to
-		# afternoon groups at random.
-		for t in teacher_nodes:
-			supervised_group = teacher_schedule_df.loc[t, 'afternoon']
-			if not pd.isna(supervised_group):
-				students_in_group = [s for s in student_schedule_df.index if \
-	    			not pd.isna(student_schedule_df.loc[s, 'afternoon']) and \
-	                student_schedule_df.loc[s, 'afternoon'] == supervised_group]
-
-				for s in students_in_group:
-					G.add_edge(t, s, link_type='student_teacher',contact_type='far')
-
-		return teacher_schedule_df, student_schedule_df
-
-	else:    
-		return teacher_schedule_df
+def set_teacher_student_contacts(G, school_type, N_classes, class_size):
+    '''
+    Builds the schedules of the school (see get_schedule_matrices()) and adds
+    contacts of intensity 'far' between all teachers and the students of the
+    classes they teach and, for school types with daycare, the students of
+    the afternoon groups they supervise. Returns the teacher schedule and, for
+    school types with daycare, the student schedule as data frames (see
+    get_schedule_frames()).
+    '''
+    teacher_schedule, student_schedule = get_schedule_matrices(school_type,
+        N_classes, class_size)
+    teachers, students = get_teacher_student_pairs(teacher_schedule,
+        student_schedule, class_size)
+    G.add_edges_from([('t{}'.format(t + 1), 's{}'.format(s + 1)) for t, s in \
+        zip(teachers, students)], link_type='student_teacher',
+        contact_type='far')
+    return get_schedule_frames(teacher_schedule, student_schedule)
 
 
         
 def generate_teachers(G, N_classes, school_type, N_teacher_contacts_far, 
-    N_teacher_contacts_intermediate):
+    N_teacher_contacts_intermediate, rng=None):
 	'''
 	Generate a number of teachers which each have contact of intensity 'far'
 	to N_teacher_contacts_far other teachers and contact of intensity 
@@ -438,6 +515,13 @@ def generate_teachers(G, N_classes, school_type, N_teacher_contacts_far,
 	    'link_type': 'teacher_teacher'
 	    'contact_strength': 'far' or 'intermediate'
 
+	Contacts are drawn as distinct unordered pairs of teachers (see
+	sample_pairs()), such that teachers have N_teacher_contacts_far far and 
+	N_teacher_contacts_intermediate intermediate contacts on average and no
+	pair of teachers has more than one contact. rng is a numpy random number
+	generator. If none is given, a generator is seeded from the global numpy
+	random state.
+
 	Returns the graph with added teachers
 	'''
 	N_teachers = get_N_teachers(school_type, N_classes)
@@ -449,33 +533,20 @@ def generate_teachers(G, N_classes, school_type, N_teacher_contacts_far,
 	nx.set_node_attributes(G, \
 	    {t:{'type':'teacher', 'unit':'faculty_room'} for t in teacher_nodes})
 
-	# total number of unique far contacts that will be generated
-	N_teacher_contacts_far = (N_teacher_contacts_far * N_teachers) / 2
-	contacts_created = 0
-	while contacts_created < N_teacher_contacts_far:
-		t1 = np.random.choice(teacher_nodes)
-		t2 = np.random.choice(teacher_nodes)
-		if t1 == t2:
-			continue
-
-		if not G.has_edge(t1, t2):
-			G.add_edge(t1, t2, link_type='teacher_teacher', 
-			               contact_type='far')
-			contacts_created += 1
-
-	# total number of unique intermediate contacts that will be generated
-	N_teacher_contacts_intermediate = ( N_teacher_contacts_intermediate * N_teachers) / 2
-	contacts_created = 0
-	while contacts_created < N_teacher_contacts_intermediate:
-		t1 = np.random.choice(teacher_nodes)
-		t2 = np.random.choice(teacher_nodes)
-		if t1 == t2:
-			continue
-
-		if not G.has_edge(t1, t2):
-			G.add_edge(t1, t2, link_type='teacher_teacher', 
-		                   contact_type='intermediate')
-			contacts_created += 1    
+	if rng == None:
+		rng = np.random.default_rng(np.random.randint(2**31))
+
+	# total number of unique far and intermediate contacts that will be
+	# generated. The far contacts are the first pairs that are drawn, the
+	# intermediate contacts the following pairs
+	N_far = int(np.ceil(N_teacher_contacts_far * N_teachers / 2))
+	N_intermediate = int(np.ceil(N_teacher_contacts_intermediate * \
+	                             N_teachers / 2))
+	sources, targets = sample_pairs(N_teachers, N_far + N_intermediate, rng)
+	contact_types = ['far'] * N_far + ['intermediate'] * N_intermediate
+	G.add_edges_from([(teacher_nodes[t1], teacher_nodes[t2],
+	    {'link_type':'teacher_teacher', 'contact_type':contact_type}) \
+	    for t1, t2, contact_type in zip(sources, targets, contact_types)])
 
 	return G
     
@@ -483,21 +554,47 @@ def generate_teachers(G, N_classes, school_type, N_teacher_contacts_far,
     
 
 # add a number of random contacs between students of neighboring classes
-def add_cross_class_contacts(G, N_classes, N_cross_class_contacts, class_neighbours):
+def add_cross_class_contacts(G, N_classes, N_cross_class_contacts, class_neighbours,
+    sampling='students', rng=None):
+    '''
+    Adds N_cross_class_contacts contacts of intensity 'far' between the
+    students of every class and each of its neighbouring classes. With
+    sampling = 'students' (default), N_cross_class_contacts distinct students
+    are drawn from each of the two classes and paired up, such that every
+    student has at most one contact to a given neighbouring class. With
+    sampling = 'pairs', N_cross_class_contacts distinct pairs of students are
+    drawn directly from all pairs of students of the two classes (see
+    sample_cross_pairs()) with the numpy random number generator rng (if
+    none is given, a generator is seeded from the global numpy random state).
+    '''
+    assert sampling in ['students', 'pairs'], \
+        'unknown cross class contact sampling {}'.format(sampling)
+    if sampling == 'pairs' and rng == None:
+        rng = np.random.default_rng(np.random.randint(2**31))
+
+    students = {c:[] for c in range(1, N_classes + 1)}
+    for x, y in G.nodes(data=True):
+        if y['type'] == 'student':
+            students[int(y['unit'].split('_')[1])].append(x)
     
     for c in range(1, N_classes + 1):
-        students_in_class = [x for x,y in G.nodes(data=True) if \
-                    (y['type'] == 'student') \
-                             and y['unit'] == 'class_{}'.format(c)]
+        students_in_class = students[c]
         
         for neighbour_class in class_neighbours[c]:
-            students_in_neighbour_class = [x for x,y in G.nodes(data=True) if \
-                    (y['type'] == 'student') and \
-                     y['unit'] == 'class_{}'.format(neighbour_class)]
-
-            neighbour_contacts = np.random.choice(students_in_neighbour_class,
-                                        N_cross_class_contacts, replace=False)
-            class_contacts = np.random.choice(students_in_class, 
+            students_in_neighbour_class = students[neighbour_class]
+
+            if sampling == 'pairs':
+                neighbour_contacts, class_contacts = sample_cross_pairs(
+                    len(students_in_neighbour_class), len(students_in_class),
+                    N_cross_class_contacts, rng)
+                neighbour_contacts = [students_in_neighbour_class[i] for i \
+                                      in neighbour_contacts]
+                class_contacts = [students_in_class[i] for i in class_contacts]
+            else:
+                neighbour_contacts = np.random.choice(
+                    students_in_neighbour_class, N_cross_class_contacts,
+                    replace=False)
+                class_contacts = np.random.choice(students_in_class, 
                                         N_cross_class_contacts, replace=False)
 
             for i in range(N_cross_class_contacts):
@@ -510,11 +607,8 @@ def add_cross_class_contacts(G, N_classes, N_cross_class_contacts, class_neighbo
 
 def compose_school_graph(school_type, N_classes, class_size, N_floors, 
 		age_bracket, family_sizes, N_hours, N_cross_class_contacts, 
-        N_teacher_contacts_far, N_teacher_contacts_intermediate, time_period):
-    # number of teachers in a school
-    N_teachers = N_classes * 2
-    # number of classes a teacher is in contact with
-    N_classes_taught = int(N_hours / 2)
+        N_teacher_contacts_far, N_teacher_contacts_intermediate, time_period,
+        cross_class_sampling='students'):
     # number of neighbouring classes for each class
     N_close_classes = 2 # needs to be even
     
@@ -532,9 +626,12 @@ def compose_school_graph(school_type, N_classes, class_size, N_floors,
         G, student_counter, class_counter = generate_class(G, class_size, \
                         student_counter, c, floors_inv, age_bracket_map, time_period)
 
-    # add teachers
-    G, schedule = generate_teachers(G, N_teachers, N_classes, N_classes_taught,
-        N_teacher_contacts_far, N_teacher_contacts_intermediate)
+    # add teachers and the contacts between teachers and students according
+    # to the schedule of the school type
+    G = generate_teachers(G, N_classes, school_type, N_teacher_contacts_far,
+        N_teacher_contacts_intermediate)
+    schedule = set_teacher_student_contacts(G, school_type, N_classes,
+        class_size)
 
     # add family members
     if family_sizes != None:
@@ -546,25 +643,639 @@ def compose_school_graph(school_type, N_classes, class_size, N_floors,
     # create inter-class contacts
     if N_cross_class_contacts > 0:
         class_neighbours = get_neighbour_classes(N_classes, floors, floors_inv, N_close_classes)
-        G = add_cross_class_contacts(G, N_classes, N_cross_class_contacts, class_neighbours)
+        G = add_cross_class_contacts(G, N_classes, N_cross_class_contacts,
+            class_neighbours, cross_class_sampling)
     
     return G, schedule
 
+def get_family_students(G):
+    '''
+    Returns the dictionary {family member ID:student ID} of the students the
+    family members in the graph belong to. The dictionary is recorded in the
+    graph when family members are generated (see generate_family()). For
+    graphs without it, for example graphs that were created before it was
+    recorded, it is reconstructed from the 'student_family' edges.
+    '''
+    if 'family_students' in G.graph:
+        return G.graph['family_students']
+    family_students = {}
+    for u, v, data in G.edges(data=True):
+        if data.get('link_type') == 'student_family':
+            if G.nodes[u]['type'] == 'student':
+                u, v = v, u
+            family_students.setdefault(u, v)
+    return family_students
+
+
 def get_node_list(G):
-	node_list = pd.DataFrame()
-	for n in G.nodes(data=True):
-	    if n[1]['type'] == 'student':
-	        location = n[1]['unit']
-	    elif n[1]['type'] == 'teacher':
-	        location = 'faculty_room'
-	    else:
-	        student = [item for sublist in G.edges(n[0]) for item in sublist \
-	                   if item.startswith('s')][0]
-	        location = 'home_{}'.format(student)
-	    node_list = node_list.append({'ID':n[0],
-	                                  'type':n[1]['type'],
-	                                  'location':location}, ignore_index=True)
-
-	return node_list
+    '''
+    Returns the node list of a school contact network: a data frame with the
+    ID, type and location of every node. Students are located in their class,
+    teachers in the faculty room and family members at the home of the
+    student they belong to.
+    '''
+    IDs = list(G.nodes())
+    types = np.asarray([data['type'] for ID, data in G.nodes(data=True)],
+                       dtype=object)
+    location = np.asarray([data['unit'] for ID, data in G.nodes(data=True)],
+                          dtype=object)
+    location[types == 'teacher'] = 'faculty_room'
+    family = np.nonzero(types == 'family_member')[0]
+    family_students = get_family_students(G)
+    location[family] = ['home_{}'.format(family_students[IDs[i]]) \
+                        for i in family]
+    return pd.DataFrame({'ID':IDs, 'type':types, 'location':location})
+
+
 
 
+## array based generation of school networks
+# the functions below build the same networks as compose_school_graph(), but
+# create all nodes and edges of a type at once as arrays of node indices
+# instead of adding them one by one to a networkx graph. Nodes are indexed in
+# the order students, teachers, family members, which is the order in which
+# compose_school_graph() adds them to the graph.
+
+def get_schedule_matrix(schedule, columns=None):
+    '''
+    Converts a schedule data frame (teachers x hours, with the class taught in
+    every hour, or groups supervised in the afternoon) into an integer matrix,
+    where 0 means that the teacher does not teach in that hour.
+    '''
+    if columns != None:
+        schedule = schedule[columns]
+    return schedule.apply(pd.to_numeric).fillna(0).to_numpy(dtype=int)
+
+
+def get_clique_edges(first_nodes, sizes):
+    '''
+    Returns the edges (sources, targets) of complete graphs between
+    consecutive node indices, given the index of the first node and the number
+    of nodes of every complete graph.
+    '''
+    sources, targets = [], []
+    first_nodes = np.asarray(first_nodes)
+    sizes = np.asarray(sizes)
+    # all complete graphs of the same size are created at once
+    for size in np.unique(sizes):
+        if size < 2:
+            continue
+        i, j = np.triu_indices(size, 1)
+        offsets = first_nodes[sizes == size]
+        sources.append((offsets[:, None] + i[None, :]).ravel())
+        targets.append((offsets[:, None] + j[None, :]).ravel())
+    if len(sources) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def sample_pairs(N_nodes, N_pairs, rng):
+    '''
+    Draws N_pairs distinct unordered pairs of nodes (without self-loops)
+    uniformly at random from N_nodes nodes. Returns the arrays (sources,
+    targets) of the pairs.
+    '''
+    N_possible = N_nodes * (N_nodes - 1) // 2
+    assert N_pairs <= N_possible, 'not enough nodes for the number of pairs'
+    pairs = rng.choice(N_possible, N_pairs, replace=False)
+    # map the index of a pair to the row and column of the upper triangle of
+    # the adjacency matrix
+    sources = (N_nodes - 2 - np.floor(np.sqrt(-8 * pairs + \
+        4 * N_nodes * (N_nodes - 1) - 7) / 2 - 0.5)).astype(int)
+    targets = pairs + sources + 1 - N_possible + \
+        (N_nodes - sources) * (N_nodes - sources - 1) // 2
+    return sources, targets
+
+
+def sample_cross_pairs(N_sources, N_targets, N_pairs, rng):
+    '''
+    Draws N_pairs distinct pairs of one of N_sources source nodes and one of
+    N_targets target nodes uniformly at random. Returns the arrays (sources,
+    targets) of the pairs.
+    '''
+    assert N_pairs <= N_sources * N_targets, \
+        'not enough nodes for the number of pairs'
+    pairs = rng.choice(N_sources * N_targets, N_pairs, replace=False)
+    return pairs // N_targets, pairs % N_targets
+
+
+## household synthesis
+# students and their families are synthesized from households with children:
+# the number of children of a household is drawn from p_children
+# ({number of children:probability}), the number of parents from p_parents
+# ({number of children:{number of parents:probability}}) and the ages of the
+# children uniformly from 0 to MAX_CHILD_AGE - 1. Children whose age is in
+# the age bracket of the school go to the school, if there is a free place in
+# a class of their age. All other children and the parents are family members.
+MAX_CHILD_AGE = 18
+
+def get_probabilities(p):
+    '''
+    Returns the values and the normalized probabilities of a probability
+    table {value:probability}.
+    '''
+    values = np.asarray(list(p.keys()))
+    probabilities = np.asarray(list(p.values()), dtype=float)
+    return values, probabilities / probabilities.sum()
+
+
+def sample_households(N_households, ages, p_children, p_parents, rng):
+    '''
+    Draws N_households households with at least one child whose age is in
+    ages (the ages of all children of a household are drawn again until one
+    of them is in ages). Returns the number of parents of every household and
+    the household and age of every child.
+    '''
+    sizes, probabilities = get_probabilities(p_children)
+    N_children = rng.choice(sizes, N_households, p=probabilities)
+    N_parents = np.zeros(N_households, dtype=int)
+    for size in sizes:
+        with_size = N_children == size
+        parents, probabilities = get_probabilities(p_parents[size])
+        N_parents[with_size] = rng.choice(parents, with_size.sum(),
+                                          p=probabilities)
+
+    # the ages of all children of households without a child of school age
+    # are drawn again, until every household has a child of school age
+    household = np.repeat(np.arange(N_households), N_children)
+    child_ages = np.zeros(len(household), dtype=int)
+    redraw = np.ones(len(household), dtype=bool)
+    while redraw.any():
+        child_ages[redraw] = rng.integers(0, MAX_CHILD_AGE, redraw.sum())
+        school_age = np.bincount(household, np.isin(child_ages, ages),
+                                 minlength=N_households) > 0
+        redraw = ~school_age[household]
+    return N_parents, household, child_ages
+
+
+def synthesize_households(age_bracket_map, class_size, p_children, p_parents,
+    rng):
+    '''
+    Synthesizes the households of the students of a school with the classes
+    and ages given by age_bracket_map ({class:age}, see
+    get_age_distribution()). Households are drawn in batches (see
+    sample_households()). Children of school age fill the free places of
+    their age in the order in which they are drawn, households without a
+    child that gets a place are discarded, until every class has class_size
+    students. Students of the same age are assigned to the classes of their
+    age in the order in which they were drawn, such that siblings of the same
+    age usually go to the same class.
+
+    Returns a dictionary with the ages and households of the students
+    ('student_age', 'student_household', students ordered by class, class_size
+    students per class), the ages (NaN for parents) and households of the
+    family members ('member_age', 'member_household') and the contacts within
+    the households ('source' and 'target', where students are indexed from 0
+    and family members are indexed after the students, and 'link_type':
+    'student_sibling' between students, 'student_family' between a family
+    member (always the source) and a student and 'family_family' between
+    family members).
+    '''
+    classes = np.asarray(sorted(age_bracket_map.keys()))
+    class_ages = np.asarray([age_bracket_map[c] for c in classes])
+    ages, class_counts = np.unique(class_ages, return_counts=True)
+    assert ((ages >= 0) & (ages < MAX_CHILD_AGE)).all(), \
+        'ages in the age bracket of the school need to be between 0 and ' +\
+        '{}'.format(MAX_CHILD_AGE - 1)
+    free_places = class_counts * class_size
+
+    student_age, student_household = [], []
+    member_age, member_household = [], []
+    N_households = 0
+    while free_places.sum() > 0:
+        # every household has at least one child of an age with free places,
+        # therefore the number of free places is enough households to fill
+        # them
+        N_parents, household, child_ages = sample_households(
+            free_places.sum(), ages[free_places > 0], p_children, p_parents,
+            rng)
+
+        # children of school age take the free places of their age in the
+        # order in which they were drawn
+        age_index = np.searchsorted(ages, child_ages).clip(0, len(ages) - 1)
+        school_age = ages[age_index] == child_ages
+        candidates = np.nonzero(school_age)[0]
+        order = candidates[np.argsort(age_index[candidates], kind='stable')]
+        group_start = np.searchsorted(age_index[order], age_index[order])
+        rank = np.arange(len(order)) - group_start
+        is_student = np.zeros(len(household), dtype=bool)
+        is_student[order] = rank < free_places[age_index[order]]
+        free_places = free_places - np.bincount(age_index[is_student],
+                                                minlength=len(ages))
+
+        # households without students are discarded, the others get
+        # consecutive household numbers
+        kept = np.bincount(household, is_student,
+                           minlength=len(N_parents)) > 0
+        number = N_households + np.cumsum(kept) - 1
+        N_households += kept.sum()
+        student_age.append(child_ages[is_student])
+        student_household.append(number[household[is_student]])
+        # the children that do not go to the school are followed by the
+        # parents of their household
+        siblings = ~is_student & kept[household]
+        parents = np.repeat(np.nonzero(kept)[0], N_parents[kept])
+        member_household.append(np.concatenate([number[household[siblings]],
+                                                number[parents]]))
+        member_age.append(np.concatenate([child_ages[siblings],
+                                          np.full(len(parents), np.nan)]))
+
+    student_age = np.concatenate(student_age)
+    student_household = np.concatenate(student_household)
+    member_household = np.concatenate(member_household)
+    member_age = np.concatenate(member_age)
+    order = np.argsort(member_household, kind='stable')
+    member_household, member_age = member_household[order], member_age[order]
+
+    # students of every age are distributed over the classes of their age in
+    # the order in which they were drawn
+    drawn = np.argsort(student_age, kind='stable')
+    student_class = np.zeros(len(student_age), dtype=int)
+    for age in ages:
+        of_age = drawn[student_age[drawn] == age]
+        student_class[of_age] = np.repeat(classes[class_ages == age],
+                                          class_size)
+    order = np.lexsort((np.arange(len(student_age)), student_class))
+    student_age = student_age[order]
+    student_household = student_household[order]
+
+    # all members of a household have contact to each other
+    N_students = len(student_age)
+    nodes = np.concatenate([np.arange(N_students),
+        N_students + np.arange(len(member_household))])
+    households = np.concatenate([student_household, member_household])
+    order = np.argsort(households, kind='stable')
+    nodes, households = nodes[order], households[order]
+    sizes = np.bincount(households, minlength=N_households)
+    first = np.concatenate([[0], np.cumsum(sizes)[0:-1]])
+    sources, targets = get_clique_edges(first, sizes)
+    sources, targets = nodes[sources], nodes[targets]
+    # family members are the source of their contacts to students
+    swap = (sources < N_students) & (targets >= N_students)
+    sources[swap], targets[swap] = targets[swap], sources[swap]
+    link_type = np.where(sources >= N_students, 'student_family',
+                         'student_sibling').astype(object)
+    link_type[targets >= N_students] = 'family_family'
+
+    return {'student_age':student_age,
+            'student_household':student_household,
+            'member_age':member_age,
+            'member_household':member_household,
+            'source':sources,
+            'target':targets,
+            'link_type':link_type}
+
+
+def compose_school_edges(school_type, N_classes, class_size, N_floors,
+        age_bracket, family_sizes, N_hours, N_cross_class_contacts,
+        N_teacher_contacts_far, N_teacher_contacts_intermediate, time_period,
+        seed=None, cross_class_sampling='students', households=None):
+    '''
+    Array based version of compose_school_graph() for large schools. Builds
+    class membership, the contacts within classes, the contacts between
+    teachers, the contacts between teachers and the classes they teach
+    according to the schedule, the families of all students and the contacts
+    between neighbouring classes as arrays of node indices. The networks are
+    statistically identical to the networks created by compose_school_graph()
+    with the same parameters (node IDs, node attributes and edge attributes
+    are the same, random contacts and family sizes are drawn from the same
+    distributions).
+
+    seed: integer, seed of the random numbers used for teacher contacts,
+    family sizes, contacts between classes and the afternoon groups of school
+    types with daycare. The global numpy random state is neither used nor
+    changed.
+
+    cross_class_sampling: 'students' or 'pairs', how contacts between
+    students of neighbouring classes are drawn (see
+    add_cross_class_contacts()).
+
+    households: dictionary with the probability tables 'p_children' and
+    'p_parents' (see synthesize_households()). If given, students and their
+    families are synthesized from households with children and siblings who
+    go to the same school have close contact (link type 'student_sibling'),
+    instead of drawing a household size for every student from family_sizes.
+
+    Returns a dictionary with the node IDs ('ID'), node attributes ('type',
+    'unit', 'floor' and 'age', where floor is NaN for teachers and family
+    members and age is NaN for teachers and for family members of unknown
+    age) and the edges ('source' and 'target' node indices,
+    'link_type' and 'contact_type') of the network, together with the
+    schedule (see set_teacher_student_contacts()). Use network_to_graph() or
+    network_to_csr() to convert the network. Raises a ValueError if the time
+    period is unknown.
+    '''
+    rng = np.random.default_rng(seed)
+    # number of neighbouring classes for each class
+    N_close_classes = 2 # needs to be even
+
+    floors, floors_inv = get_floor_distribution(N_floors, N_classes)
+    age_bracket_map = get_age_distribution(school_type, age_bracket, N_classes)
+
+    edges = {'source':[], 'target':[], 'link_type':[], 'contact_type':[]}
+    def add_edges(sources, targets, link_type, contact_type, first=False):
+        # edges that are added first take precedence over later occurrences
+        # of the same edge (see below)
+        position = 0 if first else len(edges['source'])
+        edges['source'].insert(position, np.asarray(sources, dtype=int))
+        edges['target'].insert(position, np.asarray(targets, dtype=int))
+        edges['link_type'].insert(position, np.full(len(sources), link_type,
+                                                    dtype=object))
+        edges['contact_type'].insert(position, np.full(len(sources),
+                                     contact_type, dtype=object))
+
+    ## students
+    N_students = N_classes * class_size
+    classes = np.arange(1, N_classes + 1)
+    student_class = np.repeat(classes, class_size)
+    first_students = (classes - 1) * class_size
+    sources, targets = get_clique_edges(first_students,
+                                        np.full(N_classes, class_size))
+    if time_period == 'calibration':
+        add_edges(sources, targets, 'student_student', 'intermediate')
+    elif time_period == 'post_lockdown':
+        # students have intermediate contacts to their two closest neighbours
+        # in a ring and far contacts to all other students of the class
+        position = (targets - sources) % class_size
+        ring = (position == 1) | (position == class_size - 1)
+        add_edges(sources[~ring], targets[~ring], 'student_student', 'far')
+        add_edges(sources[ring], targets[ring], 'student_student',
+                  'intermediate')
+    else:
+        raise ValueError('unknown time period {}'.format(time_period))
+
+    ## teachers
+    N_teachers = get_N_teachers(school_type, N_classes)
+    assert N_teachers > N_teacher_contacts_far + \
+        N_teacher_contacts_intermediate, 'total number of teachers needs ' +\
+        'to be larger than the total number of contacts every teacher has ' +\
+        'to other teachers'
+    # the far contacts are the first pairs that are drawn, the intermediate
+    # contacts the following pairs, as in generate_teachers()
+    N_far = int(np.ceil(N_teacher_contacts_far * N_teachers / 2))
+    N_intermediate = int(np.ceil(N_teacher_contacts_intermediate * \
+                                 N_teachers / 2))
+    sources, targets = sample_pairs(N_teachers, N_far + N_intermediate, rng)
+    add_edges(N_students + sources[0:N_far], N_students + targets[0:N_far],
+              'teacher_teacher', 'far')
+    add_edges(N_students + sources[N_far:], N_students + targets[N_far:],
+              'teacher_teacher', 'intermediate')
+
+    ## contacts between teachers and students according to the schedule
+    # the afternoon groups are drawn with a separate legacy random state,
+    # which draws the same groups as the global numpy random state seeded
+    # with the seed of the school (as the school library did before)
+    teacher_schedule, student_schedule = get_schedule_matrices(school_type,
+        N_classes, class_size, np.random.RandomState(seed))
+    schedule = get_schedule_frames(teacher_schedule, student_schedule)
+    sources, targets = get_teacher_student_pairs(teacher_schedule,
+        student_schedule, class_size)
+    sources = N_students + sources
+    add_edges(sources, targets, 'student_teacher', 'far')
+
+    ## family members
+    N_family_members = 0
+    family_IDs = np.zeros(0, dtype=int)
+    family_ages = np.zeros(0)
+    if households != None:
+        synthesized = synthesize_households(age_bracket_map, class_size,
+            households['p_children'], households['p_parents'], rng)
+        N_family_members = len(synthesized['member_household'])
+        family_IDs = np.arange(1, N_family_members + 1)
+        family_ages = synthesized['member_age']
+        # family members are indexed after the teachers
+        sources, targets = synthesized['source'], synthesized['target']
+        sources = np.where(sources >= N_students, sources + N_teachers,
+                           sources)
+        targets = np.where(targets >= N_students, targets + N_teachers,
+                           targets)
+        for link_type in ['family_family', 'student_family']:
+            is_type = synthesized['link_type'] == link_type
+            add_edges(sources[is_type], targets[is_type], link_type, 'close')
+        # siblings in the same class have close contact instead of the
+        # contact between classmates
+        siblings = synthesized['link_type'] == 'student_sibling'
+        add_edges(sources[siblings], targets[siblings], 'student_sibling',
+                  'close', first=True)
+
+    elif family_sizes != None:
+        sizes = rng.choice(list(family_sizes.keys()), N_students,
+                p=[family_sizes[s] for s in family_sizes.keys()])
+        # every student has size - 1 family members. The counter of family
+        # member IDs is increased by the household size for every student,
+        # as in generate_family()
+        members = sizes - 1
+        N_family_members = members.sum()
+        family_ages = np.full(N_family_members, np.nan)
+        first_IDs = 1 + np.concatenate([[0], np.cumsum(sizes)[0:-1]])
+        first_members = np.concatenate([[0], np.cumsum(members)[0:-1]])
+        family_IDs = np.repeat(first_IDs - first_members, members) + \
+            np.arange(N_family_members)
+
+        sources, targets = get_clique_edges(N_students + N_teachers + \
+                                            first_members, members)
+        add_edges(sources, targets, 'family_family', 'close')
+        add_edges(N_students + N_teachers + np.arange(N_family_members),
+                  np.repeat(np.arange(N_students), members), 'student_family',
+                  'close')
+
+    ## contacts between students of neighbouring classes
+    if N_cross_class_contacts > 0:
+        class_neighbours = get_neighbour_classes(N_classes, floors, floors_inv,
+                                                 N_close_classes)
+        class_pairs = np.asarray([(c, n) for c in range(1, N_classes + 1) \
+                                  for n in class_neighbours[c]], dtype=int)
+        assert cross_class_sampling in ['students', 'pairs'], \
+            'unknown cross class contact sampling {}'.format(\
+            cross_class_sampling)
+        if cross_class_sampling == 'pairs':
+            # N_cross_class_contacts distinct pairs of students are drawn
+            # from all pairs of students of every pair of neighbouring classes
+            sources, targets = [], []
+            for c, n in class_pairs:
+                neighbour_students, class_students = sample_cross_pairs(
+                    class_size, class_size, N_cross_class_contacts, rng)
+                sources.append((n - 1) * class_size + neighbour_students)
+                targets.append((c - 1) * class_size + class_students)
+            sources = np.concatenate(sources)
+            targets = np.concatenate(targets)
+        else:
+            # N_cross_class_contacts distinct students are drawn from each of
+            # the two classes of every pair of neighbouring classes
+            def draw_students(classes):
+                order = rng.random((len(classes), class_size)).argsort(axis=1)
+                return ((classes[:, None] - 1) * class_size + \
+                        order[:, 0:N_cross_class_contacts]).ravel()
+            sources = draw_students(class_pairs[:, 1])
+            targets = draw_students(class_pairs[:, 0])
+        add_edges(sources, targets, 'student_student', 'far')
+
+    ## nodes
+    N_nodes = N_students + N_teachers + N_family_members
+    network = {
+        'ID':np.concatenate([
+            ['s{}'.format(i) for i in range(1, N_students + 1)],
+            ['t{}'.format(i) for i in range(1, N_teachers + 1)],
+            ['f{}'.format(i) for i in family_IDs]]).astype(object),
+        'type':np.repeat(np.asarray(['student', 'teacher', 'family_member'],
+            dtype=object), [N_students, N_teachers, N_family_members]),
+        'unit':np.concatenate([
+            ['class_{}'.format(c) for c in student_class],
+            ['faculty_room'] * N_teachers,
+            ['family'] * N_family_members]).astype(object),
+        'floor':np.concatenate([[floors_inv[c] for c in student_class],
+            np.full(N_nodes - N_students, np.nan)]),
+        'age':np.concatenate([[age_bracket_map[c] for c in student_class],
+            np.full(N_teachers, np.nan), family_ages])}
+
+    ## edges
+    # an edge that is created more than once (for example a contact between
+    # two students of neighbouring classes that are drawn for both classes)
+    # keeps the attributes of its first occurrence, as edges are not
+    # overwritten in compose_school_graph()
+    for key in edges.keys():
+        edges[key] = np.concatenate(edges[key])
+    u = np.minimum(edges['source'], edges['target'])
+    v = np.maximum(edges['source'], edges['target'])
+    first = np.sort(np.unique(u * N_nodes + v, return_index=True)[1])
+    for key in edges.keys():
+        network[key] = edges[key][first]
+
+    return network, schedule
+
+
+def network_to_graph(network):
+    '''
+    Converts a network created by compose_school_edges() into a networkx
+    graph with the same node and edge attributes as the graphs created by
+    compose_school_graph().
+    '''
+    G = nx.Graph()
+    nodes = []
+    for i, ID in enumerate(network['ID']):
+        attributes = {'type':network['type'][i], 'unit':network['unit'][i]}
+        if network['type'][i] == 'student':
+            attributes['floor'] = int(network['floor'][i])
+            attributes['age'] = int(network['age'][i])
+        nodes.append((ID, attributes))
+    G.add_nodes_from(nodes)
+    IDs = network['ID']
+    G.add_edges_from(zip(IDs[network['source']], IDs[network['target']],
+        [{'link_type':l, 'contact_type':c} for l, c in \
+         zip(network['link_type'], network['contact_type'])]))
+    # family members are always the source of the edges to their student
+    family = network['link_type'] == 'student_family'
+    G.graph['family_students'] = dict(zip(IDs[network['source'][family]],
+                                          IDs[network['target'][family]]))
+    return G
+
+
+def network_to_csr(network):
+    '''
+    Converts a network created by compose_school_edges() into a compressed
+    sparse row (CSR) adjacency structure: a dictionary with the node IDs and
+    node attributes of the network, the arrays 'indptr' and 'indices' (the
+    neighbours of node i are indices[indptr[i]:indptr[i + 1]]) and the
+    attributes of every entry of the adjacency structure as integer codes
+    ('link_type' and 'contact_type') together with their categories
+    ('link_types' and 'contact_types'). Every edge appears twice, once for
+    each direction.
+    '''
+    N_nodes = len(network['ID'])
+    sources = np.concatenate([network['source'], network['target']])
+    targets = np.concatenate([network['target'], network['source']])
+    order = np.lexsort((targets, sources))
+
+    csr = {key:network[key] for key in ['ID', 'type', 'unit', 'floor', 'age']}
+    csr['indptr'] = np.concatenate([[0], np.cumsum(np.bincount(sources,
+        minlength=N_nodes))])
+    csr['indices'] = targets[order]
+    for key, categories_key in [('link_type', 'link_types'),
+                                ('contact_type', 'contact_types')]:
+        codes, categories = pd.factorize(np.concatenate([network[key],
+                                                         network[key]]))
+        csr[key] = codes[order]
+        csr[categories_key] = list(categories)
+    return csr
+
+
+def compose_school_network(school_type, N_classes, class_size, N_floors,
+        age_bracket, family_sizes, N_hours, N_cross_class_contacts,
+        N_teacher_contacts_far, N_teacher_contacts_intermediate, time_period,
+        seed=None, output='networkx', cross_class_sampling='students',
+        households=None):
+    '''
+    Composes a school network with compose_school_edges() and returns it
+    either as a networkx graph (output = 'networkx', same format as
+    compose_school_graph()) or in the CSR form of network_to_csr()
+    (output = 'csr'), together with the schedule.
+    '''
+    network, schedule = compose_school_edges(school_type, N_classes,
+        class_size, N_floors, age_bracket, family_sizes, N_hours,
+        N_cross_class_contacts, N_teacher_contacts_far,
+        N_teacher_contacts_intermediate, time_period, seed,
+        cross_class_sampling, households)
+    if output == 'networkx':
+        return network_to_graph(network), schedule
+    elif output == 'csr':
+        return network_to_csr(network), schedule
+    else:
+        raise ValueError('unknown output format {}'.format(output))
+
+
+# first hour of the day that is covered by each teaching unit of the
+# schedules. Every unit lasts two hours, the lunch break is in hour 5
+UNIT_HOURS = {'hour_1':1, 'hour_2':3, 'hour_3':6, 'hour_4':8}
+
+def get_schedule(schedule):
+    '''
+    Converts the schedule of the teachers (teachers x teaching units, with the
+    class taught in every unit, as returned by the generate_schedule_*
+    functions) into the format that is stored with the networks and used to
+    reconstruct transmission chains (see
+    analysis_functions.get_transmission_chain()): a data frame with the
+    teachers as index (named 'teacher'), one column per class ('class_i') and
+    the hour in which the teacher is in the class as value. If a teacher
+    teaches a class in more than one unit, the first unit is used. For school
+    types with daycare, the tuple of teacher and student schedules can be
+    passed, afternoon supervision is not part of the converted schedule. The
+    teacher schedule can also be passed as a schedule matrix (see
+    get_schedule_matrices()).
+    '''
+    if isinstance(schedule, tuple):
+        schedule = schedule[0]
+    if isinstance(schedule, np.ndarray):
+        units = TEACHING_UNITS
+        classes = schedule[:, 0:len(units)]
+        index = pd.Index(['t{}'.format(i) for i in \
+                          range(1, len(schedule) + 1)], name='teacher')
+    else:
+        units = [u for u in schedule.columns if u in UNIT_HOURS]
+        classes = get_schedule_matrix(schedule, units)
+        index = schedule.index.rename('teacher')
+    N_classes = classes.max() if classes.size > 0 else 0
+
+    hours = np.full((len(schedule), N_classes), np.nan)
+    # later units are written first, such that the first unit in which a
+    # teacher teaches a class overwrites all later ones
+    for j in reversed(range(len(units))):
+        teachers = np.nonzero(classes[:, j])[0]
+        hours[teachers, classes[teachers, j] - 1] = UNIT_HOURS[units[j]]
+
+    return pd.DataFrame(hours, index=index,
+        columns=['class_{}'.format(c) for c in range(1, N_classes + 1)])
+
+
+def network_to_node_list(network):
+    '''
+    Returns the node list (ID, location and type of every node, see
+    get_node_list()) of a network created by compose_school_edges(). Family
+    members are located at the home of the student they belong to.
+    '''
+    location = np.asarray(network['unit'], dtype=object).copy()
+    family = network['link_type'] == 'student_family'
+    # family members are always the source of the edges to their student
+    location[network['source'][family]] = ['home_{}'.format(s) for s in \
+        network['ID'][network['target'][family]]]
+    return pd.DataFrame({'ID':network['ID'], 'type':network['type'],
+                         'location':location})
@@ -216,7 +216,7 @@ class SEIRX_school(SEIRX):
                               'mask':False}},
         age_transmission_risk_discount = {'slope':-0.05, 'intercept':1},
         age_symptom_discount = {'slope':-0.02545, 'intercept':0.854545},
-        seed=None):
+        seed=None, crn=False):
 
 
         super().__init__(G, verbosity, testing,
@@ -227,7 +227,7 @@ class SEIRX_school(SEIRX):
             preventive_screening_test_type,
             follow_up_testing_interval, liberating_testing,
             index_case, agent_types, age_transmission_risk_discount,
-            age_symptom_discount, seed)
+            age_symptom_discount, seed, crn)
 
         
         
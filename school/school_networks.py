@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import pickle
+import shutil
+import argparse
+from collections import OrderedDict
+from os.path import join, exists, dirname, abspath
+
+import pandas as pd
+
+# make the repository modules importable if the provider is used from an
+# arbitrary working directory
+SCHOOL_PATH = dirname(abspath(__file__))
+for path in [SCHOOL_PATH, dirname(SCHOOL_PATH)]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import build_school_library as bsl
+from result_cache import hash_parameters, to_builtin
+
+# default location of the on-disk store of school networks
+STORE_PATH = join(dirname(SCHOOL_PATH), 'data', 'school', 'network_store')
+
+
+class SchoolNetworkProvider():
+    '''
+    Provides the contact network, schedule and node list of schools, given
+    the parameters of the school and the seed of the network. Schools are
+    looked up in an in-process LRU cache of the max_cached most recently used
+    schools, then in an on-disk content-addressed store and are only
+    generated (see build_school_library.generate_school()) if they are in
+    neither.
+
+    Schools are keyed by the hash of the full parameter set: the parameters
+    passed to get(), completed with the defaults of the school library
+    (build_school_library.NETWORK_PARAMS and FAMILY_SIZES), the seed and the
+    version of the generator (the hash of the generator source files, see
+    build_school_library.get_generator_version()). A changed parameter or
+    generator therefore always leads to a new network instead of a stale
+    one.
+
+    Directory layout of the store:
+        <key[0:2]>/<key>/network.gpickle    contact network
+        <key[0:2]>/<key>/schedule.csv       schedule
+        <key[0:2]>/<key>/node_list.csv      node list
+        <key[0:2]>/<key>/entry.json         parameters and file hashes
+
+    path: string, directory of the store. If None, schools are only kept in
+    memory.
+    max_cached: integer, number of schools that are kept in memory.
+
+    NOTE: all callers get the same graph object for a cached school, as they
+    would if they loaded the network from a file once.
+    '''
+
+    def __init__(self, path=STORE_PATH, max_cached=16):
+        self.path = path
+        self.max_cached = max_cached
+        self.cache = OrderedDict()
+        self.generator_version = bsl.get_generator_version()
+        # number of schools taken from memory, from disk and generated
+        self.hits = {'memory':0, 'disk':0, 'generated':0}
+
+    def get_params(self, params, seed):
+        '''
+        Returns the full parameter set of a school, see get().
+        '''
+        full_params = dict(bsl.NETWORK_PARAMS, family_sizes=bsl.FAMILY_SIZES)
+        full_params.update(params)
+        full_params['seed'] = seed
+        full_params['generator_version'] = self.generator_version
+        for param in ['school_type', 'N_classes', 'class_size', 'N_floors']:
+            assert param in full_params, 'missing school parameter {}'\
+                .format(param)
+        return full_params
+
+    def get_key(self, params, seed):
+        return hash_parameters(self.get_params(params, seed))
+
+    def get_entry_path(self, key):
+        return join(self.path, key[0:2], key)
+
+    def get(self, params, seed):
+        '''
+        Returns the contact network, schedule and node list of the school
+        with the given parameters and seed.
+
+        params: dictionary with the school characteristics school_type,
+        N_classes, class_size and N_floors and optionally any other parameter
+        of build_school_library.generate_school() (for example
+        N_teacher_contacts_far, time_period, N_cross_class_contacts,
+        family_sizes, age_bracket or households).
+
+        seed: integer, seed of the network.
+
+        Raises an AssertionError if the school cannot be built.
+        '''
+        full_params = self.get_params(params, seed)
+        key = hash_parameters(full_params)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.hits['memory'] += 1
+            return self.cache[key]
+
+        school = None
+        if self.path != None:
+            school = self.load(key)
+        if type(school) != type(None):
+            self.hits['disk'] += 1
+        else:
+            school = bsl.generate_school(full_params)
+            self.hits['generated'] += 1
+            if self.path != None:
+                self.save(key, full_params, school)
+
+        self.cache[key] = school
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+        return school
+
+    def load(self, key):
+        '''
+        Reads a school from the store. Returns None if the school is not in
+        the store or if its files do not match the recorded hashes.
+        '''
+        entry_path = self.get_entry_path(key)
+        try:
+            with open(join(entry_path, 'entry.json'), 'r') as entry_file:
+                entry = json.load(entry_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        for f, sha256 in entry['files'].items():
+            file_path = join(entry_path, f)
+            if not exists(file_path) or bsl.hash_file(file_path) != sha256:
+                return None
+
+        with open(join(entry_path, 'network.gpickle'), 'rb') as f:
+            G = pickle.load(f)
+        schedule = pd.read_csv(join(entry_path, 'schedule.csv'),
+                               index_col='teacher')
+        node_list = pd.read_csv(join(entry_path, 'node_list.csv'))
+        return G, schedule, node_list
+
+    def save(self, key, params, school):
+        '''
+        Writes a school to the store. If several processes store the same
+        school concurrently, the first complete entry is kept.
+        '''
+        G, schedule, node_list = school
+        entry_path = self.get_entry_path(key)
+        # the school is written to a temporary directory that is moved in
+        # place once it is complete, such that an interrupted write never
+        # leaves an incomplete school behind
+        tmp_path = '{}.tmp{}'.format(entry_path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        with open(join(tmp_path, 'network.gpickle'), 'wb') as f:
+            pickle.dump(G, f, pickle.HIGHEST_PROTOCOL)
+        schedule.to_csv(join(tmp_path, 'schedule.csv'))
+        node_list.to_csv(join(tmp_path, 'node_list.csv'), index=False)
+        entry = {'params':params,
+                 'files':{f:bsl.hash_file(join(tmp_path, f)) for f in \
+                    ['network.gpickle', 'schedule.csv', 'node_list.csv']},
+                 'N_nodes':G.number_of_nodes(),
+                 'N_edges':G.number_of_edges()}
+        with open(join(tmp_path, 'entry.json'), 'w') as entry_file:
+            json.dump(entry, entry_file, indent=1, sort_keys=True,
+                      default=to_builtin)
+        # an entry that does not match its hashes is replaced
+        if exists(entry_path) and type(self.load(key)) == type(None):
+            shutil.rmtree(entry_path, ignore_errors=True)
+        try:
+            os.replace(tmp_path, entry_path)
+        except OSError:
+            # another process stored the same school first (os.replace()
+            # fails if the target is a non-empty directory). Its entry is
+            # used, unless it is not valid
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if type(self.load(key)) == type(None):
+                raise
+
+    def clear(self):
+        '''
+        Empties the in-process cache. The on-disk store is not changed.
+        '''
+        self.cache.clear()
+
+
+# provider that is used by get_school_network(), created with the first call
+_provider = None
+
+def get_provider():
+    global _provider
+    if _provider == None:
+        _provider = SchoolNetworkProvider()
+    return _provider
+
+
+def get_school_network(params, seed, provider=None):
+    '''
+    Returns the contact network, schedule and node list of the school with
+    the given parameters and seed (see SchoolNetworkProvider.get()) from the
+    given provider or, by default, from a provider with the store at
+    STORE_PATH that is shared by all calls in the process.
+    '''
+    if provider == None:
+        provider = get_provider()
+    return provider.get(params, seed)
+
+
+if __name__ == '__main__':
+    # command line interface to fill the store with a school, e.g.
+    # python school_networks.py primary 8 20 2 --seed 1
+    parser = argparse.ArgumentParser(description='get a school network '+\
+        'from the store of school networks, generate it if necessary')
+    parser.add_argument('school_type')
+    parser.add_argument('N_classes', type=int)
+    parser.add_argument('class_size', type=int)
+    parser.add_argument('N_floors', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--path', default=STORE_PATH,
+                        help='directory of the store')
+    args = parser.parse_args()
+
+    provider = SchoolNetworkProvider(args.path)
+    params = {'school_type':args.school_type, 'N_classes':args.N_classes,
+              'class_size':args.class_size, 'N_floors':args.N_floors}
+    G, schedule, node_list = provider.get(params, args.seed)
+    print('{}: {} nodes, {} edges ({})'.format(provider.get_key(params,
+        args.seed)[0:16], G.number_of_nodes(), G.number_of_edges(),
+        'generated' if provider.hits['generated'] > 0 else 'from store'))
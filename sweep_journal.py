@@ -0,0 +1,131 @@
+import os
+import json
+
+from result_cache import to_builtin
+
+
+class SweepJournal():
+    '''
+    Durable on-disk journal of completed units of work of a parameter sweep.
+    A unit is a block of runs of a scenario with consecutive seeds. Every
+    completed unit is appended as a single JSON line to the journal file,
+    which is flushed and synced to disk before the unit counts as completed.
+    If a sweep is interrupted, a new sweep that uses the same journal file
+    skips all completed units and only runs the missing seeds.
+
+    path: string, path of the journal file. Will be created if it does not
+    exist.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        # completed units by scenario key. Only the position of every unit in
+        # the journal file is kept in memory, rows are read from disk when
+        # they are needed: {scenario:{(first_seed, last_seed):offset}}
+        self.units = {}
+        self.load()
+
+    def load(self):
+        self.units = {}
+        try:
+            with open(self.path, 'rb') as journal_file:
+                content = journal_file.read()
+        except FileNotFoundError:
+            return
+
+        # the last line might be incomplete, if the process was killed while
+        # writing it. The incomplete line is removed from the journal (the
+        # corresponding unit will be run again), such that the next commit
+        # starts on a new line
+        complete = content[:content.rfind(b'\n') + 1]
+        if len(complete) < len(content):
+            with open(self.path, 'r+b') as journal_file:
+                journal_file.truncate(len(complete))
+
+        offset = 0
+        for line in complete.splitlines(keepends=True):
+            try:
+                unit = json.loads(line)
+            except json.JSONDecodeError:
+                offset += len(line)
+                continue
+            self._add(unit['scenario'], unit['seeds'][0], unit['seeds'][1],
+                      offset)
+            offset += len(line)
+
+    def _add(self, scenario, first_seed, last_seed, offset):
+        if scenario not in self.units:
+            self.units[scenario] = {}
+        self.units[scenario][(first_seed, last_seed)] = offset
+
+    def commit(self, scenario, first_seed, last_seed, rows):
+        '''
+        Appends the observable rows of the runs with seeds in the range
+        [first_seed, last_seed) of a scenario to the journal.
+        '''
+        unit = {'scenario':scenario,
+                'seeds':[first_seed, last_seed],
+                'rows':rows}
+        line = json.dumps(unit, default=to_builtin) + '\n'
+        with open(self.path, 'ab') as journal_file:
+            offset = journal_file.seek(0, os.SEEK_END)
+            journal_file.write(line.encode('utf-8'))
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        self._add(scenario, first_seed, last_seed, offset)
+
+    def get_completed_seeds(self, scenario):
+        seeds = set()
+        for first_seed, last_seed in self.units.get(scenario, {}).keys():
+            seeds.update(range(first_seed, last_seed))
+        return seeds
+
+    def read_unit(self, scenario, first_seed, last_seed):
+        '''
+        Returns the list of observable rows of a completed unit.
+        '''
+        with open(self.path, 'rb') as journal_file:
+            journal_file.seek(self.units[scenario][(first_seed, last_seed)])
+            return json.loads(journal_file.readline())['rows']
+
+    def iter_rows(self, scenario, first_seed, last_seed):
+        '''
+        Iterates over the observable rows of all completed runs of a scenario
+        with seeds in the range [first_seed, last_seed), ordered by seed. Only
+        the rows of a single unit are held in memory at a time.
+        '''
+        # if a unit has been run more than once (for example by different
+        # workers), only the first recorded unit is used for every seed
+        seeds = set()
+        for first, last in sorted(self.units.get(scenario, {}).keys()):
+            if last <= first_seed or first >= last_seed:
+                continue
+            rows = self.read_unit(scenario, first, last)
+            for seed, row in zip(range(first, last), rows):
+                if first_seed <= seed < last_seed and seed not in seeds:
+                    seeds.add(seed)
+                    yield row
+
+    def get_rows(self, scenario, first_seed, last_seed):
+        '''
+        Returns the observable rows of all completed runs of a scenario with
+        seeds in the range [first_seed, last_seed), ordered by seed.
+        '''
+        return list(self.iter_rows(scenario, first_seed, last_seed))
+
+
+def get_blocks(seeds, block_size=None):
+    '''
+    Splits a sorted list of seeds into blocks of consecutive seeds with at most
+    block_size seeds each. Returns a list of (first_seed, last_seed) tuples,
+    where last_seed is not included in the block. If block_size = None, blocks
+    are only split where the list of seeds has gaps.
+    '''
+    blocks = []
+    for seed in seeds:
+        if len(blocks) > 0 and blocks[-1][1] == seed and (block_size == None \
+           or blocks[-1][1] - blocks[-1][0] < block_size):
+            blocks[-1][1] = seed + 1
+        else:
+            blocks.append([seed, seed + 1])
+    return [tuple(b) for b in blocks]
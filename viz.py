@@ -3,6 +3,8 @@ from matplotlib.ticker import MultipleLocator
 import networkx as nx
 import numpy as np
 
+from contact_graph import get_weighted_graph
+
 colors = {'susceptible':'g',
 		  'exposed':'orange', 
 		  'infectious':'red',
@@ -30,6 +32,9 @@ def get_pos(G, model):
 	
 	fixed_pos = {f:c for f, c in zip(fixed, coords)}
 
+	# the model does not write edge weights into the graph, the layout uses a
+	# copy of the graph with the weights of the contact types
+	G = get_weighted_graph(G, model.infection_risk_contact_type_weights)
 	pos = nx.drawing.layout.spring_layout(G, k=1.5, dim=2, weight='weight',
 		fixed=fixed, pos=fixed_pos, scale=1, iterations=100)
 
@@ -68,7 +73,7 @@ def draw_states(model, step, pos, pat_ax, emp_ax, leg_ax):
        if (G.nodes[x]['type'] == 'resident' and G.nodes[y]['type'] == 'resident')]
 	
 	for u, v in resident_edges:
-		weight = G[u][v]['weight']**2 / 5
+		weight = model.compiled_graph.get_weight(u, v)**2 / 5
 		try:
 			pat_ax.plot([pos[u][0], pos[v][0]], [pos[u][1], pos[v][1]], \
 			color='k', linewidth=weight, zorder=1)
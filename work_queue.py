@@ -0,0 +1,360 @@
+import os
+import sys
+import json
+import time
+import pickle
+import socket
+import argparse
+import warnings
+import threading
+from os.path import join, exists, getmtime, dirname, abspath
+
+# make the scenario-specific models importable for workers that are started
+# from the command line in an arbitrary working directory
+REPOSITORY_PATH = dirname(abspath(__file__))
+for path in [REPOSITORY_PATH, join(REPOSITORY_PATH, 'school'),
+             join(REPOSITORY_PATH, 'nursing_home')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from ensemble_runner import run_replicates, get_sweep_statistics, CostModel,\
+    DEFAULT_BLOCK_SIZE
+from sweep_journal import SweepJournal, get_blocks
+from ensemble_statistics import EnsembleStatistics
+
+# maximum number of seconds between two refreshes of the lock of a running
+# unit (see run_worker())
+HEARTBEAT_INTERVAL = 60
+
+
+class WorkQueue():
+    '''
+    File-system backed queue of the units of work (blocks of runs of a
+    scenario) of a parameter sweep. The queue lives in a directory on a file
+    system that is shared between all machines that take part in the sweep,
+    no additional services are needed. Any number of worker processes on any
+    number of machines can drain the queue (see run_worker()).
+
+    Units are claimed by atomically creating a lock file for the unit
+    (O_CREAT | O_EXCL), which is safe on network file systems. Every claim of
+    a unit is a new generation of its lock (<unit>.<generation>.lock), the
+    lock with the highest generation holds the unit. The modification time
+    of the lock is refreshed while the unit runs. Abandoned claims are taken
+    over by atomically creating the lock of the next generation, such that
+    only one of several workers that find the same claim abandoned can take
+    it over (see take_over()). Every worker commits the results of its
+    completed units to its own journal shard (see SweepJournal) and marks
+    the unit as done. Shards are merged at the end of the sweep (see
+    merge()).
+
+    Directory layout:
+        queue.json      parameters of the sweep and the list of units
+        scenarios.p     pickled list of scenarios
+        claims/         lock files of the claimed units, one per generation
+        done/           one marker file per completed unit
+        shards/         one journal file per worker
+
+    path: string, directory of the queue, has to be created with
+    WorkQueue.create() first.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(join(self.path, 'queue.json'), 'r') as queue_file:
+            queue = json.load(queue_file)
+        self.runs = queue['runs']
+        self.first_seed = queue['first_seed']
+        self.units = [tuple(u) for u in queue['units']]
+        self._scenarios = None
+        # generations of the claims made through this queue object
+        # {unit:generation}
+        self.claims = {}
+
+    @classmethod
+    def create(cls, path, scenarios, runs, first_seed=0,
+        block_size=DEFAULT_BLOCK_SIZE, cost_model=None):
+        '''
+        Creates a new queue in the directory path for an ensemble of runs
+        with the seeds first_seed to first_seed + runs - 1 for every scenario.
+        Runs are split into blocks of block_size runs. Units are ordered by
+        their predicted cost (see CostModel), such that expensive units are
+        claimed first.
+        '''
+        if cost_model == None:
+            cost_model = CostModel()
+
+        for d in ['claims', 'done', 'shards']:
+            os.makedirs(join(path, d), exist_ok=True)
+
+        # scenario keys are calculated before pickling, such that workers do
+        # not need to hash the contact networks again
+        for scenario in scenarios:
+            scenario.get_key()
+        with open(join(path, 'scenarios.p'), 'wb') as scenario_file:
+            pickle.dump(scenarios, scenario_file)
+
+        units = [(i, first, last) for i in range(len(scenarios)) for \
+            first, last in get_blocks(range(first_seed, first_seed + runs),
+                                      block_size)]
+        units.sort(key=lambda u: cost_model.predict(scenarios[u[0]],
+                   u[2] - u[1]), reverse=True)
+
+        # queue.json is written last: a queue is only valid if it exists
+        tmp_path = join(path, 'queue.json.tmp')
+        with open(tmp_path, 'w') as queue_file:
+            json.dump({'runs':runs, 'first_seed':first_seed,
+                       'units':units}, queue_file)
+        os.replace(tmp_path, join(path, 'queue.json'))
+
+        return cls(path)
+
+    def get_scenarios(self):
+        if self._scenarios == None:
+            with open(join(self.path, 'scenarios.p'), 'rb') as scenario_file:
+                self._scenarios = pickle.load(scenario_file)
+        return self._scenarios
+
+    def get_unit_name(self, unit):
+        return '{}_{}_{}'.format(*unit)
+
+    def is_done(self, unit):
+        return exists(join(self.path, 'done', self.get_unit_name(unit)))
+
+    def get_lock_path(self, unit, generation):
+        return join(self.path, 'claims', '{}.{}.lock'.format(
+            self.get_unit_name(unit), generation))
+
+    def get_generations(self):
+        '''
+        Returns the highest generation of the lock of every claimed unit
+        {unit name:generation}.
+        '''
+        generations = {}
+        for lock in os.listdir(join(self.path, 'claims')):
+            if not lock.endswith('.lock'):
+                continue
+            name, generation = lock[:-len('.lock')].rsplit('.', 1)
+            generations[name] = max(int(generation), generations.get(name, 0))
+        return generations
+
+    def create_lock(self, unit, generation, worker_id):
+        '''
+        Atomically creates the lock of the given generation of a unit.
+        Returns whether the lock was created, i.e. whether no other worker
+        created it first.
+        '''
+        try:
+            fd = os.open(self.get_lock_path(unit, generation),
+                         os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as lock_file:
+            lock_file.write(worker_id)
+        return True
+
+    def claim(self, worker_id, claim_timeout=None):
+        '''
+        Claims the next unit that is neither done nor claimed by another
+        worker. If claim_timeout (in seconds) is given, units whose lock has
+        not been refreshed (see touch()) for longer than claim_timeout are
+        considered abandoned (for example because the worker crashed) and can
+        be claimed again. Returns the claimed unit or None, if there are no
+        units left.
+        '''
+        done = set(os.listdir(join(self.path, 'done')))
+        generations = self.get_generations()
+        for unit in self.units:
+            name = self.get_unit_name(unit)
+            if name in done:
+                continue
+
+            if name not in generations and \
+               self.create_lock(unit, 0, worker_id):
+                self.claims[unit] = 0
+            elif claim_timeout == None:
+                continue
+            else:
+                # units that were claimed by another worker after the claims
+                # were listed hold the lock of generation 0
+                generation = generations.get(name, 0)
+                if not self.take_over(unit, generation, worker_id,
+                                      claim_timeout):
+                    continue
+                self.claims[unit] = generation + 1
+
+            # the unit might have been completed by another worker between
+            # listing the done units and claiming the unit
+            if self.is_done(unit):
+                continue
+            return unit
+
+        return None
+
+    def take_over(self, unit, generation, worker_id, claim_timeout):
+        '''
+        Takes over the claim of a unit whose lock of the given generation has
+        not been refreshed for longer than claim_timeout seconds, by
+        atomically creating the lock of the next generation. Of several
+        workers that take over the same claim at the same time only one
+        creates the lock. Returns whether the claim was taken over.
+        '''
+        try:
+            if time.time() - getmtime(self.get_lock_path(unit, generation)) \
+               <= claim_timeout:
+                return False
+        except FileNotFoundError:
+            return False
+        return self.create_lock(unit, generation + 1, worker_id)
+
+    def touch(self, unit):
+        '''
+        Refreshes the modification time of the lock of a unit claimed through
+        this queue object, such that the claim is not considered abandoned.
+        Returns False if the claim has been taken over by another worker.
+        '''
+        generation = self.claims.get(unit)
+        if generation == None or \
+           exists(self.get_lock_path(unit, generation + 1)):
+            return False
+        os.utime(self.get_lock_path(unit, generation))
+        return True
+
+    def keep_claim(self, unit, interval):
+        '''
+        Refreshes the lock of a claimed unit every interval seconds in a
+        background thread, until the returned event is set.
+        '''
+        stop = threading.Event()
+        def refresh():
+            while not stop.wait(interval):
+                if not self.touch(unit):
+                    break
+        threading.Thread(target=refresh, daemon=True).start()
+        return stop
+
+    def complete(self, unit):
+        with open(join(self.path, 'done', self.get_unit_name(unit)), 'w'):
+            pass
+
+    def status(self):
+        done = set(os.listdir(join(self.path, 'done')))
+        claims = set(self.get_generations().keys())
+        N_done = len([u for u in self.units if self.get_unit_name(u) in done])
+        N_claimed = len([u for u in self.units if self.get_unit_name(u) in \
+            claims and self.get_unit_name(u) not in done])
+        return {'units':len(self.units), 'done':N_done, 'claimed':N_claimed,
+                'pending':len(self.units) - N_done - N_claimed}
+
+    def merge(self, k=200, allow_partial=False):
+        '''
+        Merges the journal shards of all workers into a single journal
+        (journal.jsonl in the queue directory) and calculates the ensemble
+        statistics of all scenarios (see ensemble_runner.run_sweep()). Rows
+        are streamed from the journal into one EnsembleStatistics per
+        scenario, one unit at a time. Returns the data frame of ensemble
+        statistics.
+
+        Raises an AssertionError if not all units are done, unless
+        allow_partial = True, in which case the statistics of the completed
+        units are returned with a warning.
+        '''
+        status = self.status()
+        if status['done'] < status['units']:
+            message = '{} of {} units are not done'.format(status['units'] - \
+                status['done'], status['units'])
+            assert allow_partial, message
+            warnings.warn(message + ', the ensemble statistics are partial')
+
+        journal = SweepJournal(join(self.path, 'journal.jsonl'))
+        for shard in sorted(os.listdir(join(self.path, 'shards'))):
+            shard_journal = SweepJournal(join(self.path, 'shards', shard))
+            for scenario, units in shard_journal.units.items():
+                for first_seed, last_seed in units.keys():
+                    if (first_seed, last_seed) not in \
+                       journal.units.get(scenario, {}):
+                        journal.commit(scenario, first_seed, last_seed,
+                            shard_journal.read_unit(scenario, first_seed,
+                                                    last_seed))
+
+        scenarios = self.get_scenarios()
+        statistics = []
+        for scenario in scenarios:
+            scenario_statistics = EnsembleStatistics(k)
+            scenario_statistics.add_rows(journal.iter_rows(scenario.get_key(),
+                self.first_seed, self.first_seed + self.runs))
+            statistics.append(scenario_statistics)
+        return get_sweep_statistics(scenarios, statistics)
+
+
+def run_worker(path, worker_id=None, claim_timeout=None, verbose=False):
+    '''
+    Claims and runs units of the queue in the directory path until no units
+    are left. Results are committed to the journal shard of the worker.
+    Returns the number of units run by the worker.
+    '''
+    if worker_id == None:
+        worker_id = '{}-{}'.format(socket.gethostname(), os.getpid())
+    # the lock of a running unit is refreshed several times per claim
+    # timeout, such that long units are not taken over by other workers
+    interval = HEARTBEAT_INTERVAL
+    if claim_timeout != None:
+        interval = min(interval, claim_timeout / 4)
+
+    queue = WorkQueue(path)
+    scenarios = queue.get_scenarios()
+    journal = SweepJournal(join(path, 'shards', '{}.jsonl'.format(worker_id)))
+
+    N_units = 0
+    while True:
+        unit = queue.claim(worker_id, claim_timeout)
+        if unit == None:
+            break
+        i, first_seed, last_seed = unit
+        stop = queue.keep_claim(unit, interval)
+        try:
+            rows = run_replicates(scenarios[i], first_seed, last_seed)
+            journal.commit(scenarios[i].get_key(), first_seed, last_seed,
+                           rows)
+            queue.complete(unit)
+        finally:
+            stop.set()
+        N_units += 1
+        if verbose:
+            print('{}: finished unit {}'.format(worker_id, unit))
+
+    return N_units
+
+
+if __name__ == '__main__':
+    # command line interface to start workers on any machine that has access
+    # to the queue directory, e.g.
+    # python work_queue.py worker /shared/sweep_queue
+    # python work_queue.py merge /shared/sweep_queue results.csv
+    parser = argparse.ArgumentParser(description='work on a file-system '+\
+        'backed queue of simulation runs')
+    parser.add_argument('command', choices=['worker', 'status', 'merge'])
+    parser.add_argument('path', help='directory of the queue')
+    parser.add_argument('output', nargs='?', default=None,
+        help='CSV file for the merged ensemble statistics')
+    parser.add_argument('--worker-id', default=None)
+    parser.add_argument('--claim-timeout', type=float, default=None,
+        help='seconds after which claimed but unfinished units are '+\
+             'considered abandoned and can be claimed again')
+    parser.add_argument('--allow-partial', action='store_true',
+        help='merge the results even if not all units are done')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        N_units = run_worker(args.path, args.worker_id, args.claim_timeout,
+                             args.verbose)
+        print('finished {} units'.format(N_units))
+    elif args.command == 'status':
+        print(WorkQueue(args.path).status())
+    elif args.command == 'merge':
+        results = WorkQueue(args.path).merge(
+            allow_partial=args.allow_partial)
+        if args.output != None:
+            results.to_csv(args.output, index=False)
+        else:
+            print(results)